@@ -0,0 +1,514 @@
+# -*- coding: utf-8 -*-
+
+"""Build large molecules from separately embedded rigid fragments.
+
+The time to embed a molecule grows steeply with its size, so large peptides and
+dendrimers are slow to embed as a whole, and often fail. Instead the molecule is
+cut at its rotatable bonds into rigid fragments, each of which is embedded on its
+own, or taken from a cache since the same fragments recur in such molecules. The
+fragments are then joined again along the bonds, starting from the largest,
+choosing the torsion about each bond to keep clear of the atoms already placed.
+
+Bonds in rings are not cut, since closing a ring again would need more than a
+torsion, so every ring system is one fragment. The ring of a macrocycle is
+embedded whole, and only the side chains attached to it are assembled.
+"""
+
+import heapq
+import logging
+
+import numpy as np
+from rdkit import Chem
+
+from from_smiles_step import polymers
+from from_smiles_step import validate
+
+logger = logging.getLogger(__name__)
+
+# Atoms in different fragments closer than this fraction of the sum of their van
+# der Waals radii clash.
+contact_fraction = 0.7
+
+# The torsions tried about a bond, in degrees, if those staggered with respect to
+# the fragment already placed all clash.
+torsions = np.arange(0.0, 360.0, 30.0)
+
+# The number of times to look for clashes once the fragments are joined, and the
+# number of the smallest branches between the atoms to try turning to resolve each.
+passes = 3
+branches = 6
+
+_table = Chem.GetPeriodicTable()
+_vdw = np.array([_table.GetRvdw(z) for z in range(119)])
+
+# The chiral tags, and the opposite of each
+_inverted = {
+    Chem.ChiralType.CHI_TETRAHEDRAL_CW: Chem.ChiralType.CHI_TETRAHEDRAL_CCW,
+    Chem.ChiralType.CHI_TETRAHEDRAL_CCW: Chem.ChiralType.CHI_TETRAHEDRAL_CW,
+}
+
+# Double bond stereochemistry relative to the stereo atoms, which RDKit chooses
+# as the neighbors with the highest CIP ranks, so that E and Z are trans and cis.
+_relative = {
+    Chem.BondStereo.STEREOE: Chem.BondStereo.STEREOTRANS,
+    Chem.BondStereo.STEREOTRANS: Chem.BondStereo.STEREOTRANS,
+    Chem.BondStereo.STEREOZ: Chem.BondStereo.STEREOCIS,
+    Chem.BondStereo.STEREOCIS: Chem.BondStereo.STEREOCIS,
+}
+
+
+def rotatable_bonds(mol):
+    """The bonds about which the fragments of a molecule can turn.
+
+    These are the single bonds not in rings between atoms that are each bonded
+    to other heavy atoms, other than conjugated bonds, such as those of amides,
+    whose torsions are constrained, and bonds to atoms in triple bonds, which are
+    linear. The bonds are found from their atoms, since iterating over the bonds
+    of a molecule is quadratic in RDKit.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with or without hydrogens.
+
+    Returns
+    -------
+    [(int, int)]
+        The atoms of each bond, the first with the lower index.
+    """
+    heavy = []
+    linear = []
+    for atom in mol.GetAtoms():
+        heavy.append(sum(1 for a in atom.GetNeighbors() if a.GetAtomicNum() > 1))
+        linear.append(
+            any(b.GetBondType() == Chem.BondType.TRIPLE for b in atom.GetBonds())
+        )
+
+    result = []
+    for atom in mol.GetAtoms():
+        i = atom.GetIdx()
+        if heavy[i] < 2 or linear[i]:
+            continue
+        for bond in atom.GetBonds():
+            j = bond.GetOtherAtomIdx(i)
+            if (
+                j > i
+                and heavy[j] >= 2
+                and not linear[j]
+                and bond.GetBondType() == Chem.BondType.SINGLE
+                and not bond.IsInRing()
+                and not bond.GetIsConjugated()
+            ):
+                result.append((i, j))
+    return result
+
+
+def piece(mol, atoms, cuts):
+    """A fragment of a molecule, capped with the atoms it was bonded to.
+
+    The molecule is built atom by atom, since copying the whole molecule for
+    each fragment would be quadratic. The atoms across the cut bonds, the
+    anchors, are labeled with different isotopes so that the stereochemistry of
+    the atoms bonded to them is kept, and are capped with hydrogens.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The whole molecule, with hydrogens.
+    atoms : [int]
+        The atoms in the fragment.
+    cuts : [(int, int)]
+        The cut bonds, from an atom in the fragment to one outside.
+
+    Returns
+    -------
+    rdkit.Chem.Mol, dict(int, int), dict(int, int)
+        The fragment, with hydrogens, and the index in it of each atom and of
+        each anchor.
+    """
+    rw = Chem.RWMol()
+    index = {}
+    for i in atoms:
+        index[i] = rw.AddAtom(mol.GetAtomWithIdx(i))
+    anchors = {}
+    for label, (_, j) in enumerate(cuts, start=1):
+        anchor = Chem.Atom(mol.GetAtomWithIdx(j).GetAtomicNum())
+        anchor.SetIsotope(label)
+        anchors[j] = rw.AddAtom(anchor)
+    where = {**index, **anchors}
+
+    stereo = []
+    for i in atoms:
+        for bond in mol.GetAtomWithIdx(i).GetBonds():
+            j = bond.GetOtherAtomIdx(i)
+            if j not in index or j < i:
+                continue
+            n = rw.AddBond(index[i], index[j], bond.GetBondType())
+            rw.GetBondWithIdx(n - 1).SetIsAromatic(bond.GetIsAromatic())
+            if bond.GetStereo() in _relative:
+                stereo.append((n - 1, bond))
+    for i, j in cuts:
+        rw.AddBond(index[i], anchors[j], Chem.BondType.SINGLE)
+
+    # Chirality is relative to the order of the bonds of an atom, which may
+    # differ from that in the molecule.
+    for i in atoms:
+        atom = mol.GetAtomWithIdx(i)
+        if atom.GetChiralTag() not in _inverted:
+            continue
+        before = [where[b.GetOtherAtomIdx(i)] for b in atom.GetBonds()]
+        after = [
+            b.GetOtherAtomIdx(index[i]) for b in rw.GetAtomWithIdx(index[i]).GetBonds()
+        ]
+        order = [after.index(k) for k in before]
+        swaps = sum(
+            1
+            for a in range(len(order))
+            for b in range(a + 1, len(order))
+            if order[a] > order[b]
+        )
+        if swaps % 2 == 1:
+            rw.GetAtomWithIdx(index[i]).SetChiralTag(_inverted[atom.GetChiralTag()])
+    for k, bond in stereo:
+        first, second = bond.GetStereoAtoms()
+        new = rw.GetBondWithIdx(k)
+        new.SetStereoAtoms(where[first], where[second])
+        new.SetStereo(_relative[bond.GetStereo()])
+
+    result = rw.GetMol()
+    Chem.SanitizeMol(result)
+    result = Chem.AddHs(result)
+    # Set the directions of the bonds, which SMILES need for cis and trans
+    Chem.SetDoubleBondNeighborDirections(result)
+    Chem.AssignStereochemistry(result, cleanIt=True, force=True)
+    return result, index, anchors
+
+
+def rotations(axis, angles):
+    """The rotations about an axis by several angles.
+
+    Parameters
+    ----------
+    axis : numpy.ndarray
+        The unit vector along the axis.
+    angles : numpy.ndarray
+        The k angles, in degrees.
+
+    Returns
+    -------
+    numpy.ndarray
+        The k x 3 x 3 rotations, applied as x @ rotation.
+    """
+    theta = np.radians(angles)[:, np.newaxis, np.newaxis]
+    cross = np.array(
+        [
+            [0.0, axis[2], -axis[1]],
+            [-axis[2], 0.0, axis[0]],
+            [axis[1], -axis[0], 0.0],
+        ]
+    )
+    return (
+        np.cos(theta) * np.eye(3)
+        + np.sin(theta) * cross
+        + (1 - np.cos(theta)) * np.outer(axis, axis)
+    )
+
+
+def build(mol, embed):
+    """Coordinates for a molecule from the embedded structures of its fragments.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with hydrogens.
+    embed : callable
+        A function giving the n x 3 coordinates of a fragment, a small molecule
+        with hydrogens.
+
+    Returns
+    -------
+    numpy.ndarray or None
+        The n x 3 coordinates, or None if the molecule has no rotatable bonds.
+    """
+    bonds = rotatable_bonds(mol)
+    if len(bonds) == 0:
+        return None
+    cut = set(bonds) | {(j, i) for i, j in bonds}
+
+    # The fragments are the atoms still connected once the bonds are cut.
+    n = mol.GetNumAtoms()
+    neighbors = [[a.GetIdx() for a in atom.GetNeighbors()] for atom in mol.GetAtoms()]
+    part = np.full(n, -1, dtype=np.int64)
+    members = []
+    for start in range(n):
+        if part[start] >= 0:
+            continue
+        k = len(members)
+        part[start] = k
+        stack = [start]
+        atoms = []
+        while len(stack) > 0:
+            i = stack.pop()
+            atoms.append(i)
+            for j in neighbors[i]:
+                if part[j] < 0 and (i, j) not in cut:
+                    part[j] = k
+                    stack.append(j)
+        members.append(sorted(atoms))
+    joints = [[] for _ in members]
+    for i, j in bonds:
+        joints[part[i]].append((i, j))
+        joints[part[j]].append((j, i))
+
+    atno = np.array([a.GetAtomicNum() for a in mol.GetAtoms()])
+    xyz = np.full((n, 3), np.nan)
+    # The coordinates of each fragment placed, including its anchors and caps,
+    # and the bond joining it to the fragment it was placed from.
+    placed = {}
+    link = {}
+
+    def fragment(k):
+        result, index, anchors = piece(mol, members[k], joints[k])
+        return result, index, anchors, embed(result)
+
+    # Start with the largest fragment and join the others outwards from it, the
+    # largest branches first so that small side chains fit in around them.
+    root = max(range(len(members)), key=lambda k: len(members[k]))
+    up = {root: None}
+    tree = [root]
+    for k in tree:
+        for _, j in joints[k]:
+            if part[j] not in up:
+                up[part[j]] = k
+                tree.append(part[j])
+    size = {k: len(members[k]) for k in tree}
+    for k in reversed(tree[1:]):
+        size[up[k]] += size[k]
+    pending = []
+
+    def branch(k):
+        for i, j in joints[k]:
+            if part[j] != up[k]:
+                heapq.heappush(pending, (-size[part[j]], j, k, i))
+
+    frag, index, anchors, positions = fragment(root)
+    xyz[members[root]] = positions[[index[i] for i in members[root]]]
+    # The atoms where the next fragments join are where the anchors are.
+    xyz[list(anchors)] = positions[list(anchors.values())]
+    placed[root] = (frag, index, anchors, positions)
+    branch(root)
+    while len(pending) > 0:
+        _, j, k, i = heapq.heappop(pending)
+        m = part[j]
+        parent, parent_index, parent_anchors, parent_xyz = placed[k]
+        frag, index, anchors, positions = fragment(m)
+
+        # Put the bond along that in the parent, with a cap of the anchor in
+        # the child in the plane of a neighbor of the atom in the parent.
+        p = parent_index[i]
+        q = parent_anchors[j]
+        reference = next(
+            a.GetIdx()
+            for a in parent.GetAtomWithIdx(p).GetNeighbors()
+            if a.GetIdx() != q
+        )
+        c = index[j]
+        s = anchors[i]
+        caps = [
+            atom.GetIdx()
+            for atom in frag.GetAtomWithIdx(s).GetNeighbors()
+            if atom.GetIdx() != c
+        ]
+        rotation, shift = polymers.transform(
+            positions[[c, s, caps[0]]], parent_xyz[[q, p, reference]]
+        )
+        aligned = positions @ rotation + shift
+
+        # The torsions staggered like the caps first, then all around.
+        origin = parent_xyz[q]
+        axis = parent_xyz[p] - origin
+        axis /= np.linalg.norm(axis)
+        angles = np.concatenate((np.arange(len(caps)) * 360.0 / len(caps), torsions))
+        trials = np.einsum("ax,kxy->kay", aligned - origin, rotations(axis, angles))
+        trials += origin
+
+        # Check the atoms beyond the joining atom, and the anchors where the
+        # next fragments join, against the atoms nearby.
+        atoms = [t for t in members[m] if t != j] + [t for t in anchors if t != i]
+        moved = [index[t] if t in index else anchors[t] for t in atoms]
+        reach = np.linalg.norm(aligned[moved] - origin, axis=1).max(initial=0.0)
+        near = np.flatnonzero(~np.isnan(xyz[:, 0]))
+        near = near[(near != i) & (near != j)]
+        distances = np.linalg.norm(xyz[near] - origin, axis=1)
+        near = near[distances < reach + 2 * contact_fraction * _vdw.max()]
+        if len(near) == 0 or len(moved) == 0:
+            best = 0
+        else:
+            limits = contact_fraction * (
+                _vdw[atno[atoms]][:, np.newaxis] + _vdw[atno[near]][np.newaxis, :]
+            )
+            delta = trials[:, moved, np.newaxis, :] - xyz[near][np.newaxis, :]
+            room = (np.linalg.norm(delta, axis=3) / limits).min(axis=(1, 2))
+            staggered = room[: len(caps)]
+            if staggered.max() >= 1:
+                best = int(np.argmax(staggered))
+            else:
+                best = int(np.argmax(room))
+                if room[best] < 1:
+                    logger.debug(f"The fragment joined at atom {j} clashes.")
+
+        positions = trials[best]
+        xyz[members[m]] = positions[[index[t] for t in members[m]]]
+        ahead = [t for t in anchors if t != i]
+        xyz[ahead] = positions[[anchors[t] for t in ahead]]
+        placed[m] = (frag, index, anchors, positions)
+        link[m] = (i, j)
+        branch(m)
+
+    if np.isnan(xyz).any():
+        return None
+
+    # Resolve any clashes left by turning a branch between the atoms about the
+    # bond joining it to the rest of the molecule, trying the smallest first.
+    children = {k: [] for k in tree}
+    for k in tree[1:]:
+        children[up[k]].append(k)
+
+    def ancestors(k):
+        result = []
+        while k is not None:
+            result.append(k)
+            k = up[k]
+        return result
+
+    # Each pair of fragments is only tried once, since if none of the branches
+    # can be turned to clear it, trying again would not help.
+    tried = set()
+    for _ in range(passes):
+        bad = clashes(xyz, atno, neighbors, part)
+        if len(bad) == 0:
+            break
+        for a, b in bad:
+            if (part[a], part[b]) in tried:
+                continue
+            tried.add((part[a], part[b]))
+            limit = contact_fraction * (_vdw[atno[a]] + _vdw[atno[b]])
+            if np.linalg.norm(xyz[a] - xyz[b]) >= limit:
+                continue
+            first = ancestors(part[a])
+            second = ancestors(part[b])
+            common = set(first) & set(second)
+            path = [k for k in first + second if k not in common]
+            best = None
+            for m in sorted(path, key=lambda k: size[k])[:branches]:
+                i, j = link[m]
+                stack = [m]
+                atoms = []
+                while len(stack) > 0:
+                    k = stack.pop()
+                    atoms.extend(members[k])
+                    stack.extend(children[k])
+                atoms = np.array(atoms)
+                moved = atoms[atoms != j]
+                outside = np.ones(n, dtype=bool)
+                outside[atoms] = False
+                outside[i] = False
+                origin = xyz[j]
+                axis = xyz[i] - origin
+                axis /= np.linalg.norm(axis)
+                reach = np.linalg.norm(xyz[moved] - origin, axis=1).max()
+                rest = np.flatnonzero(outside)
+                distances = np.linalg.norm(xyz[rest] - origin, axis=1)
+                rest = rest[distances < reach + 2 * contact_fraction * _vdw.max()]
+                trials = np.einsum(
+                    "ax,kxy->kay", xyz[moved] - origin, rotations(axis, torsions)
+                )
+                trials += origin
+                rooms = clearance(
+                    trials, xyz[rest], atno[moved], atno[rest], origin, axis
+                )
+                k = int(np.argmax(rooms))
+                if best is None or rooms[k] > best[0]:
+                    best = (rooms[k], moved, trials[k])
+                if rooms[k] >= 1:
+                    break
+            if best is not None:
+                xyz[best[1]] = best[2]
+
+    return xyz
+
+
+def clashes(xyz, atno, neighbors, part):
+    """The pairs of atoms in different fragments that are too close.
+
+    Parameters
+    ----------
+    xyz : numpy.ndarray
+        The n x 3 coordinates.
+    atno : numpy.ndarray
+        The atomic numbers.
+    neighbors : [[int]]
+        The atoms bonded to each atom.
+    part : numpy.ndarray
+        The fragment each atom is in.
+
+    Returns
+    -------
+    [(int, int)]
+        The atoms clashing, other than those bonded or bonded to the same atom.
+    """
+    i, j = validate.close_pairs(xyz, 2 * contact_fraction * _vdw[atno].max())
+    apart = part[i] != part[j]
+    i = i[apart]
+    j = j[apart]
+    limits = contact_fraction * (_vdw[atno[i]] + _vdw[atno[j]])
+    bad = np.linalg.norm(xyz[i] - xyz[j], axis=1) < limits
+    return [
+        (a, b)
+        for a, b in zip(i[bad].tolist(), j[bad].tolist())
+        if b not in neighbors[a] and not set(neighbors[a]).intersection(neighbors[b])
+    ]
+
+
+def clearance(trials, rest, moved_atno, rest_atno, origin, axis):
+    """How clear atoms turned about an axis are of others, at each angle.
+
+    Turning keeps the height of each atom along the axis and its distance from
+    it, so only the pairs of atoms close in those two coordinates can come close
+    at any angle, and are found once for all the angles.
+
+    Parameters
+    ----------
+    trials : numpy.ndarray
+        The k x m x 3 coordinates of the atoms turned by each angle.
+    rest : numpy.ndarray
+        The n x 3 coordinates of the others.
+    moved_atno, rest_atno : numpy.ndarray
+        The atomic numbers of each.
+    origin, axis : numpy.ndarray
+        A point on the axis, and its direction as a unit vector.
+
+    Returns
+    -------
+    numpy.ndarray
+        The smallest distance between the two sets of atoms at each angle,
+        relative to the contact distance, clashing if less than 1, or infinity
+        if none are close.
+    """
+    rooms = np.full(len(trials), np.inf)
+    if trials.shape[1] == 0 or len(rest) == 0:
+        return rooms
+    m = trials.shape[1]
+    points = np.concatenate((trials[0], rest)) - origin
+    height = points @ axis
+    radius = np.linalg.norm(points - height[:, np.newaxis] * axis, axis=1)
+    flat = np.stack((height, radius, np.zeros_like(height)), axis=1)
+    i, j = validate.close_pairs(flat, 2 * contact_fraction * _vdw.max())
+    across = (i < m) & (j >= m)
+    i = i[across]
+    j = j[across] - m
+    if len(i) == 0:
+        return rooms
+    limits = contact_fraction * (_vdw[moved_atno[i]] + _vdw[rest_atno[j]])
+    distances = np.linalg.norm(trials[:, i] - rest[j], axis=2)
+    return (distances / limits).min(axis=1)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""A compact, columnar store of the structures from a batch.
+
+The store is a directory of NumPy .npy files that can be memory-mapped and read
+without copying:
+
+    atomic_numbers.npy  uint8, (n_atoms,)        all the atoms, concatenated
+    coordinates.npy     float32, (n_atoms, 3)    their coordinates in Å, of
+                                                 the first conformer
+    bonds.npy           int32, (n_bonds, 3)      i, j and bond order, with the
+                                                 atom indices counted from the
+                                                 start of each molecule
+    offsets.npy         int64, (n + 1, 2)        the first atom and bond of each
+                                                 molecule, and the totals
+    identifiers.txt                              the identifier of each molecule
+
+The arrays are written as the structures arrive, and the headers of the .npy
+files are filled in with the final shapes when the store is closed.
+"""
+
+import logging
+from pathlib import Path
+import struct
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# The fixed size of the .npy headers, so they can be rewritten in place
+_header_size = 128
+
+
+def _npy_header(dtype, shape):
+    """A version 1.0 .npy header of fixed size."""
+    header = repr(
+        {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            "fortran_order": False,
+            "shape": tuple(shape),
+        }
+    )
+    length = _header_size - 10
+    header = header.ljust(length - 1) + "\n"
+    if len(header) != length:
+        raise ValueError(f"The shape {shape} is too large for the .npy header.")
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", length) + header.encode("latin1")
+
+
+class _Column(object):
+    """An .npy file that is appended to row by row."""
+
+    def __init__(self, path, dtype, width=None):
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.n_rows = 0
+        self._fd = open(path, "wb")
+        self._fd.write(_npy_header(self.dtype, self.shape))
+
+    @property
+    def shape(self):
+        if self.width is None:
+            return (self.n_rows,)
+        return (self.n_rows, self.width)
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self._fd.write(values.tobytes())
+        self.n_rows += len(values)
+
+    def close(self):
+        self._fd.seek(0)
+        self._fd.write(_npy_header(self.dtype, self.shape))
+        self._fd.close()
+
+
+class ColumnarWriter(object):
+    """Write the structures from a batch to a columnar store.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The directory for the store, which is created if needed.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        self._atno = _Column(self.path / "atomic_numbers.npy", np.uint8)
+        self._coordinates = _Column(self.path / "coordinates.npy", np.float32, 3)
+        self._bonds = _Column(self.path / "bonds.npy", np.int32, 3)
+        self._offsets = _Column(self.path / "offsets.npy", np.int64, 2)
+        self._identifiers = open(self.path / "identifiers.txt", "w")
+
+        self._offsets.append([[0, 0]])
+
+    @property
+    def n_molecules(self):
+        """The number of molecules written so far."""
+        return self._offsets.n_rows - 1
+
+    def add(self, record):
+        """Add a structure from the engine, ignoring failures and filtered ones.
+
+        Parameters
+        ----------
+        record : StructureRecord
+            The structure, with its identifier in the batch.
+        """
+        if not record.created:
+            return
+        self._atno.append(record.atno)
+        self._coordinates.append(record.coordinates)
+        if record.n_bonds > 0:
+            self._bonds.append(record.bonds)
+        self._offsets.append([[self._atno.n_rows, self._bonds.n_rows]])
+        self._identifiers.write(f"{record.identifier}\n")
+
+    def close(self):
+        """Finish the store, filling in the shapes of the arrays."""
+        for column in (self._atno, self._coordinates, self._bonds, self._offsets):
+            column.close()
+        self._identifiers.close()
+
+
+class ColumnarStore(object):
+    """Read a columnar store, memory-mapping the arrays.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The directory of the store.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.atomic_numbers = np.load(self.path / "atomic_numbers.npy", mmap_mode="r")
+        self.coordinates = np.load(self.path / "coordinates.npy", mmap_mode="r")
+        self.bonds = np.load(self.path / "bonds.npy", mmap_mode="r")
+        self.offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        self.identifiers = (self.path / "identifiers.txt").read_text().splitlines()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, k):
+        """The atomic numbers, coordinates and bonds of molecule k, as views."""
+        if k < 0:
+            k += len(self)
+        if k < 0 or k >= len(self):
+            raise IndexError(f"Molecule {k} is not in the store.")
+        atom, bond = self.offsets[k]
+        next_atom, next_bond = self.offsets[k + 1]
+        return (
+            self.atomic_numbers[atom:next_atom],
+            self.coordinates[atom:next_atom],
+            self.bonds[bond:next_bond],
+        )
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""Compare the conformers of a molecule and prune those that are alike.
+
+RDKit prunes similar conformers as it embeds them, but optimizing them with a
+force field often brings several to the same minimum, so they are pruned again
+afterwards. The RMSDs after optimal superposition are computed for all the
+conformers at once, using the singular values of the covariance matrices rather
+than the rotations themselves.
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def rmsd(reference, xyz):
+    """The RMSD of conformers from a reference, after optimal superposition.
+
+    Parameters
+    ----------
+    reference : numpy.ndarray
+        The n x 3 coordinates of the reference.
+    xyz : numpy.ndarray
+        The k x n x 3 coordinates of the conformers.
+
+    Returns
+    -------
+    numpy.ndarray
+        The k RMSDs, in Å.
+    """
+    a = reference - reference.mean(axis=0)
+    b = xyz - xyz.mean(axis=1, keepdims=True)
+    # Kabsch: the best rotation makes the cross term the sum of the singular
+    # values of the covariance, with the smallest negated for a reflection.
+    covariance = np.einsum("ax,kay->kxy", a, b)
+    u, s, vt = np.linalg.svd(covariance)
+    sign = np.sign(np.linalg.det(u) * np.linalg.det(vt))
+    s[:, 2] *= sign
+    squares = (a**2).sum() + (b**2).sum(axis=(1, 2)) - 2 * s.sum(axis=1)
+    return np.sqrt(np.maximum(squares, 0.0) / len(a))
+
+
+def prune(xyz, threshold, atoms=None):
+    """Which conformers to keep, dropping any close to one kept earlier.
+
+    Parameters
+    ----------
+    xyz : numpy.ndarray
+        The k x n x 3 coordinates of the conformers, in order of preference.
+    threshold : float
+        The RMSD below which conformers are alike, in Å.
+    atoms : [int] = None
+        The atoms to compare, e.g. the heavy atoms, defaulting to all.
+
+    Returns
+    -------
+    [int]
+        The indices of the conformers kept, in order.
+    """
+    if atoms is not None:
+        xyz = xyz[:, atoms]
+    kept = []
+    for i in range(len(xyz)):
+        if len(kept) == 0 or rmsd(xyz[i], xyz[kept]).min() >= threshold:
+            kept.append(i)
+    return kept
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""Make many copies of a molecule by moving it as a rigid body.
+
+Building a box of liquid needs many copies of the same molecule. Embedding each
+copy is wasteful, so the molecule is embedded once and the copies are made by
+rotating and translating its coordinates, all at once with NumPy.
+"""
+
+import logging
+
+import numpy as np
+
+from from_smiles_step.record import StructureRecord
+
+logger = logging.getLogger(__name__)
+
+# The distance between the bounding spheres of neighboring copies, in Å
+copy_spacing = 3.0
+
+
+def random_rotations(n, rng):
+    """Uniformly distributed random rotation matrices.
+
+    Parameters
+    ----------
+    n : int
+        The number of rotations.
+    rng : numpy.random.Generator
+        The random number generator.
+
+    Returns
+    -------
+    numpy.ndarray
+        The n x 3 x 3 rotation matrices.
+    """
+    # Random unit quaternions (Shoemake), which are uniform over rotations
+    u1, u2, u3 = rng.random((3, n))
+    a = np.sqrt(1 - u1)
+    b = np.sqrt(u1)
+    w = a * np.sin(2 * np.pi * u2)
+    x = a * np.cos(2 * np.pi * u2)
+    y = b * np.sin(2 * np.pi * u3)
+    z = b * np.cos(2 * np.pi * u3)
+    return np.stack(
+        [
+            np.stack(
+                [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)]
+            ),
+            np.stack(
+                [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)]
+            ),
+            np.stack(
+                [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]
+            ),
+        ]
+    ).transpose(2, 0, 1)
+
+
+def lattice(n, spacing):
+    """The first n points of a simple cubic lattice, centered on the origin.
+
+    Parameters
+    ----------
+    n : int
+        The number of points.
+    spacing : float
+        The distance between neighboring points.
+
+    Returns
+    -------
+    numpy.ndarray
+        The n x 3 array of points.
+    """
+    side = int(np.ceil(n ** (1 / 3) - 1e-9))
+    grid = np.indices((side, side, side)).reshape(3, -1).T[:n]
+    return (grid - (side - 1) / 2) * spacing
+
+
+def replicate(record, n_copies, rotate=True, seed=None):
+    """A record with copies of the structure in another record.
+
+    The copies are placed on a simple cubic lattice, spaced so that their
+    bounding spheres are at least copy_spacing apart, so that they cannot
+    overlap.
+
+    Parameters
+    ----------
+    record : StructureRecord
+        The structure to copy.
+    n_copies : int
+        The number of copies.
+    rotate : bool = True
+        Whether to give each copy a random orientation.
+    seed : int = None
+        The seed for the random orientations, or None for a random one.
+
+    Returns
+    -------
+    StructureRecord
+        The record of all the copies.
+    """
+    n = record.n_atoms
+    xyz = record.coordinates - record.coordinates.mean(axis=0)
+    radius = np.sqrt((xyz**2).sum(axis=1).max()) if n > 0 else 0.0
+
+    if rotate:
+        rotations = random_rotations(n_copies, np.random.default_rng(seed))
+        coordinates = np.einsum("kij,aj->kai", rotations, xyz)
+    else:
+        coordinates = np.broadcast_to(xyz, (n_copies, n, 3))
+    coordinates = (
+        coordinates + lattice(n_copies, 2 * radius + copy_spacing)[:, np.newaxis, :]
+    )
+
+    bonds = np.tile(record.bonds, (n_copies, 1))
+    offsets = np.repeat(np.arange(n_copies, dtype=np.int32) * n, record.n_bonds)
+    bonds[:, :2] += offsets[:, np.newaxis]
+
+    result = StructureRecord(
+        record.text,
+        atno=np.tile(record.atno, n_copies),
+        coordinates=coordinates.reshape(-1, 3),
+        bonds=bonds,
+        charge=n_copies * record.charge,
+        formal_charges=(
+            None
+            if record.formal_charges is None
+            else np.tile(record.formal_charges, n_copies)
+        ),
+        spin_multiplicity=n_copies * (record.spin_multiplicity - 1) + 1,
+        notation=record.notation,
+        flavor=record.flavor,
+    )
+    result.seed = seed
+    return result
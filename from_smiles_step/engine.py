@@ -0,0 +1,1391 @@
+# -*- coding: utf-8 -*-
+
+"""The engine for creating many structures from line notations in parallel.
+
+The workers use RDKit and Open Babel directly and return a compact record of the
+atoms, bonds and coordinates of each structure rather than a configuration, so
+that only the
+step's own process touches the system database. Anything the workers cannot
+handle locally, such as names or InChIKeys that need PubChem, is returned as a
+failure for the step to handle with its usual fallbacks.
+"""
+
+import atexit
+import logging
+import multiprocessing
+from multiprocessing import resource_tracker
+import queue
+import time
+import zlib
+
+import numpy as np
+from openbabel import openbabel
+from rdkit import Chem
+from rdkit import RDLogger
+from rdkit.Chem import (
+    rdDepictor,
+    rdDistGeom,
+    rdForceFieldHelpers,
+    rdMolDescriptors,
+    rdmolops,
+)
+
+from from_smiles_step import assembly
+from from_smiles_step import conformers
+from from_smiles_step import filters
+from from_smiles_step import fragments
+from from_smiles_step import polymers
+from from_smiles_step import scaffolds
+from from_smiles_step import scheduler
+from from_smiles_step import transport
+from from_smiles_step import validate
+from from_smiles_step.record import StructureRecord
+
+logger = logging.getLogger(__name__)
+
+# The persistent pool of workers, shared by all the steps in the job, and the
+# number of workers and tasks per worker it was created with.
+_pool = None
+_pool_key = None
+
+# The coordinates of fragments already embedded in this process, by canonical
+# SMILES, embedding settings and seed, the maximum number kept, and the spacing between
+# fragments, in Å.
+_fragment_cache = {}
+fragment_cache_size = 10000
+fragment_spacing = 3.0
+
+# The number of structures held back when returning a batch in order, beyond which
+# only the chunk with the next structure is started.
+reorder_window = 1000
+
+# The most heavy atoms InChI can handle
+max_inchi_atoms = 1023
+
+# The embedded scaffolds in this process, by canonical SMILES, embedding settings
+# and seed, and the maximum number kept.
+_scaffold_cache = {}
+scaffold_cache_size = 10000
+
+# The settings for embedding with RDKit for each quality: the method, the number
+# of conformers to embed, and whether to optimize them with a force field and
+# keep the lowest in energy.
+embedding_presets = {
+    "fast": {"method": "KDG", "conformers": 1, "force field": False},
+    "standard": {"method": "ETKDG", "conformers": 1, "force field": False},
+    "thorough": {"method": "ETKDG", "conformers": 10, "force field": True},
+}
+
+# Bond orders as used in SEAMM, where aromatic bonds are 5
+rdkit_bond_orders = {
+    Chem.BondType.SINGLE: 1,
+    Chem.BondType.DOUBLE: 2,
+    Chem.BondType.TRIPLE: 3,
+    Chem.BondType.AROMATIC: 5,
+}
+
+
+def perceive_notation(text):
+    """Work out the line notation of a string.
+
+    Parameters
+    ----------
+    text : str
+        The line notation.
+
+    Returns
+    -------
+    str
+        "InChIKey", "InChI", or "SMILES or name"
+    """
+    tmp = text.split("-")
+    if len(text) == 27 and len(tmp) == 3 and len(tmp[0]) == 14 and len(tmp[1]) == 10:
+        return "InChIKey"
+    elif text.startswith("InChI="):
+        return "InChI"
+    else:
+        return "SMILES or name"
+
+
+def reorient(coordinates):
+    """Move the structure to its center and align its principal axes.
+
+    Parameters
+    ----------
+    coordinates : numpy.ndarray
+        The n x 3 array of coordinates.
+
+    Returns
+    -------
+    numpy.ndarray
+        The reoriented coordinates.
+    """
+    xyz = coordinates - coordinates.mean(axis=0)
+    if len(xyz) > 1:
+        _, vectors = np.linalg.eigh(xyz.T @ xyz)
+        # Largest moment along x, keeping a proper rotation so that the
+        # handedness, and hence any stereocenters, are unchanged
+        vectors = vectors[:, ::-1]
+        if np.linalg.det(vectors) < 0:
+            vectors[:, 2] = -vectors[:, 2]
+        xyz = xyz @ vectors
+    return xyz
+
+
+def from_rdkit(mol, text):
+    """The record of a structure from an embedded RDKit molecule.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, which must have a conformer.
+    text : str
+        The line notation the molecule was created from.
+
+    Returns
+    -------
+    StructureRecord
+        The atomic numbers, coordinates, bonds, charges and spin multiplicity.
+        The bonds are an m x 3 array of the two atom indices and the bond order.
+        If the molecule has several conformers, the coordinates are those of the
+        first, and all are in the conformers.
+    """
+    atno = [atom.GetAtomicNum() for atom in mol.GetAtoms()]
+    # Iterating over the bonds of the molecule is quadratic in recent versions of
+    # RDKit, so the bonds are found from their first atom, then put in order.
+    bonds = [None] * mol.GetNumBonds()
+    for atom in mol.GetAtoms():
+        i = atom.GetIdx()
+        for bond in atom.GetBonds():
+            if bond.GetBeginAtomIdx() == i:
+                bonds[bond.GetIdx()] = (
+                    i,
+                    bond.GetEndAtomIdx(),
+                    rdkit_bond_orders.get(bond.GetBondType(), 1),
+                )
+    n_electrons = sum(atom.GetNumRadicalElectrons() for atom in mol.GetAtoms())
+    formal_charges = [atom.GetFormalCharge() for atom in mol.GetAtoms()]
+    stack = None
+    if mol.GetNumConformers() > 1:
+        stack = np.array(
+            [reorient(conformer.GetPositions()) for conformer in mol.GetConformers()]
+        )
+    return StructureRecord(
+        text,
+        atno=np.array(atno, dtype=np.uint8),
+        coordinates=(
+            reorient(mol.GetConformer().GetPositions()) if stack is None else stack[0]
+        ),
+        bonds=np.array(bonds, dtype=np.int32).reshape(-1, 3),
+        charge=Chem.GetFormalCharge(mol),
+        formal_charges=(
+            np.array(formal_charges, dtype=np.int8) if any(formal_charges) else None
+        ),
+        spin_multiplicity=n_electrons + 1,
+        conformers=stack,
+    )
+
+
+def identify(mol, record, from_3d=True):
+    """Add the canonical SMILES, InChI, InChIKey and formula to a record.
+
+    These are computed as molsystem does for a configuration, using the
+    stereochemistry from the 3-D structure, so that they can be used to name the
+    configuration without computing them again.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with hydrogens and a conformer.
+    record : StructureRecord
+        The record of the structure created from the molecule.
+    from_3d : bool = True
+        Whether to take the stereochemistry from the 3-D structure, rather than
+        the molecular graph.
+    """
+    mol = Chem.Mol(mol)
+    if from_3d:
+        rdmolops.AssignStereochemistryFrom3D(mol)
+    record.canonical_smiles = Chem.MolToSmiles(Chem.RemoveHs(mol))
+    if mol.GetNumHeavyAtoms() <= max_inchi_atoms:
+        inchi = Chem.MolToInchi(mol)
+        if inchi != "":
+            record.inchi = inchi
+            record.inchikey = Chem.InchiToInchiKey(inchi)
+    record.formula = rdMolDescriptors.CalcMolFormula(mol)
+
+
+def openbabel_to_rdkit(mol, from_3d=True):
+    """An RDKit molecule from an Open Babel one, keeping the hydrogens.
+
+    Parameters
+    ----------
+    mol : openbabel.OBMol
+        The Open Babel molecule.
+    from_3d : bool = True
+        Whether to go through a mol file, keeping the coordinates, rather than an
+        isomeric SMILES, which keeps the stereochemistry of the molecular graph.
+
+    Returns
+    -------
+    rdkit.Chem.Mol
+        The RDKit molecule.
+    """
+    conversion = openbabel.OBConversion()
+    if from_3d:
+        conversion.SetOutFormat("mol")
+        result = Chem.MolFromMolBlock(conversion.WriteString(mol), removeHs=False)
+    else:
+        conversion.SetOutFormat("smi")
+        result = Chem.MolFromSmiles(conversion.WriteString(mol).split()[0])
+        if result is not None:
+            result = Chem.AddHs(result)
+    if result is None:
+        raise RuntimeError("The structure from Open Babel is not valid in RDKit.")
+    return result
+
+
+def smiles_seed(smiles):
+    """A random seed that depends only on a SMILES string.
+
+    Parameters
+    ----------
+    smiles : str
+        The SMILES, usually canonical.
+
+    Returns
+    -------
+    int
+        The seed, a non-negative 31-bit integer.
+    """
+    return zlib.crc32(smiles.encode()) & 0x7FFFFFFF
+
+
+def structure_seed(mol):
+    """A random seed that depends only on the molecule, from its canonical SMILES.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with or without hydrogens.
+
+    Returns
+    -------
+    int
+        The seed, a non-negative 31-bit integer.
+    """
+    return smiles_seed(Chem.MolToSmiles(Chem.RemoveHs(mol)))
+
+
+def canonical_form(mol):
+    """The molecule rebuilt from its canonical SMILES, with the atoms in order.
+
+    Both the order of the atoms and of the bonds affect embedding, so the
+    molecule is rebuilt from its canonical SMILES, with the hydrogens explicit,
+    rather than just renumbered.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with hydrogens.
+
+    Returns
+    -------
+    rdkit.Chem.Mol, [int] or None
+        The canonical molecule and the index in the original of each of its
+        atoms, or the original molecule and None if it cannot be rebuilt.
+    """
+    smiles = Chem.MolToSmiles(mol)
+    order = list(mol.GetPropsAsDict(True, True)["_smilesAtomOutputOrder"])
+    params = Chem.SmilesParserParams()
+    params.removeHs = False
+    canonical = Chem.MolFromSmiles(smiles, params)
+    if canonical is None or canonical.GetNumAtoms() != mol.GetNumAtoms():
+        return mol, None
+    return canonical, order
+
+
+def set_positions(mol, xyz):
+    """Replace the conformers of a molecule with ones with the given coordinates.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule.
+    xyz : numpy.ndarray
+        The n x 3 array of coordinates, in Å, or k x n x 3 for k conformers.
+    """
+    n = mol.GetNumAtoms()
+    mol.RemoveAllConformers()
+    for positions in np.reshape(xyz, (-1, n, 3)):
+        conformer = Chem.Conformer(n)
+        conformer.Set3D(True)
+        for i, position in enumerate(positions):
+            conformer.SetAtomPosition(i, position.tolist())
+        mol.AddConformer(conformer, assignId=True)
+
+
+def embedding_settings(
+    quality="standard",
+    max_iterations=None,
+    force_field=None,
+    threads=1,
+    n_conformers=1,
+    prune_rms=None,
+    scaffolds=False,
+    assembly_atoms=None,
+):
+    """The settings for embedding with RDKit, from a preset and any changes.
+
+    Parameters
+    ----------
+    quality : str = "standard"
+        The preset: "fast", "standard" or "thorough".
+    max_iterations : int = None
+        The maximum number of iterations of the embedding, or None for RDKit's
+        default.
+    force_field : bool = None
+        Whether to clean up the structure with a force field, or None to follow
+        the preset.
+    threads : int = 1
+        The number of threads for embedding several conformers and optimizing
+        them, or 0 for all the cores.
+    n_conformers : int = 1
+        The number of conformers to keep. At least this many are embedded.
+    prune_rms : float = None
+        The RMSD of the heavy atoms, in Å, below which conformers are alike and
+        only the first is kept, or None to keep them all.
+    scaffolds : bool = False
+        Whether to build single conformers from the coordinates of their
+        scaffold, if it has already been embedded.
+    assembly_atoms : int = None
+        The number of heavy atoms above which single conformers are assembled
+        from their rigid fragments, or None to always embed the whole molecule.
+
+    Returns
+    -------
+    dict(str, any)
+        The settings.
+    """
+    if quality not in embedding_presets:
+        raise ValueError(f"Embedding quality '{quality}' is not supported.")
+    settings = dict(embedding_presets[quality])
+    settings["max iterations"] = max_iterations
+    if force_field is not None:
+        settings["force field"] = force_field
+    settings["threads"] = threads
+    settings["conformers"] = max(settings["conformers"], n_conformers)
+    settings["keep"] = n_conformers
+    settings["prune rms"] = prune_rms
+    settings["scaffolds"] = scaffolds
+    settings["assembly atoms"] = assembly_atoms
+    return settings
+
+
+def embed_rdkit(mol, geometry="3D", seed=None, settings=None):
+    """Add hydrogens to an RDKit molecule and give it coordinates.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, without coordinates.
+    geometry : str = "3D"
+        "3D" to embed the molecule in 3-D, "2D" for the coordinates of a 2-D
+        depiction, or "none" or "deferred" to leave all the atoms at the origin.
+    seed : int or str = None
+        The random seed for embedding in 3-D, "from the structure" for one from
+        the canonical SMILES of each molecule, or None for a random one.
+    settings : dict(str, any) = None
+        The settings for embedding in 3-D, from embedding_settings(), defaulting
+        to the standard ones.
+
+    Returns
+    -------
+    rdkit.Chem.Mol
+        The molecule with hydrogens and a conformer.
+    """
+    mol = Chem.AddHs(mol)
+    if geometry == "2D":
+        rdDepictor.Compute2DCoords(mol)
+        return mol
+    elif geometry in ("none", "deferred"):
+        mol.AddConformer(Chem.Conformer(mol.GetNumAtoms()), assignId=True)
+        return mol
+    elif geometry != "3D":
+        raise ValueError(f"Geometry '{geometry}' is not supported.")
+
+    if len(rdmolops.GetMolFrags(mol)) > 1:
+        embed_fragments(mol, seed=seed, settings=settings)
+    else:
+        embed_3d(mol, seed=seed, settings=settings)
+    return mol
+
+
+def embed_3d(mol, seed=None, settings=None):
+    """Embed a molecule with hydrogens in 3-D, in place.
+
+    With a seed, the canonical form of the molecule is embedded, so that the
+    coordinates depend only on the molecule and the seed, not on how the SMILES
+    was written.
+
+    All the conformers are embedded in one call. When they are cleaned up with
+    a force field they are ordered by energy, and pruned again since several
+    may have optimized to the same structure. The molecule is left with the
+    conformers to keep.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with hydrogens.
+    seed : int or str = None
+        The random seed, "from the structure" for one from the canonical SMILES,
+        or None for a random one.
+    settings : dict(str, any) = None
+        The settings for embedding, from embedding_settings(), defaulting to the
+        standard ones.
+    """
+    if settings is None:
+        settings = embedding_presets["standard"]
+    if (
+        settings.get("scaffolds", False)
+        and settings["conformers"] == 1
+        and embed_from_scaffold(mol, seed=seed, settings=settings)
+    ):
+        return
+    threshold = settings.get("assembly atoms")
+    if (
+        threshold is not None
+        and settings.get("keep", 1) == 1
+        and mol.GetNumHeavyAtoms() > threshold
+        and embed_from_fragments(mol, seed=seed, settings=settings)
+    ):
+        return
+    if seed == "from the structure":
+        seed = structure_seed(mol)
+    work, order = (mol, None) if seed is None else canonical_form(mol)
+
+    if settings["method"] == "KDG":
+        ps = rdDistGeom.KDG()
+    else:
+        # Small rings need the small-ring version of ETKDG
+        for ring in rdmolops.GetSSSR(work):
+            if len(ring) <= 4:
+                ps = rdDistGeom.srETKDGv3()
+                break
+        else:
+            ps = rdDistGeom.ETKDGv3()
+    if seed is not None:
+        ps.randomSeed = seed
+    if settings.get("max iterations") is not None:
+        ps.maxIterations = settings["max iterations"]
+    ps.numThreads = settings.get("threads", 1)
+    prune_rms = settings.get("prune rms")
+    if prune_rms is not None:
+        ps.pruneRmsThresh = prune_rms
+
+    n_conformers = settings["conformers"]
+    if n_conformers == 1:
+        ids = [] if rdDistGeom.EmbedMolecule(work, ps) == -1 else [0]
+    else:
+        ids = list(rdDistGeom.EmbedMultipleConfs(work, n_conformers, ps))
+    if len(ids) == 0:
+        raise RuntimeError("RDKit could not embed the structure.")
+
+    if settings["force field"]:
+        results = optimize(work, threads=settings.get("threads", 1))
+        if results is not None:
+            # Lowest in energy first
+            ids = [ids[k] for k in sorted(range(len(ids)), key=lambda k: results[k][1])]
+            if settings.get("keep", 1) > 1 and prune_rms is not None:
+                xyz = np.array([work.GetConformer(i).GetPositions() for i in ids])
+                heavy = [a.GetIdx() for a in work.GetAtoms() if a.GetAtomicNum() > 1]
+                kept = conformers.prune(xyz, prune_rms, atoms=heavy or None)
+                ids = [ids[k] for k in kept]
+    ids = ids[: settings.get("keep", 1)]
+
+    if order is None and ids == [0] and mol.GetNumConformers() == 1:
+        return
+    xyz = np.array([work.GetConformer(i).GetPositions() for i in ids])
+    if order is not None:
+        canonical = xyz
+        xyz = np.empty_like(canonical)
+        xyz[:, order] = canonical
+    set_positions(mol, xyz)
+
+
+def optimize(mol, threads=1):
+    """Optimize the conformers of a molecule with MMFF94, or UFF, in place.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with hydrogens and conformers.
+    threads : int = 1
+        The number of threads, or 0 for all the cores.
+
+    Returns
+    -------
+    [(int, float)] or None
+        Whether each conformer did not converge, and its energy, or None if
+        neither force field can handle the molecule.
+    """
+    if rdForceFieldHelpers.MMFFHasAllMoleculeParams(mol):
+        return rdForceFieldHelpers.MMFFOptimizeMoleculeConfs(mol, numThreads=threads)
+    if rdForceFieldHelpers.UFFHasAllMoleculeParams(mol):
+        return rdForceFieldHelpers.UFFOptimizeMoleculeConfs(mol, numThreads=threads)
+    return None
+
+
+def embed_from_scaffold(mol, seed=None, settings=None):
+    """Embed a molecule from the coordinates of its scaffold, in place, if possible.
+
+    The scaffold is embedded on its own the first time it is seen, and cached in
+    the process, so that the structure does not depend on which molecule came
+    first. Only the side chains are then embedded, in small fragments. Anything
+    that does not work out, or gives a structure with odd bond lengths, atoms
+    too close or the wrong stereochemistry, is left for the usual embedding.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with hydrogens.
+    seed : int or str = None
+        The random seed, "from the structure" for one from the canonical SMILES
+        of the scaffold and each fragment, or None for a random one.
+    settings : dict(str, any) = None
+        The settings for embedding, from embedding_settings().
+
+    Returns
+    -------
+    bool
+        Whether the molecule was embedded.
+    """
+    core = scaffolds.scaffold(mol)
+    if core is None:
+        return False
+    plain = dict(settings, scaffolds=False)
+    key = (Chem.MolToSmiles(core), tuple(sorted(plain.items())), seed)
+    template = _scaffold_cache.get(key)
+    if template is None:
+        template = Chem.AddHs(core)
+        try:
+            embed_3d(template, seed=seed, settings=plain)
+        except RuntimeError:
+            return False
+        if len(_scaffold_cache) < scaffold_cache_size:
+            _scaffold_cache[key] = template
+
+    def embed(piece, attempt):
+        if seed is None or attempt == 0:
+            embed_3d(piece, seed=seed, settings=plain)
+        elif seed == "from the structure":
+            trial_seed = (structure_seed(piece) + attempt) & 0x7FFFFFFF
+            embed_3d(piece, seed=trial_seed, settings=plain)
+        else:
+            embed_3d(piece, seed=(seed + attempt) & 0x7FFFFFFF, settings=plain)
+
+    # As for embedding, build the canonical form when seeded.
+    work, order = (mol, None) if seed is None else canonical_form(mol)
+    try:
+        xyz = scaffolds.build(work, template, embed)
+    except Exception as e:
+        logger.debug(f"Could not build from the scaffold: {e}")
+        return False
+    if xyz is None:
+        return False
+    if order is not None:
+        canonical = xyz
+        xyz = np.empty_like(canonical)
+        xyz[order] = canonical
+
+    built = Chem.Mol(mol)
+    set_positions(built, xyz)
+    if settings["force field"]:
+        optimize(built, threads=settings.get("threads", 1))
+    if validate.check(from_rdkit(built, None)) is not None:
+        return False
+    if not scaffolds.same_stereo(mol, built):
+        return False
+    set_positions(mol, built.GetConformer().GetPositions())
+    return True
+
+
+def embed_from_fragments(mol, seed=None, settings=None):
+    """Assemble a large molecule from its rigid fragments, in place, if possible.
+
+    The molecule is cut at its rotatable bonds, and each fragment embedded on its
+    own, or taken from the cache of fragments, before they are joined again as in
+    assembly.build(). Anything that does not work out, or gives a structure with
+    odd bond lengths, atoms too close or the wrong stereochemistry, is left for the
+    usual embedding.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with hydrogens.
+    seed : int or str = None
+        The random seed, "from the structure" for one from the canonical SMILES
+        of each fragment, or None for a random one.
+    settings : dict(str, any) = None
+        The settings for embedding, from embedding_settings().
+
+    Returns
+    -------
+    bool
+        Whether the molecule was embedded.
+    """
+    plain = dict(settings, scaffolds=False)
+    plain["assembly atoms"] = None
+
+    # As for embedding, build the canonical form when seeded.
+    work, order = (mol, None) if seed is None else canonical_form(mol)
+    try:
+        xyz = assembly.build(
+            work, lambda piece: embed_cached(piece, seed=seed, settings=plain)
+        )
+    except Exception as e:
+        logger.debug(f"Could not assemble the fragments: {e}")
+        return False
+    if xyz is None:
+        return False
+    if order is not None:
+        canonical = xyz
+        xyz = np.empty_like(canonical)
+        xyz[order] = canonical
+
+    built = Chem.Mol(mol)
+    set_positions(built, xyz)
+    if settings["force field"]:
+        optimize(built, threads=settings.get("threads", 1))
+    if validate.check(from_rdkit(built, None)) is not None:
+        return False
+    if not scaffolds.same_stereo(mol, built):
+        return False
+    set_positions(mol, built.GetConformer().GetPositions())
+    return True
+
+
+def embed_cached(mol, seed=None, settings=None):
+    """The coordinates of a small molecule, embedding it unless already cached.
+
+    Fragments such as counterions, or the pieces of large molecules, recur
+    constantly, so the coordinates of each are cached in the process by canonical
+    SMILES and reused for the same seed and settings. The cache holds them in the
+    canonical order of the atoms, so they can be used whatever the order of the
+    atoms in the SMILES.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with hydrogens.
+    seed : int or str = None
+        The random seed if the molecule is not in the cache, "from the structure"
+        for one from its canonical SMILES, or None for a random one.
+    settings : dict(str, any) = None
+        The settings for embedding, from embedding_settings(), defaulting to the
+        standard ones.
+
+    Returns
+    -------
+    numpy.ndarray
+        The n x 3 coordinates, centered on the origin.
+    """
+    if settings is None:
+        settings = embedding_presets["standard"]
+    key = (Chem.MolToSmiles(mol), tuple(sorted(settings.items())), seed)
+    ranks = list(Chem.CanonicalRankAtoms(mol))
+    canonical = _fragment_cache.get(key)
+    if canonical is None:
+        embed_3d(mol, seed=seed, settings=settings)
+        positions = mol.GetConformer().GetPositions()
+        canonical = np.empty_like(positions)
+        canonical[ranks] = positions - positions.mean(axis=0)
+        if len(_fragment_cache) < fragment_cache_size:
+            _fragment_cache[key] = canonical
+    return canonical[ranks]
+
+
+def embed_fragments(mol, seed=None, settings=None):
+    """Embed the disconnected fragments of a molecule separately, in place.
+
+    Embedding salts, co-crystals or mixtures as a whole scales poorly and often
+    fails, so each fragment is embedded on its own and the fragments are placed
+    side by side along x, with their bounding spheres separated by
+    fragment_spacing. The coordinates of each fragment are cached, as in
+    embed_cached(). Seeds from the structure are taken from each fragment rather
+    than the whole molecule, so that a fragment has the same coordinates whatever
+    it is combined with.
+
+    The fragments are placed in the order of their canonical SMILES, so the
+    arrangement does not depend on the order they are written in.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with hydrogens.
+    seed : int or str = None
+        The random seed for fragments not in the cache, "from the structure" for
+        one from the canonical SMILES of each fragment, or None for a random one.
+    settings : dict(str, any) = None
+        The settings for embedding, from embedding_settings(), defaulting to the
+        standard ones. Fragments are cached separately for each.
+    """
+    if settings is None:
+        settings = embedding_presets["standard"]
+    mapping = []
+    pieces = rdmolops.GetMolFrags(mol, asMols=True, fragsMolAtomMapping=mapping)
+    smiles = [Chem.MolToSmiles(piece) for piece in pieces]
+    xyz = np.zeros((mol.GetNumAtoms(), 3))
+    x = 0.0
+    # Place the fragments in order of their SMILES, not as they happen to be
+    # written.
+    for k in sorted(range(len(pieces)), key=lambda k: smiles[k]):
+        atoms = mapping[k]
+        positions = embed_cached(pieces[k], seed=seed, settings=settings)
+        radius = np.sqrt((positions**2).sum(axis=1).max())
+        xyz[list(atoms)] = positions + (x + radius, 0.0, 0.0)
+        x += 2 * radius + fragment_spacing
+
+    set_positions(mol, xyz)
+
+
+def build_polymer(
+    text,
+    degree=10,
+    head="[H]*",
+    tail="[H]*",
+    geometry="3D",
+    seed=None,
+    settings=None,
+):
+    """Build a polymer or oligomer from its repeat unit.
+
+    An oligomer of three units with the end groups is embedded, and the chain
+    assembled from its middle unit. If the chain has atoms too close together,
+    the oligomer is embedded again, up to polymers.attempts times.
+
+    Parameters
+    ----------
+    text : str
+        The SMILES of the repeat unit, with two attachment points, '*'.
+    degree : int = 10
+        The number of repeat units.
+    head : str = "[H]*"
+        The SMILES of the end group before the first unit, with one attachment
+        point.
+    tail : str = "[H]*"
+        The SMILES of the end group after the last unit.
+    geometry : str = "3D"
+        The coordinates to create: "3D", or "none", when all the atoms are at the
+        origin.
+    seed : int or str = None
+        The random seed for embedding the oligomer, "from the structure" for one
+        from its canonical SMILES, or None for a random one.
+    settings : dict(str, any) = None
+        The settings for embedding, from embedding_settings(), defaulting to the
+        standard ones. Only one conformer is kept.
+
+    Returns
+    -------
+    rdkit.Chem.Mol
+        The chain, with hydrogens and a conformer.
+    """
+    # The hydrogens are added after the attachment points, which keep their indices
+    unit, points = polymers.parse(text, 2)
+    unit = Chem.AddHs(unit)
+    head, head_points = polymers.parse(head, 1)
+    head = (Chem.AddHs(head), head_points)
+    tail, tail_points = polymers.parse(tail, 1)
+    tail = (Chem.AddHs(tail), tail_points)
+    mol, origin = polymers.chain(unit, points, degree, head, tail)
+    if geometry == "none":
+        set_positions(mol, np.zeros((mol.GetNumAtoms(), 3)))
+        return mol
+    if geometry != "3D":
+        raise ValueError("Polymers can only be built in 3-D or without coordinates.")
+
+    if settings is None:
+        settings = embedding_presets["standard"]
+    settings = dict(settings, keep=1, scaffolds=False)
+    oligomer, oligomer_origin = polymers.chain(unit, points, 3, head, tail)
+    if seed == "from the structure":
+        seed = structure_seed(oligomer)
+    for attempt in range(polymers.attempts):
+        trial_seed = None if seed is None else (seed + attempt) & 0x7FFFFFFF
+        embed_3d(oligomer, seed=trial_seed, settings=settings)
+        xyz = polymers.assemble(
+            unit, points, head, tail, oligomer, oligomer_origin, origin
+        )
+        set_positions(mol, xyz)
+        problem = validate.check(from_rdkit(mol, text))
+        if problem is None:
+            return mol
+    raise RuntimeError(
+        f"Could not build the chain without atoms overlapping. {problem}"
+    )
+
+
+def from_smiles(
+    text,
+    flavor="rdkit",
+    identifiers=False,
+    geometry="3D",
+    seed="from the structure",
+    embedding=None,
+):
+    """Create the record of a structure from a SMILES string.
+
+    Parameters
+    ----------
+    text : str
+        The SMILES string.
+    flavor : str = "rdkit"
+        The toolkit to use, "rdkit" or "openbabel".
+    identifiers : bool = False
+        Whether to add the canonical SMILES, InChI, InChIKey and formula.
+    geometry : str = "3D"
+        The coordinates to create: "3D", "2D", or "none" or "deferred", when all
+        the atoms are at the origin.
+    seed : int or str = "from the structure"
+        The random seed for embedding in 3-D with RDKit, "from the structure" for
+        one from the canonical SMILES, so that the same molecule always has the
+        same coordinates, or None for a random one. Open Babel cannot be seeded.
+    embedding : dict(str, any) = None
+        The settings for embedding in 3-D with RDKit, from embedding_settings().
+
+    Returns
+    -------
+    StructureRecord
+        The atomic numbers, coordinates, bonds, charge and spin multiplicity.
+    """
+    if flavor == "rdkit":
+        mol = Chem.MolFromSmiles(text)
+        if mol is None:
+            raise ValueError(f"SMILES '{text}' is not valid.")
+        mol = embed_rdkit(mol, geometry, seed=seed, settings=embedding)
+        record = from_rdkit(mol, text)
+    elif flavor == "openbabel":
+        conversion = openbabel.OBConversion()
+        conversion.SetInFormat("smi")
+        obmol = openbabel.OBMol()
+        if not conversion.ReadString(obmol, text) or obmol.NumAtoms() == 0:
+            raise ValueError(f"SMILES '{text}' is not valid.")
+        obmol.AddHydrogens()
+        if geometry == "3D":
+            builder = openbabel.OBBuilder()
+            if not builder.Build(obmol):
+                raise RuntimeError("Open Babel could not build the structure.")
+        elif geometry == "2D":
+            if not openbabel.OBOp.FindType("gen2D").Do(obmol):
+                raise RuntimeError("Open Babel could not depict the structure.")
+        elif geometry not in ("none", "deferred"):
+            raise ValueError(f"Geometry '{geometry}' is not supported.")
+
+        atno = []
+        coordinates = []
+        formal_charges = []
+        for atom in openbabel.OBMolAtomIter(obmol):
+            atno.append(atom.GetAtomicNum())
+            coordinates.append((atom.GetX(), atom.GetY(), atom.GetZ()))
+            formal_charges.append(atom.GetFormalCharge())
+        bonds = [
+            (bond.GetBeginAtomIdx() - 1, bond.GetEndAtomIdx() - 1, bond.GetBondOrder())
+            for bond in openbabel.OBMolBondIter(obmol)
+        ]
+        record = StructureRecord(
+            text,
+            atno=np.array(atno, dtype=np.uint8),
+            coordinates=reorient(np.array(coordinates)),
+            bonds=np.array(bonds, dtype=np.int32).reshape(-1, 3),
+            charge=obmol.GetTotalCharge(),
+            formal_charges=(
+                np.array(formal_charges, dtype=np.int8) if any(formal_charges) else None
+            ),
+            spin_multiplicity=obmol.GetTotalSpinMultiplicity(),
+        )
+        if identifiers:
+            mol = openbabel_to_rdkit(obmol, from_3d=geometry == "3D")
+    else:
+        raise ValueError(f"The SMILES flavor '{flavor}' can't be used in a batch.")
+
+    if identifiers:
+        identify(mol, record, from_3d=geometry == "3D")
+    return record
+
+
+def check_structure(record):
+    """Raise an error if an embedded structure is not sensible.
+
+    Of several conformers, those that are not sensible are dropped, and there is
+    only an error if none are.
+
+    Parameters
+    ----------
+    record : StructureRecord
+        The structure, with 3-D coordinates.
+
+    Returns
+    -------
+    StructureRecord
+        The record, if the structure is sensible.
+    """
+    if record.conformers is None:
+        problem = validate.check(record)
+        if problem is not None:
+            raise RuntimeError(f"The embedded structure is not sensible. {problem}")
+        return record
+
+    problems = [validate.check(record, xyz) for xyz in record.conformers]
+    good = [k for k, problem in enumerate(problems) if problem is None]
+    if len(good) == 0:
+        raise RuntimeError(f"The embedded structure is not sensible. {problems[0]}")
+    if len(good) < len(problems):
+        stack = record.conformers[good]
+        record.conformers = stack if len(good) > 1 else None
+        record.coordinates = stack[0]
+    return record
+
+
+def convert(
+    text,
+    notation="perceive",
+    flavor="rdkit",
+    identifiers=False,
+    geometry="3D",
+    seed="from the structure",
+    validate=False,
+    embedding=None,
+    polymer=None,
+):
+    """Create the record of a structure from its line notation.
+
+    SMILES that RDKit cannot embed, or when validating, embeds badly, are tried
+    with Open Babel, which is more robust, as in the step itself.
+
+    Parameters
+    ----------
+    text : str
+        The line notation.
+    notation : str = "perceive"
+        The notation of the text.
+    flavor : str = "rdkit"
+        The toolkit to use for SMILES.
+    identifiers : bool = False
+        Whether to add the canonical SMILES, InChI, InChIKey and formula.
+    geometry : str = "3D"
+        The coordinates to create: "3D", "2D", or "none" or "deferred", when all
+        the atoms are at the origin and only the molecular graph is meaningful.
+        Deferred structures are embedded later, using the seed in the record.
+    seed : int or str = "from the structure"
+        The random seed for embedding in 3-D, or "from the structure" for one from
+        the canonical SMILES, so that the same molecule always has the same
+        coordinates. If None, a random one is used, or for deferred structures one
+        from the structure.
+    validate : bool = False
+        Whether to check 3-D structures for bond lengths and contacts between
+        atoms that are not sensible, treating them as failures.
+    embedding : dict(str, any) = None
+        The settings for embedding in 3-D with RDKit, from embedding_settings(),
+        defaulting to the standard ones.
+    polymer : dict(str, any) = None
+        For the "repeat unit" notation, the keyword arguments for
+        build_polymer(): the degree of polymerization, "degree", and the end
+        groups, "head" and "tail".
+
+    Returns
+    -------
+    StructureRecord
+        The atomic numbers, coordinates, bonds, charge and spin multiplicity, and
+        the notation and flavor actually used.
+    """
+    if notation == "perceive":
+        notation = perceive_notation(text)
+    if geometry == "deferred" and seed is None:
+        seed = "from the structure"
+    validate = validate and geometry == "3D"
+
+    if notation in ("SMILES", "SMILES or name"):
+        try:
+            record = from_smiles(
+                text,
+                flavor=flavor,
+                identifiers=identifiers,
+                geometry=geometry,
+                seed=seed,
+                embedding=embedding,
+            )
+            if validate:
+                check_structure(record)
+        except Exception:
+            if flavor != "rdkit":
+                raise
+            flavor = "openbabel"
+            record = from_smiles(
+                text,
+                flavor=flavor,
+                identifiers=identifiers,
+                geometry=geometry,
+                seed=seed,
+            )
+            if validate:
+                check_structure(record)
+        notation = "SMILES"
+    elif notation == "InChI":
+        mol = Chem.MolFromInchi(text)
+        if mol is None:
+            raise ValueError(f"InChI '{text}' is not valid.")
+        mol = embed_rdkit(mol, geometry, seed=seed, settings=embedding)
+        record = from_rdkit(mol, text)
+        if validate:
+            check_structure(record)
+        if identifiers:
+            identify(mol, record, from_3d=geometry == "3D")
+        flavor = "rdkit"
+    elif notation == "repeat unit":
+        if polymer is None:
+            polymer = {}
+        mol = build_polymer(
+            text,
+            geometry=geometry,
+            seed=seed,
+            settings=embedding,
+            **polymer,
+        )
+        record = from_rdkit(mol, text)
+        if validate:
+            check_structure(record)
+        if identifiers:
+            # From the graph, with the stereochemistry of the repeat unit, since
+            # RDKit is slow with the hydrogens of long chains.
+            identify(polymers.graph(text, **polymer), record, from_3d=False)
+        flavor = "rdkit"
+    else:
+        raise RuntimeError(f"The {notation} '{text}' can't be handled in a worker.")
+
+    record.notation = notation
+    record.flavor = flavor
+    # Open Babel seeds its builder from the clock, so its structures have no seed.
+    record.seed = None if flavor == "openbabel" and geometry == "3D" else seed
+    return record
+
+
+def convert_chunk(task):
+    """Convert a chunk of structures, catching any errors.
+
+    Parameters
+    ----------
+    task : ([(int, str, int)], dict(str, any), str or None)
+        The index, text and seed of each structure, the options for convert(),
+        with which fragments to keep and any criteria for filtering the
+        structures, and the name for the block of shared memory to return the
+        arrays in, or None to pickle them.
+
+    Returns
+    -------
+    dict(str, any) or None, [(int, StructureRecord)], [tuple] or None
+        The descriptor of the block of shared memory holding the arrays, if used,
+        the index and record for each structure, with the text after removing
+        any fragments and the time taken, and where the arrays of each record
+        are in the block.
+    """
+    items, options, block = task
+    options = dict(options)
+    criteria = options.pop("filters", None)
+    kept = options.pop("fragments", "keep all")
+    salts = options.pop("salts", None)
+
+    notation = options.get("notation", "perceive")
+    texts = [text for _, text, _ in items]
+    if notation == "perceive":
+        notations = [perceive_notation(text) for text in texts]
+    else:
+        notations = [notation] * len(texts)
+
+    # Remove counterions and solvent before anything else looks at the SMILES.
+    if kept != "keep all":
+        texts = [
+            (
+                fragments.strip(text, kept, salts)
+                if kind in ("SMILES", "SMILES or name")
+                else text
+            )
+            for text, kind in zip(texts, notations)
+        ]
+
+    # Screen the whole chunk on the molecular graphs before embedding any of it.
+    if criteria:
+        rejected = filters.screen(texts, notations, criteria)
+    else:
+        rejected = [None] * len(items)
+
+    results = []
+    for (index, _, seed), text, reason in zip(items, texts, rejected):
+        if reason is not None:
+            results.append((index, StructureRecord(text, filtered=reason)))
+            continue
+        t0 = time.perf_counter()
+        try:
+            record = convert(text, seed=seed, **options)
+        except Exception as e:
+            record = StructureRecord(text, error=f"{type(e).__name__}: {e}")
+        record.time = time.perf_counter() - t0
+        results.append((index, record))
+    if block is not None:
+        return transport.pack(results, block)
+    return None, results, None
+
+
+def run(
+    texts,
+    options=None,
+    n_workers=1,
+    tasks_per_worker=None,
+    via="pickle",
+    max_pending=None,
+    seeds=None,
+    ordered=False,
+):
+    """Create the structures for a batch of line notations.
+
+    With more than one worker the batch is scheduled largest first by the cost
+    estimated from each string, and the results are returned as each chunk
+    finishes, not in the order of the input, unless they are to be ordered.
+
+    The caller is the single consumer of the finished structures, and is expected
+    to be the only writer to the database. The workers put finished chunks on a
+    queue and only a limited number of chunks are in flight at once, so if the
+    caller falls behind, the workers wait rather than piling up results in
+    memory.
+
+    Parameters
+    ----------
+    texts : [str]
+        The line notations.
+    options : dict(str, any) = None
+        The keyword arguments for convert(), such as the notation and flavor, and
+        optionally "fragments" and "salts", which fragments of SMILES to keep as
+        for fragments.strip(), and "filters", the criteria for dropping
+        structures before they are embedded, as for filters.screen().
+    n_workers : int = 1
+        The number of worker processes. With one, the structures are created in
+        this process, in order.
+    tasks_per_worker : int = None
+        The number of chunks each worker handles before it is replaced by a fresh
+        process, or None to keep the workers for the whole job.
+    via : str = "pickle"
+        How the workers return the structures: "pickle" or "shared memory". With
+        shared memory the arrays are views of the block from the worker, which is
+        released once they are no longer used.
+    max_pending : int = None
+        The maximum number of chunks submitted but not yet consumed. The default
+        is twice the number of workers.
+    seeds : [int or str] = None
+        The random seed for embedding each structure, or "from the structure" for
+        one from its canonical SMILES, which is the default, or None for a random
+        one.
+    ordered : bool = False
+        Whether to return the structures in the order of the input, holding back
+        any that finish before those ahead of them. Once reorder_window
+        structures are held back, no more chunks are started other than the one
+        with the next structure in order, so the memory used stays bounded.
+
+    Yields
+    ------
+    (int, StructureRecord)
+        The index of the structure in texts and its record.
+    """
+    if options is None:
+        options = {}
+    if seeds is None:
+        seeds = ["from the structure"] * len(texts)
+
+    if n_workers <= 1:
+        for index, (text, seed) in enumerate(zip(texts, seeds)):
+            _, results, _ = convert_chunk(([(index, text, seed)], options, None))
+            yield from results
+        return
+
+    if max_pending is None:
+        max_pending = 2 * n_workers
+
+    notation = options.get("notation", "perceive")
+    costs = [scheduler.estimate_cost(text, notation) for text in texts]
+    chunks = scheduler.schedule(costs, n_workers)
+    # The chunks not yet submitted, in the order of the schedule, and the chunk
+    # each structure is in.
+    waiting = dict.fromkeys(range(len(chunks)))
+    owner = [0] * len(texts)
+    for k, chunk in enumerate(chunks):
+        for i in chunk:
+            owner[i] = k
+
+    pool = get_pool(n_workers, tasks_per_worker)
+    finished = queue.Queue()
+    # The blocks of shared memory for the chunks submitted but not yet mapped
+    unclaimed = set()
+
+    def arrived(result):
+        # Track the block here until it is mapped, however the batch ends.
+        if not isinstance(result, BaseException) and result[0] is not None:
+            transport.track(result[0]["name"])
+        finished.put(result)
+
+    def submit(k):
+        del waiting[k]
+        block = None
+        if via == "shared memory":
+            block = transport.block_name()
+            unclaimed.add(block)
+        task = ([(i, texts[i], seeds[i]) for i in chunks[k]], options, block)
+        pool.apply_async(
+            convert_chunk,
+            (task,),
+            callback=arrived,
+            error_callback=finished.put,
+        )
+
+    # The structures that finished before those ahead of them, when ordered
+    held = {}
+    next_index = 0
+    try:
+        n_pending = 0
+        while True:
+            # Keep the workers busy while the structures are consumed, unless too
+            # many are held back, when only the chunk with the next one is sent.
+            while n_pending < max_pending and len(waiting) > 0:
+                if ordered and len(held) >= reorder_window:
+                    k = owner[next_index]
+                    if k not in waiting:
+                        break
+                else:
+                    k = next(iter(waiting))
+                submit(k)
+                n_pending += 1
+            if n_pending == 0:
+                break
+
+            result = finished.get()
+            n_pending -= 1
+            if isinstance(result, BaseException):
+                raise result
+
+            descriptor, results, extents = result
+            if descriptor is not None:
+                # When ordered, the structures may be held back, so they are
+                # copied and the block released at once.
+                arena = transport.Arena(descriptor)
+                unclaimed.discard(descriptor["name"])
+                for (index, record), extent in zip(results, extents):
+                    if extent is not None:
+                        arena.attach(record, extent, copy=ordered)
+                arena.close()
+            if not ordered:
+                yield from results
+                continue
+            held.update(results)
+            while next_index in held:
+                yield next_index, held.pop(next_index)
+                next_index += 1
+    except BaseException:
+        # Don't leave the rest of the batch running in the workers, or the blocks
+        # of shared memory they made behind.
+        shutdown_pool(terminate=True)
+        while not finished.empty():
+            finished.get_nowait()
+        for block in unclaimed:
+            transport.release(block)
+        raise
+
+
+def get_pool(n_workers, tasks_per_worker=None):
+    """The persistent pool of worker processes.
+
+    Starting the workers and initializing the toolkits in them is expensive, so
+    the pool is kept for the life of the job and reused by every batch and every
+    step that asks for the same number of workers. Each worker is replaced after
+    tasks_per_worker chunks to cap any growth in its memory.
+
+    Parameters
+    ----------
+    n_workers : int
+        The number of worker processes.
+    tasks_per_worker : int = None
+        The number of chunks each worker handles before it is replaced, or None
+        to never replace the workers.
+
+    Returns
+    -------
+    multiprocessing.pool.Pool
+        The pool of workers.
+    """
+    global _pool, _pool_key
+
+    key = (n_workers, tasks_per_worker)
+    if _pool is not None and _pool_key != key:
+        shutdown_pool()
+    if _pool is None:
+        logger.debug(f"Starting a pool of {n_workers} workers.")
+        # The workers must share this process's tracker for shared memory, since
+        # the blocks they create are released here.
+        resource_tracker.ensure_running()
+        _pool = _context().Pool(
+            n_workers,
+            initializer=_initialize_worker,
+            maxtasksperchild=tasks_per_worker,
+        )
+        _pool_key = key
+    return _pool
+
+
+def _context():
+    """The context for starting the workers.
+
+    The pool may be started, and its workers replaced, while this process has
+    threads writing files and an open connection to the database, which forked
+    children would inherit in whatever state they are in. So the workers are
+    forked from a clean server process, which imports the engine and toolkits
+    once, or are spawned where that is not available.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def shutdown_pool(terminate=False):
+    """Shut down the persistent pool of workers, if it is running.
+
+    Parameters
+    ----------
+    terminate : bool = False
+        Stop the workers at once rather than letting them finish their work.
+    """
+    global _pool, _pool_key
+
+    if _pool is not None:
+        if terminate:
+            _pool.terminate()
+        else:
+            _pool.close()
+        _pool.join()
+        _pool = None
+        _pool_key = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _initialize_worker():
+    """Initialize the toolkits once in each worker.
+
+    Open Babel loads its format plug-ins and RDKit sets up the embedding on first
+    use, so do that here rather than in the first task.
+    """
+    RDLogger.DisableLog("rdApp.*")
+    openbabel.obErrorLog.SetOutputLevel(0)
+    try:
+        convert("C", notation="SMILES", flavor="rdkit")
+        from_smiles("C", flavor="openbabel")
+    except Exception:
+        pass
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""Filter the structures in a batch before they are embedded.
+
+Embedding is by far the most expensive part of creating a structure, so
+molecules that are not wanted are dropped beforehand, using cheap descriptors of
+the molecular graph. The descriptors for a chunk of structures are collected in
+an array and compared with the limits all at once.
+"""
+
+import logging
+
+import numpy as np
+from rdkit import Chem
+from rdkit.Chem import Descriptors, rdMolDescriptors
+
+logger = logging.getLogger(__name__)
+
+# The descriptors that can be limited, in the order of the columns
+descriptors = ("heavy atoms", "molecular weight", "rotatable bonds", "ring size")
+
+
+def describe(mol):
+    """The descriptors of a molecule used for filtering.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, without coordinates.
+
+    Returns
+    -------
+    (int, float, int, int)
+        The number of heavy atoms, the molecular weight, the number of rotatable
+        bonds and the size of the largest ring.
+    """
+    rings = mol.GetRingInfo().AtomRings()
+    return (
+        mol.GetNumHeavyAtoms(),
+        Descriptors.MolWt(mol),
+        rdMolDescriptors.CalcNumRotatableBonds(mol),
+        max((len(ring) for ring in rings), default=0),
+    )
+
+
+def compile_smarts(patterns):
+    """Compile SMARTS patterns, checking that they are valid.
+
+    Parameters
+    ----------
+    patterns : [str]
+        The SMARTS patterns.
+
+    Returns
+    -------
+    [(str, rdkit.Chem.Mol)]
+        Each pattern and its compiled query.
+    """
+    result = []
+    for smarts in patterns:
+        pattern = Chem.MolFromSmarts(smarts)
+        if pattern is None:
+            raise ValueError(f"The SMARTS '{smarts}' is not valid.")
+        result.append((smarts, pattern))
+    return result
+
+
+def parse(text, notation):
+    """The molecular graph for a line notation, or None if RDKit can't read it.
+
+    Parameters
+    ----------
+    text : str
+        The line notation.
+    notation : str
+        The notation, as perceived.
+
+    Returns
+    -------
+    rdkit.Chem.Mol or None
+    """
+    if notation == "InChI":
+        return Chem.MolFromInchi(text)
+    if notation in ("SMILES", "SMILES or name"):
+        return Chem.MolFromSmiles(text)
+    return None
+
+
+def screen(texts, notations, criteria):
+    """Which of a chunk of line notations are rejected by the filters.
+
+    Structures that cannot be parsed here are not rejected, but left for the
+    engine to handle, or fail, as usual.
+
+    Parameters
+    ----------
+    texts : [str]
+        The line notations.
+    notations : [str]
+        The notation of each, as perceived.
+    criteria : dict(str, any)
+        The maximum for any of the descriptors, and "SMARTS", a list of SMARTS
+        patterns for substructures to exclude.
+
+    Returns
+    -------
+    [str or None]
+        Why each structure was rejected, or None if it was not.
+    """
+    limits = np.array(
+        [criteria.get(name, None) for name in descriptors], dtype=np.float64
+    )
+    limits[np.isnan(limits)] = np.inf
+    patterns = compile_smarts(criteria.get("SMARTS", []))
+
+    mols = [parse(text, notation) for text, notation in zip(texts, notations)]
+    values = np.full((len(mols), len(descriptors)), np.nan)
+    for i, mol in enumerate(mols):
+        if mol is not None:
+            values[i] = describe(mol)
+
+    # NaN, for structures not parsed, never exceeds a limit.
+    exceeds = values > limits
+    rejected = exceeds.any(axis=1)
+
+    reasons = []
+    for i, mol in enumerate(mols):
+        if rejected[i]:
+            column = int(np.argmax(exceeds[i]))
+            name = descriptors[column].capitalize()
+            reasons.append(
+                f"{name} = {values[i, column]:g}, over the limit of "
+                f"{limits[column]:g}."
+            )
+            continue
+        reason = None
+        if mol is not None:
+            for smarts, pattern in patterns:
+                if mol.HasSubstructMatch(pattern):
+                    reason = f"It matches the excluded SMARTS '{smarts}'."
+                    break
+        reasons.append(reason)
+    return reasons
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""Remove counterions, solvent and other small fragments from SMILES.
+
+SMILES from vendors often include counterions and solvent as separate,
+dot-separated fragments. Embedding them with the molecule makes the structure
+larger and the embedding more likely to fail, which then falls back to slower
+methods, so the unwanted fragments are removed from the SMILES first.
+"""
+
+import functools
+import logging
+
+from rdkit import Chem
+from rdkit.Chem.MolStandardize import rdMolStandardize
+
+logger = logging.getLogger(__name__)
+
+# The default salts and solvents that are removed, as SMILES
+default_salts = (
+    "[Li+] [Na+] [K+] [Mg+2] [Ca+2] [Zn+2] [NH4+] [F-] [Cl-] [Br-] [I-] [OH-] "
+    "O Cl Br I N OS(=O)(=O)O [O-]S(=O)(=O)O [O-]S(=O)(=O)[O-] CS(=O)(=O)O "
+    "CS(=O)(=O)[O-] [O-][N+](=O)[O-] O=[N+]([O-])O OP(=O)(O)O CC(=O)O CC(=O)[O-] "
+    "OC(=O)C(F)(F)F [O-]C(=O)C(F)(F)F OC(=O)C(=O)O OC(=O)/C=C\\C(=O)O "
+    "OC(=O)/C=C/C(=O)O CCO CO CC(C)=O CS(C)=O ClCCl ClC(Cl)Cl"
+)
+
+
+@functools.lru_cache(maxsize=8)
+def canonical_salts(salts):
+    """The canonical SMILES of the salts, for matching fragments.
+
+    Parameters
+    ----------
+    salts : (str,)
+        The SMILES of the salts and solvents.
+
+    Returns
+    -------
+    frozenset(str)
+        The canonical SMILES.
+    """
+    result = set()
+    for smiles in salts:
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None:
+            raise ValueError(f"The salt '{smiles}' is not a valid SMILES.")
+        result.add(Chem.MolToSmiles(mol))
+    return frozenset(result)
+
+
+def strip(text, fragments="keep all", salts=None):
+    """Remove unwanted fragments from a SMILES string.
+
+    Strings with a single fragment, or that RDKit cannot parse, such as names,
+    are returned unchanged, as are those where every fragment is a salt.
+
+    Parameters
+    ----------
+    text : str
+        The SMILES.
+    fragments : str = "keep all"
+        Which fragments to keep: "keep all", "remove salts", or
+        "keep the largest organic fragment".
+    salts : [str] = None
+        The SMILES of the salts and solvents to remove, defaulting to the
+        default_salts.
+
+    Returns
+    -------
+    str
+        The SMILES with only the fragments kept.
+    """
+    if fragments == "keep all" or "." not in text:
+        return text
+    mol = Chem.MolFromSmiles(text)
+    if mol is None:
+        return text
+    pieces = Chem.GetMolFrags(mol, asMols=True)
+    if len(pieces) == 1:
+        return text
+
+    if fragments == "keep the largest organic fragment":
+        chooser = rdMolStandardize.LargestFragmentChooser(preferOrganic=True)
+        return Chem.MolToSmiles(chooser.choose(mol))
+    elif fragments == "remove salts":
+        if salts is None:
+            salts = default_salts.split()
+        unwanted = canonical_salts(tuple(salts))
+        kept = [
+            smiles
+            for smiles in (Chem.MolToSmiles(piece) for piece in pieces)
+            if smiles not in unwanted
+        ]
+        if len(kept) == 0 or len(kept) == len(pieces):
+            return text
+        return ".".join(kept)
+    else:
+        raise ValueError(f"Can't handle fragments = '{fragments}'.")
@@ -2,14 +2,28 @@
 
 """a node to create a structure from a SMILES string"""
 
+import json
 import logging
+import os
 from pathlib import Path
 import shutil
 import string
 import subprocess
+import time
 import traceback
 
 import from_smiles_step
+from from_smiles_step import copies
+from from_smiles_step import engine
+from from_smiles_step import filters
+from from_smiles_step import fragments
+from from_smiles_step import packing
+from from_smiles_step.columnar import ColumnarWriter
+from from_smiles_step.record import StructureRecord
+from from_smiles_step.results import ResultsTable
+from from_smiles_step.shards import ShardedWriter
+from from_smiles_step.summary import BatchSummary
+from from_smiles_step.writer import StructureWriter, transaction
 import seamm
 import seamm_util.printing as printing
 from seamm_util.printing import FormattedText as __
@@ -18,6 +32,93 @@ logger = logging.getLogger(__name__)
 job = printing.getPrinter()
 printer = printing.getPrinter("from_smiles")
 
+# What is said about coordinates other than 3-D
+geometry_text = {
+    "2D": "Only the 2-D coordinates of a depiction will be created. ",
+    "none": "No coordinates will be created; all the atoms will be at the origin. ",
+    "deferred": (
+        "The coordinates will be deferred until the structures are embedded by a "
+        "later step. "
+    ),
+}
+
+# What is said about building polymers from their repeat unit
+polymer_text = (
+    "The chains will have {degree of polymerization} repeat units, with the end "
+    "groups '{head group}' and '{tail group}'. "
+)
+
+# What is said about removing fragments from SMILES
+fragments_text = {
+    "remove salts": "Any salts and solvents will be removed from the SMILES. ",
+    "keep the largest organic fragment": (
+        "Only the largest organic fragment of the SMILES will be kept. "
+    ),
+}
+
+# What is said about the quality of embedding
+embedding_text = "RDKit will use its {embedding quality} settings for embedding. "
+
+# What is said about several conformers
+conformers_text = (
+    "Up to {number of conformers} conformers of each molecule will be created. "
+)
+
+# What is said about reusing the coordinates of scaffolds
+scaffolds_text = (
+    "Molecules sharing a scaffold will be built from its coordinates, embedding "
+    "only their side chains. "
+)
+
+# What is said about assembling large molecules from their fragments
+assembly_text = (
+    "Molecules with more than {fragment assembly threshold} heavy atoms will be "
+    "assembled from separately embedded fragments. "
+)
+
+# What is said about the random seed, unless it is random
+seed_text = {
+    "from the structure": (
+        "Each molecule will be seeded from its canonical SMILES, so the "
+        "structures are reproducible. "
+    ),
+    "given": "The random seed {random seed} will be used. ",
+}
+
+# What is said about validating the structures
+validate_text = (
+    "The structures will be checked for unreasonable bond lengths and overlapping "
+    "atoms. "
+)
+
+# The parameters limiting the descriptors in the filters, and how they are described
+filter_names = {
+    "maximum heavy atoms": "heavy atoms",
+    "maximum molecular weight": "molecular weight",
+    "maximum rotatable bonds": "rotatable bonds",
+    "maximum ring size": "ring size",
+}
+filter_text = {
+    "maximum heavy atoms": "more than {maximum heavy atoms} heavy atoms",
+    "maximum molecular weight": (
+        "a molecular weight over {maximum molecular weight} g/mol"
+    ),
+    "maximum rotatable bonds": "more than {maximum rotatable bonds} rotatable bonds",
+    "maximum ring size": "rings larger than {maximum ring size} atoms",
+}
+
+# The property holding how to embed a structure whose coordinates were deferred
+recipe_property = "embedding recipe#FromSMILES"
+
+# The names that can be set from identifiers already known for a structure. The
+# isomeric SMILES in molsystem is the canonical SMILES with stereochemistry.
+identifier_names = {
+    "use Canonical SMILES string": "canonical SMILES",
+    "use isomeric SMILES string": "canonical SMILES",
+    "use InChI": "InChI",
+    "use InChIKey": "InChIKey",
+}
+
 
 class FromSMILES(seamm.Node):
     def __init__(self, flowchart=None, extension=None):
@@ -59,6 +160,83 @@ class FromSMILES(seamm.Node):
         if not P:
             P = self.parameters.values_to_dict()
 
+        if P["action"] == "embed deferred structures":
+            text = (
+                "Embed in 3-D all the structures in the database whose coordinates "
+                "were deferred when they were created"
+            )
+            if str(P["number of workers"]) != "1":
+                text += ", using {number of workers} workers"
+            text += "."
+            return self.header + "\n" + __(text, **P, indent=4 * " ").__str__()
+
+        if P["smiles file"] != "":
+            if P["notation"] == "perceive":
+                text = (
+                    "Perceive the line notation (SMILES, InChI,...) of each line in "
+                    "the file '{smiles file}' and create the structures. "
+                )
+            else:
+                text = (
+                    "Create the structures from the {notation} on each line of the "
+                    "file '{smiles file}'. "
+                )
+            if str(P["number of workers"]) != "1":
+                text += (
+                    "The structures will be created in parallel using "
+                    "{number of workers} workers. "
+                )
+            if P["notation"] == "repeat unit":
+                text += polymer_text
+            if P["fragments"] in fragments_text:
+                text += fragments_text[P["fragments"]]
+            if P["geometry"] == "3D" and P["embedding quality"] != "standard":
+                text += embedding_text
+            if P["geometry"] == "3D" and str(P["number of conformers"]) != "1":
+                text += conformers_text
+            elif P["geometry"] == "3D":
+                if P["reuse scaffolds"] == "yes":
+                    text += scaffolds_text
+                if P["fragment assembly threshold"] != "never":
+                    text += assembly_text
+            if P["random seed"] != "random":
+                text += seed_text.get(P["random seed"], seed_text["given"])
+            if P["validate structures"] == "yes" and P["geometry"] == "3D":
+                text += validate_text
+            limits = [
+                phrase for key, phrase in filter_text.items() if P[key] != "no limit"
+            ]
+            if len(limits) > 0:
+                text += (
+                    "Structures with " + " or ".join(limits) + " will be dropped "
+                    "before they are embedded. "
+                )
+            if P["excluded SMARTS"] != "":
+                text += (
+                    "Structures matching any of the SMARTS '{excluded SMARTS}' will "
+                    "be dropped before they are embedded. "
+                )
+            if P["batch output"] != "database":
+                text += (
+                    "The structures will be written to the columnar store "
+                    "'{columnar store}'. "
+                )
+            if P["structure files"] != "none":
+                text += (
+                    "The structures will also be written to {number of shards} "
+                    "{structure files} files in '{structure files directory}'. "
+                )
+            if P["results table"] != "none":
+                text += "A table of the results will be written as {results table}. "
+            if P["batch output"] != "columnar store":
+                text += (
+                    seamm.standard_parameters.multiple_structure_handling_description(P)
+                )
+            if P["geometry"] in geometry_text:
+                text += " " + geometry_text[P["geometry"]]
+
+            return self.header + "\n" + __(text, **P, indent=4 * " ").__str__()
+
         if P["notation"] == "perceive":
             if P["smiles string"][0] == "$":
                 text = (
@@ -79,7 +257,34 @@ class FromSMILES(seamm.Node):
             else:
                 text = "Create the structure from the {notation} '{smiles string}', "
 
+        if P["arrangement"] == "packed in a periodic cell":
+            if P["mixture composition"] == "equal":
+                text += "with {number of copies} copies of each molecule "
+            else:
+                text += (
+                    "with {number of copies} times '{mixture composition}' copies of "
+                    "the molecules "
+                )
+            text += "packed into a periodic cell at a density of {density} g/mL, "
+        elif str(P["number of copies"]) != "1":
+            text += "with {number of copies} copies of the molecule, "
         text += seamm.standard_parameters.structure_handling_description(P)
+        if P["notation"] == "repeat unit":
+            text += " " + polymer_text.rstrip()
+        if P["fragments"] in fragments_text:
+            text += " " + fragments_text[P["fragments"]].rstrip()
+        if P["geometry"] == "3D" and P["embedding quality"] != "standard":
+            text += " " + embedding_text.rstrip()
+        if P["geometry"] == "3D" and str(P["number of conformers"]) != "1":
+            text += " " + conformers_text.rstrip()
+        elif P["geometry"] == "3D" and P["fragment assembly threshold"] != "never":
+            text += " " + assembly_text.rstrip()
+        if P["random seed"] != "random":
+            text += " " + seed_text.get(P["random seed"], seed_text["given"]).rstrip()
+        if P["validate structures"] == "yes" and P["geometry"] == "3D":
+            text += " " + validate_text.rstrip()
+        if P["geometry"] in geometry_text:
+            text += " " + geometry_text[P["geometry"]]
 
         return self.header + "\n" + __(text, **P, indent=4 * " ").__str__()
 
@@ -93,14 +298,101 @@ class FromSMILES(seamm.Node):
             context=seamm.flowchart_variables._data
         )
 
-        # Print what we are doing
-        printer.important(self.description_text(P))
+        embed = P["action"] == "embed deferred structures"
+        items = None if embed else self.batch_items(P)
+
+        # Print what we are doing, unless it would be repeated for every structure
+        once = embed or items is not None
+        if P["output"] == "full" or (once and P["output"] != "quiet"):
+            printer.important(self.description_text(P))
 
-        if P["smiles string"] is None or P["smiles string"] == "":
+        if embed:
+            self.run_embed(P)
+        elif items is not None:
+            self.run_batch(P, items)
+        elif P["smiles string"] is None or P["smiles string"] == "":
             return None
+        else:
+            self.run_single(P)
+
+        # Add the citations for Open Babel
+        self.references.cite(
+            raw=self._bibliography["openbabel"],
+            alias="openbabel_jcinf",
+            module="from_smiles_step",
+            level=1,
+            note="The principle Open Babel citation.",
+        )
+
+        # See if we can get the version of obabel
+        path = shutil.which("obabel")
+        if path is not None:
+            path = Path(path).expanduser().resolve()
+            try:
+                result = subprocess.run(
+                    [str(path), "--version"],
+                    stdin=subprocess.DEVNULL,
+                    capture_output=True,
+                    text=True,
+                )
+            except Exception:
+                version = "unknown"
+            else:
+                version = "unknown"
+                lines = result.stdout.splitlines()
+                for line in lines:
+                    line = line.strip()
+                    tmp = line.split()
+                    if len(tmp) == 9 and tmp[0] == "Open":
+                        version = tmp[2]
+                        month = tmp[4]
+                        year = tmp[6]
+                        break
+
+            if version != "unknown":
+                try:
+                    template = string.Template(self._bibliography["obabel"])
+
+                    citation = template.substitute(
+                        month=month, version=version, year=year
+                    )
+
+                    self.references.cite(
+                        raw=citation,
+                        alias="obabel-exe",
+                        module="from_smiles_step",
+                        level=1,
+                        note="The principle citation for the Open Babel executables.",
+                    )
+
+                except Exception as e:
+                    printer.important(f"Exception in citation {type(e)}: {e}")
+                    printer.important(traceback.format_exc())
+
+        return next_node
 
+    def run_single(self, P):
+        """Create the structure for a single line notation.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+        """
         notation = P["notation"]
         flavor = P["smiles flavor"]
+        n_copies = P["number of copies"]
+        packed = P["arrangement"] == "packed in a periodic cell"
+        if n_copies > 1 and P["geometry"] == "deferred":
+            raise RuntimeError(
+                "Copies can't be made of a structure whose coordinates are deferred."
+            )
+        if packed and P["geometry"] != "3D":
+            raise RuntimeError("Only 3-D structures can be packed into a cell.")
+        counts = self.mixture_counts(P) if packed else n_copies
+        self.check_conformers(P)
+        if n_copies > 1 and P["number of conformers"] > 1:
+            raise RuntimeError("Copies can't be made of several conformers.")
 
         # Get the system
         system, configuration = self.get_system_configuration(P, same_as=None)
@@ -112,19 +404,827 @@ class FromSMILES(seamm.Node):
         perceived = False
         if notation == "perceive":
             perceived = True
-            tmp = text.split("-")
-            if (
-                len(text) == 27
-                and len(tmp) == 3
-                and len(tmp[0]) == 14
-                and len(tmp[1]) == 10
-            ):
-                notation = "InChIKey"
-            elif text[0:7] == "InChI=":
-                notation = "InChI"
+            notation = engine.perceive_notation(text)
+
+        # Remove any counterions and solvent
+        if notation in ("SMILES", "SMILES or name"):
+            text = fragments.strip(text, P["fragments"], P["salts"].split())
+
+        # Without 3-D coordinates, for RDKit when the embedding is controlled or
+        # there are several fragments to embed separately, or to validate the
+        # structure, use the engine, and fall back to the full handling, including
+        # PubChem, for what it cannot do. Only the engine can build polymers.
+        validate = P["validate structures"] == "yes"
+        seed = self.random_seed(P)
+        # The identifiers are only needed for the names, or for a seed for the
+        # copies from the canonical SMILES.
+        copying = packed or n_copies > 1
+        identifiers = self.names_need_identifiers(P) or (
+            copying and seed == "from the structure"
+        )
+        controlled = flavor == "rdkit" and (
+            "." in text or not self.standard_embedding(P)
+        )
+        record = None
+        if notation == "repeat unit" or (
+            (P["geometry"] != "3D" or controlled or validate)
+            and notation in ("SMILES", "SMILES or name", "InChI")
+            and flavor in ("rdkit", "openbabel")
+        ):
+            try:
+                record = engine.convert(
+                    text,
+                    notation,
+                    flavor,
+                    identifiers=identifiers,
+                    geometry=P["geometry"],
+                    seed=seed,
+                    validate=validate,
+                    embedding=self.embedding_settings(P),
+                    polymer=self.polymer_options(P),
+                )
+            except Exception as e:
+                if notation == "repeat unit":
+                    raise
+                logger.info(f"Using the full handling for '{text}': {e}")
+        if record is None:
+            notation, flavor = self.create_structure(
+                configuration, text, notation, flavor
+            )
+            self.check_configuration(configuration, P)
+            known = {notation: text} if notation in ("InChI", "InChIKey") else None
+        else:
+            record.to_configuration(configuration)
+            if P["geometry"] == "deferred":
+                self.store_recipe(configuration, record)
+            notation = record.notation
+            flavor = record.flavor
+            known = record.identifiers
+
+        # Now set the names of the system and configuration, as appropriate.
+        self.set_names(system, configuration, P, first=True, known=known)
+        n_conformers = 1
+        if record is not None:
+            n_conformers += len(self.add_conformers(configuration, record))
+
+        # Replace the molecule with copies of it, keeping the names of the molecule
+        if copying and seed == "from the structure":
+            if record is None or record.canonical_smiles is None:
+                seed = engine.smiles_seed(configuration.canonical_smiles)
+            else:
+                seed = engine.smiles_seed(record.canonical_smiles)
+        if packed:
+            molecule = StructureRecord.from_configuration(configuration, text)
+            packing.pack(
+                molecule,
+                counts,
+                P["density"],
+                min_distance=P["minimum distance"],
+                seed=seed,
+            ).to_configuration(configuration)
+        elif n_copies > 1:
+            molecule = StructureRecord.from_configuration(configuration, text)
+            copies.replicate(
+                molecule,
+                n_copies,
+                rotate=P["geometry"] == "3D",
+                seed=seed,
+            ).to_configuration(configuration)
+
+        # Finish the output
+        if P["output"] == "quiet":
+            return
+        if P["output"] == "summary":
+            how = f"SMILES using {flavor}" if notation == "SMILES" else notation
+            printer.important(
+                f"    {text}: {configuration.n_atoms} atoms from the {how}, named "
+                f"'{system.name}' / '{configuration.name}'"
+            )
+            return
+        if perceived:
+            if notation == "SMILES":
+                printer.important(
+                    __(
+                        "\n    Created a molecular structure with "
+                        f"{configuration.n_atoms} atoms from the perceived notation "
+                        f"{notation} using {flavor}.",
+                        indent=4 * " ",
+                    )
+                )
+            else:
+                printer.important(
+                    __(
+                        "\n    Created a molecular structure with "
+                        f"{configuration.n_atoms} atoms from the perceived notation "
+                        f"{notation}.",
+                        indent=4 * " ",
+                    )
+                )
+        else:
+            if notation == "SMILES":
+                printer.important(
+                    __(
+                        "\n    Created a molecular structure with "
+                        f"{configuration.n_atoms} atoms from the notation "
+                        f"{notation} using {flavor}.",
+                        indent=4 * " ",
+                    )
+                )
+            else:
+                printer.important(
+                    __(
+                        "\n    Created a molecular structure with "
+                        f"{configuration.n_atoms} atoms from the notation "
+                        f"{notation}.",
+                        indent=4 * " ",
+                    )
+                )
+        if n_conformers > 1:
+            printer.important(
+                f"\n    Created {n_conformers} conformers, as configurations of the "
+                "system."
+            )
+        if (
+            self.random_seed(P) is not None
+            and flavor == "openbabel"
+            and P["geometry"] == "3D"
+        ):
+            printer.important(
+                "\n    Open Babel can't be seeded, so the structure is not "
+                "reproducible."
+            )
+        if packed:
+            a = configuration.cell.a
+            if isinstance(counts, int):
+                how_many = f"{counts} copies of the {molecule.n_atoms} atoms"
             else:
-                notation = "SMILES or name"
+                how_many = (
+                    " + ".join(str(n) for n in counts)
+                    + f" copies of the molecules in the {molecule.n_atoms} atoms"
+                )
+            printer.important(
+                __(
+                    f"\n    Packed {how_many} "
+                    f"into a periodic cell {a:.2f} Å on a side, at a density of "
+                    f"{configuration.density:.3f} g/mL.",
+                    indent=4 * " ",
+                )
+            )
+        elif n_copies > 1:
+            printer.important(
+                __(
+                    f"\n    The configuration holds {n_copies} copies of the "
+                    f"molecule, with {molecule.n_atoms} atoms each.",
+                    indent=4 * " ",
+                )
+            )
+        printer.important(
+            __(
+                f"\n           System name = {system.name}"
+                f"\n    Configuration name = {configuration.name}",
+                indent=4 * " ",
+            )
+        )
+        printer.important("")
+
+    def batch_items(self, P):
+        """The structures to create if this is a batch, or None if not.
+
+        A batch is given either as a file with one structure per line, optionally
+        followed by an identifier, or as a variable holding a list of strings.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+
+        Returns
+        -------
+        [(str, str)] or None
+            The line notation and an identifier for each structure.
+        """
+        if P["smiles file"] != "":
+            items = []
+            path = Path(P["smiles file"]).expanduser()
+            with open(path) as fd:
+                for lineno, line in enumerate(fd, start=1):
+                    line = line.strip()
+                    if line == "" or line[0] == "#":
+                        continue
+                    # Names may contain spaces, so use the whole line
+                    if P["notation"] == "name":
+                        items.append((line, str(lineno)))
+                    else:
+                        tmp = line.split(maxsplit=1)
+                        identifier = tmp[1] if len(tmp) > 1 else str(lineno)
+                        items.append((tmp[0], identifier))
+            return items
+        if isinstance(P["smiles string"], (list, tuple)):
+            return [(str(text), str(i)) for i, text in enumerate(P["smiles string"], 1)]
+        return None
+
+    def run_batch(self, P, items):
+        """Create the structures for a batch of line notations.
+
+        The structures are created in parallel by the engine and written, in the
+        order of the input, to the system database in transactions, to a
+        columnar store, or both, and optionally to sharded structure files and a
+        table of the results. Any that the workers could not create are tried
+        again with the full set of fallbacks, including PubChem, when writing to
+        the database.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+        items : [(str, str)]
+            The line notation and an identifier for each structure.
+        """
+        self.check_conformers(P)
+        n_workers, tasks_per_worker = self.workers(P)
+
+        t0 = time.time()
+        output = P["batch output"]
+        summary = BatchSummary()
+        table = None
+        if P["results table"] != "none":
+            table = ResultsTable(
+                Path(self.directory) / "results", file_format=P["results table"]
+            )
+        reports = [summary] if table is None else [summary, table]
+        writers = []
+        writer = None
+        if output != "columnar store":
+            # The summary and table follow the fallbacks in the database writer.
+            writer = StructureWriter(
+                self,
+                P,
+                flush_size=P["structures per transaction"],
+                verbose=P["output"] == "full",
+                reports=reports,
+            )
+            writers.append(writer)
+        store = None
+        if output != "database":
+            store = ColumnarWriter(Path(self.directory) / P["columnar store"])
+            writers.append(store)
+        shards = None
+        if P["structure files"] != "none":
+            shards = ShardedWriter(
+                Path(self.directory) / P["structure files directory"],
+                file_format=P["structure files"],
+                n_shards=P["number of shards"],
+                compression=P["compression"],
+                shard_by=P["shard by"],
+            )
+            writers.append(shards)
+
+        salts = P["salts"].split()
+        if P["fragments"] == "remove salts":
+            # Check the salts here rather than failing in the workers.
+            fragments.canonical_salts(tuple(salts))
+
+        failed = []
+        texts = [text for text, _ in items]
+        # Pass the seed even if random, so that the engine's default does not apply.
+        seeds = [self.random_seed(P)] * len(texts)
+        results = engine.run(
+            texts,
+            {
+                "notation": P["notation"],
+                "flavor": P["smiles flavor"],
+                "geometry": P["geometry"],
+                "validate": P["validate structures"] == "yes",
+                "identifiers": table is not None
+                or (writer is not None and self.names_need_identifiers(P)),
+                "fragments": P["fragments"],
+                "salts": salts,
+                "filters": self.filter_criteria(P),
+                "embedding": self.embedding_settings(P),
+                "polymer": self.polymer_options(P),
+            },
+            n_workers=n_workers,
+            tasks_per_worker=tasks_per_worker,
+            via=P["worker transport"],
+            seeds=seeds,
+            ordered=True,
+        )
+        # Whatever happens, stop the workers and finish every output, so that
+        # what was written is complete and readable.
+        if writer is None:
+            writers.extend(reports)
+        try:
+            for index, record in results:
+                record.input, record.identifier = items[index]
+                if record.failed:
+                    failed.append((record.identifier, record.text, record.error))
+                for output_writer in writers:
+                    output_writer.add(record)
+        finally:
+            results.close()
+            # The database writer passes its last structures on as it closes.
+            self.close_writers(writers if writer is None else writers + reports)
+
+        # The database writer retries the failures with the full fallbacks.
+        if writer is None:
+            n_created = store.n_molecules
+        else:
+            n_created = writer.n_created
+            failed = writer.failed
+
+        t = time.time() - t0
+        if P["output"] == "quiet":
+            if len(failed) > 0:
+                printer.important(
+                    f"    {len(failed)} of {len(items)} structures could not be "
+                    "created: " + ", ".join(identifier for identifier, _, _ in failed)
+                )
+            return
 
+        printer.important(
+            __(
+                f"\n    Created {n_created} of {len(items)} structures in "
+                f"{t:.1f} s using {n_workers} workers.",
+                indent=4 * " ",
+            )
+        )
+        printer.important("")
+        printer.important(summary.report(t, indent=8 * " "))
+        printer.important("")
+        if store is not None:
+            printer.important(
+                f"    Wrote {store.n_molecules} structures to the columnar store "
+                f"in {store.path}."
+            )
+        if shards is not None:
+            printer.important(
+                f"    Wrote {shards.n_written} structures to "
+                f"{P['number of shards']} {P['structure files']} files in "
+                f"{shards.path}."
+            )
+        if table is not None:
+            printer.important(
+                f"    Wrote the results for {table.n_rows} structures to {table.path}."
+            )
+        if len(failed) > 0:
+            printer.important("\n    These structures could not be created:")
+            for identifier, text, message in failed:
+                printer.important(f"        {identifier}: '{text}' -- {message}")
+        printer.important("")
+
+    def close_writers(self, writers):
+        """Close all the writers for a batch, even if some of them fail.
+
+        Parameters
+        ----------
+        writers : [object]
+            The writers, each with a close() method.
+
+        Raises
+        ------
+        Exception
+            The first error closing a writer, once all have been closed.
+        """
+        error = None
+        for output_writer in writers:
+            try:
+                output_writer.close()
+            except Exception as e:
+                logger.error(f"Error closing the {type(output_writer).__name__}: {e}")
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+
+    def run_embed(self, P):
+        """Embed the structures whose coordinates were deferred.
+
+        Every configuration in the database with a recipe that has not yet been
+        embedded is embedded in 3-D by the engine, with the toolkit and seed in the
+        recipe, and its coordinates replaced. Nothing else about the configuration
+        changes, though any further conformers are added to the system.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+        """
+        system_db = self.get_variable("_system_db")
+        properties = system_db.properties
+
+        deferred = {}
+        if properties.exists(recipe_property):
+            pid = properties.id(recipe_property)
+            for cid, value in system_db.cursor.execute(
+                "SELECT configuration, value FROM json_data WHERE property = ?", (pid,)
+            ):
+                recipe = json.loads(value)
+                if not recipe["embedded"]:
+                    key = (recipe["notation"], recipe["flavor"])
+                    deferred.setdefault(key, []).append((cid, recipe))
+
+        n_workers, tasks_per_worker = self.workers(P)
+        flush_size = max(P["structures per transaction"], 1)
+        n_deferred = sum(len(v) for v in deferred.values())
+        n_embedded = 0
+        failed = []
+
+        def flush(pending):
+            nonlocal n_embedded
+            with transaction(system_db.db):
+                for cid, recipe, record in pending:
+                    configuration = system_db.get_configuration(cid)
+                    if configuration.atoms.atomic_numbers != record.atno.tolist():
+                        failed.append(
+                            (cid, recipe["text"], "The atoms do not match the recipe.")
+                        )
+                        continue
+                    configuration.atoms.set_coordinates(record.coordinates.tolist())
+                    recipe["embedded"] = True
+                    configuration.properties.put(recipe_property, recipe)
+                    self.add_conformers(configuration, record)
+                    n_embedded += 1
+
+        t0 = time.time()
+        for (notation, flavor), members in deferred.items():
+            pending = []
+            for index, record in engine.run(
+                [recipe["text"] for _, recipe in members],
+                {
+                    "notation": notation,
+                    "flavor": flavor,
+                    "validate": P["validate structures"] == "yes",
+                    "embedding": self.embedding_settings(P),
+                },
+                n_workers=n_workers,
+                tasks_per_worker=tasks_per_worker,
+                via=P["worker transport"],
+                seeds=[recipe["seed"] for _, recipe in members],
+            ):
+                cid, recipe = members[index]
+                if record.failed:
+                    failed.append((cid, recipe["text"], record.error))
+                    continue
+                pending.append((cid, recipe, record))
+                if len(pending) >= flush_size:
+                    flush(pending)
+                    pending = []
+            flush(pending)
+        t = time.time() - t0
+
+        if P["output"] != "quiet":
+            printer.important(
+                __(
+                    f"\n    Embedded {n_embedded} of {n_deferred} deferred structures "
+                    f"in {t:.1f} s using {n_workers} workers.",
+                    indent=4 * " ",
+                )
+            )
+        if len(failed) > 0:
+            printer.important("\n    These structures could not be embedded:")
+            for cid, text, message in failed:
+                printer.important(f"        configuration {cid}: '{text}' -- {message}")
+        if P["output"] != "quiet" or len(failed) > 0:
+            printer.important("")
+
+    def workers(self, P):
+        """The number of workers, and tasks for each before it is replaced.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+
+        Returns
+        -------
+        int, int or None
+            The number of workers and the number of tasks per worker, or None to
+            never replace them.
+        """
+        n_workers = P["number of workers"]
+        if n_workers == "all":
+            n_workers = os.cpu_count()
+        tasks_per_worker = P["tasks per worker"]
+        if tasks_per_worker == "unlimited":
+            tasks_per_worker = None
+        return n_workers, tasks_per_worker
+
+    def store_recipe(self, configuration, record):
+        """Keep how to embed a structure whose coordinates were deferred.
+
+        Parameters
+        ----------
+        configuration : molsystem._Configuration
+            The configuration holding the structure.
+        record : StructureRecord
+            The record the structure was created from.
+        """
+        properties = configuration.properties
+        if not properties.exists(recipe_property):
+            properties.add(
+                recipe_property,
+                "json",
+                description="How to embed a structure whose coordinates were deferred",
+            )
+        properties.put(
+            recipe_property,
+            {
+                "text": record.text,
+                "notation": record.notation,
+                "flavor": record.flavor,
+                "seed": record.seed,
+                "embedded": False,
+            },
+        )
+
+    def embedding_settings(self, P):
+        """The settings for embedding structures in 3-D with RDKit.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+
+        Returns
+        -------
+        dict(str, any)
+            The settings, as from engine.embedding_settings().
+        """
+        max_iterations = P["maximum iterations"]
+        cleanup = P["force field cleanup"]
+        threads = P["number of threads"]
+        rms = P["conformer RMSD threshold"]
+        threshold = P["fragment assembly threshold"]
+        return engine.embedding_settings(
+            P["embedding quality"],
+            max_iterations=None if max_iterations == "default" else max_iterations,
+            force_field=None if cleanup == "default" else cleanup == "yes",
+            threads=0 if threads == "all" else threads,
+            n_conformers=max(P["number of conformers"], 1),
+            prune_rms=None if rms == "none" else rms,
+            scaffolds=P["reuse scaffolds"] == "yes",
+            assembly_atoms=None if threshold == "never" else threshold,
+        )
+
+    def standard_embedding(self, P):
+        """Whether RDKit embeds a single conformer with its standard settings.
+
+        This is how the full structure handling embeds a structure, so the engine
+        is not needed.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+
+        Returns
+        -------
+        bool
+        """
+        settings = self.embedding_settings(P)
+        # The threads and pruning only matter for several conformers.
+        standard = engine.embedding_settings(
+            threads=settings["threads"], prune_rms=settings["prune rms"]
+        )
+        return settings == standard and self.random_seed(P) is None
+
+    def polymer_options(self, P):
+        """The options for building polymers from their repeat unit.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+
+        Returns
+        -------
+        dict(str, any) or None
+            The degree of polymerization and end groups, as for
+            engine.build_polymer(), or None unless the notation is "repeat unit".
+        """
+        if P["notation"] != "repeat unit":
+            return None
+        return {
+            "degree": P["degree of polymerization"],
+            "head": P["head group"],
+            "tail": P["tail group"],
+        }
+
+    def add_conformers(self, configuration, record):
+        """Add any further conformers in a record as configurations of the system.
+
+        The new configurations share the atoms and bonds of the first, and are
+        named after it.
+
+        Parameters
+        ----------
+        configuration : molsystem._Configuration
+            The configuration holding the first conformer.
+        record : StructureRecord
+            The record the structure was created from.
+
+        Returns
+        -------
+        [molsystem._Configuration]
+            The configurations added.
+        """
+        if record.conformers is None:
+            return []
+        system = configuration.system
+        result = []
+        for k, xyz in enumerate(record.conformers[1:], start=2):
+            new = system.copy_configuration(
+                configuration, name=f"{configuration.name}, conformer {k}"
+            )
+            new.atoms.set_coordinates(xyz.tolist())
+            result.append(new)
+        return result
+
+    def check_conformers(self, P):
+        """Check that several conformers can be created with the parameters.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+        """
+        if P["number of conformers"] <= 1:
+            return
+        if P["geometry"] != "3D":
+            raise RuntimeError("Several conformers can only be created in 3-D.")
+        if P["notation"] == "repeat unit":
+            raise RuntimeError("Only one conformer of a polymer can be created.")
+        if P["smiles flavor"] != "rdkit" and P["notation"] != "InChI":
+            raise RuntimeError("Only RDKit can create several conformers.")
+
+    def filter_criteria(self, P):
+        """The criteria for dropping structures in a batch before embedding.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+
+        Returns
+        -------
+        dict(str, any) or None
+            The limits on the descriptors and the excluded SMARTS, as for
+            filters.screen(), or None if there are none.
+        """
+        criteria = {}
+        for key, name in filter_names.items():
+            if P[key] != "no limit":
+                criteria[name] = P[key]
+        patterns = P["excluded SMARTS"].split()
+        if len(patterns) > 0:
+            # Check the patterns here rather than failing in the workers.
+            filters.compile_smarts(patterns)
+            criteria["SMARTS"] = patterns
+        return criteria if len(criteria) > 0 else None
+
+    def mixture_counts(self, P):
+        """The number of copies of each molecule to pack into a cell.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+
+        Returns
+        -------
+        int or [int]
+            The number of copies of each molecule, or the numbers of each in
+            turn for a mixture of a given composition.
+        """
+        n_copies = P["number of copies"]
+        composition = P["mixture composition"]
+        if composition == "equal":
+            return n_copies
+        try:
+            counts = [int(n) for n in composition.split()]
+        except ValueError:
+            counts = []
+        if len(counts) == 0 or min(counts) < 1:
+            raise ValueError(
+                f"The mixture composition '{composition}' should be positive whole "
+                "numbers, one for each molecule."
+            )
+        return [n_copies * n for n in counts]
+
+    def random_seed(self, P):
+        """The random seed for embedding, or None for a random one.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+
+        Returns
+        -------
+        int, str or None
+            The seed, "from the structure" for one from the canonical SMILES of
+            each molecule, or None.
+        """
+        seed = P["random seed"]
+        return None if seed == "random" else seed
+
+    def names_need_identifiers(self, P):
+        """Whether the names use identifiers that the workers could compute.
+
+        Parameters
+        ----------
+        P : dict(str, any)
+            The current values of the parameters.
+
+        Returns
+        -------
+        bool
+        """
+        return (
+            P["system name"] in identifier_names
+            or P["configuration name"] in identifier_names
+        )
+
+    def set_names(self, system, configuration, P, first=True, known=None, **kwargs):
+        """Set the names of the system and configuration.
+
+        Names that are identifiers already known for the structure, such as the
+        canonical SMILES computed when it was created, are set directly rather
+        than computed again from the configuration. The rest are left to the
+        standard handling in SEAMM.
+
+        Parameters
+        ----------
+        system : molsystem._System
+            The system being named.
+        configuration : molsystem._Configuration
+            The configuration being named.
+        P : dict(str, any)
+            The current values of the parameters.
+        first : bool = True
+            Whether this is the first or a subsequent structure.
+        known : dict(str, str) = None
+            The known identifiers, keyed by "canonical SMILES", "InChI" or
+            "InChIKey".
+        kwargs : {str: str}
+            Values that may be substituted in the names.
+
+        Returns
+        -------
+        str
+            The text for printing.
+        """
+        if known and P["structure handling"] != "Discard the structure":
+            P = dict(P)
+            for key, item in (
+                ("system name", system),
+                ("configuration name", configuration),
+            ):
+                value = known.get(identifier_names.get(P[key]))
+                if value:
+                    item.name = value
+                    P[key] = "keep current name"
+        return seamm.standard_parameters.set_names(
+            system, configuration, P, _first=first, **kwargs
+        )
+
+    def check_configuration(self, configuration, P):
+        """Raise an error if validating and the structure is not sensible.
+
+        Parameters
+        ----------
+        configuration : molsystem._Configuration
+            The configuration holding the structure.
+        P : dict(str, any)
+            The current values of the parameters.
+        """
+        if P["validate structures"] != "yes" or P["geometry"] != "3D":
+            return
+        engine.check_structure(StructureRecord.from_configuration(configuration))
+
+    def create_structure(self, configuration, text, notation, flavor):
+        """Create a structure in a configuration from its line notation.
+
+        Each notation falls back on other ways of creating the structure, such as
+        PubChem or Open Babel, if the first does not work. The flavor returned is
+        "PUBCHEM" for any structure that came from PubChem.
+
+        Parameters
+        ----------
+        configuration : molsystem._Configuration
+            The configuration to hold the structure.
+        text : str
+            The line notation.
+        notation : str
+            The notation of the text, which must not be "perceive".
+        flavor : str
+            The toolkit to use for SMILES.
+
+        Returns
+        -------
+        (str, str)
+            The notation and flavor actually used.
+        """
         if notation == "SMILES":
             try:
                 configuration.from_smiles(text, flavor=flavor)
@@ -156,6 +1256,7 @@ class FromSMILES(seamm.Node):
         elif notation == "InChIKey":
             try:
                 configuration.from_inchikey(text)
+                flavor = "PUBCHEM"
             except Exception:
                 raise RuntimeError(
                     f"Can not create a structure from the string '{text}'"
@@ -164,6 +1265,7 @@ class FromSMILES(seamm.Node):
         elif notation == "name":
             try:
                 configuration.PC_from_identifier(text, namespace="name")
+                flavor = "PUBCHEM"
             except Exception:
                 raise RuntimeError(
                     f"Can not create a structure from the string '{text}'"
@@ -176,10 +1278,12 @@ class FromSMILES(seamm.Node):
                 try:
                     configuration.PC_from_identifier(text, namespace="name")
                     notation = "name"
+                    flavor = "PUBCHEM"
                 except Exception:
                     try:
                         configuration.PC_from_identifier(text, namespace="smiles")
                         notation = "SMILES"
+                        flavor = "PUBCHEM"
                     except Exception:
                         # If using rdkit, try openbabel since it is more robust
                         if flavor == "rdkit":
@@ -194,109 +1298,4 @@ class FromSMILES(seamm.Node):
         else:
             raise RuntimeError(f"Can not handle line notation '{text}'")
 
-        # Now set the names of the system and configuration, as appropriate.
-        seamm.standard_parameters.set_names(system, configuration, P, _first=True)
-
-        # Finish the output
-        if perceived:
-            if notation == "SMILES":
-                printer.important(
-                    __(
-                        "\n    Created a molecular structure with "
-                        f"{configuration.n_atoms} atoms from the perceived notation "
-                        f"{notation} using {flavor}.",
-                        indent=4 * " ",
-                    )
-                )
-            else:
-                printer.important(
-                    __(
-                        "\n    Created a molecular structure with "
-                        f"{configuration.n_atoms} atoms from the perceived notation "
-                        f"{notation}.",
-                        indent=4 * " ",
-                    )
-                )
-        else:
-            if notation == "SMILES":
-                printer.important(
-                    __(
-                        "\n    Created a molecular structure with "
-                        f"{configuration.n_atoms} atoms from the notation "
-                        f"{notation} using {flavor}.",
-                        indent=4 * " ",
-                    )
-                )
-            else:
-                printer.important(
-                    __(
-                        "\n    Created a molecular structure with "
-                        f"{configuration.n_atoms} atoms from the notation "
-                        f"{notation}.",
-                        indent=4 * " ",
-                    )
-                )
-        printer.important(
-            __(
-                f"\n           System name = {system.name}"
-                f"\n    Configuration name = {configuration.name}",
-                indent=4 * " ",
-            )
-        )
-        printer.important("")
-
-        # Add the citations for Open Babel
-        self.references.cite(
-            raw=self._bibliography["openbabel"],
-            alias="openbabel_jcinf",
-            module="from_smiles_step",
-            level=1,
-            note="The principle Open Babel citation.",
-        )
-
-        # See if we can get the version of obabel
-        path = shutil.which("obabel")
-        if path is not None:
-            path = Path(path).expanduser().resolve()
-            try:
-                result = subprocess.run(
-                    [str(path), "--version"],
-                    stdin=subprocess.DEVNULL,
-                    capture_output=True,
-                    text=True,
-                )
-            except Exception:
-                version = "unknown"
-            else:
-                version = "unknown"
-                lines = result.stdout.splitlines()
-                for line in lines:
-                    line = line.strip()
-                    tmp = line.split()
-                    if len(tmp) == 9 and tmp[0] == "Open":
-                        version = tmp[2]
-                        month = tmp[4]
-                        year = tmp[6]
-                        break
-
-            if version != "unknown":
-                try:
-                    template = string.Template(self._bibliography["obabel"])
-
-                    citation = template.substitute(
-                        month=month, version=version, year=year
-                    )
-
-                    self.references.cite(
-                        raw=citation,
-                        alias="obabel-exe",
-                        module="from_smiles_step",
-                        level=1,
-                        note="The principle citation for the Open Babel executables.",
-                    )
-
-                except Exception as e:
-                    printer.important(f"Exception in citation {type(e)}: {e}")
-                    printer.important(traceback.format_exc())
-
-        return next_node
+        return notation, flavor
@@ -2,6 +2,8 @@
 """Control parameters for generating a structure from SMILES"""
 
 import logging
+
+from from_smiles_step.fragments import default_salts
 import seamm
 
 logger = logging.getLogger(__name__)
@@ -11,14 +13,37 @@ class FromSMILESParameters(seamm.Parameters):
     """The control parameters for creating a structure from SMILES"""
 
     parameters = {
+        "action": {
+            "default": "create structures",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("create structures", "embed deferred structures"),
+            "format_string": "s",
+            "description": "Action:",
+            "help_text": (
+                "Create structures, or embed in 3-D all the structures in the "
+                "database that were created earlier with deferred coordinates."
+            ),
+        },
         "notation": {
             "default": "perceive",
             "kind": "enum",
             "default_units": "",
-            "enumeration": ("perceive", "SMILES", "InChI", "InChIKey", "name"),
+            "enumeration": (
+                "perceive",
+                "SMILES",
+                "InChI",
+                "InChIKey",
+                "name",
+                "repeat unit",
+            ),
             "format_string": "s",
             "description": "Input notation:",
-            "help_text": "The line notation used.",
+            "help_text": (
+                "The line notation used. A repeat unit is the SMILES of the unit of "
+                "a polymer, with '*' for the atoms bonded to the previous and next "
+                "units, in that order, e.g. '*CC(*)c1ccccc1' for polystyrene."
+            ),
         },
         "smiles string": {
             "default": "",
@@ -38,6 +63,527 @@ class FromSMILESParameters(seamm.Parameters):
             "description": "SMILES flavor:",
             "help_text": "The flavor of SMILES to use.",
         },
+        "degree of polymerization": {
+            "default": 10,
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": "d",
+            "description": "Degree of polymerization:",
+            "help_text": "The number of repeat units in the polymer chain.",
+        },
+        "head group": {
+            "default": "[H]*",
+            "kind": "string",
+            "default_units": "",
+            "enumeration": ("[H]*", "C*"),
+            "format_string": "s",
+            "description": "Head group:",
+            "help_text": (
+                "The SMILES of the group at the start of the chain, with '*' for "
+                "the atom bonded to the first repeat unit."
+            ),
+        },
+        "tail group": {
+            "default": "[H]*",
+            "kind": "string",
+            "default_units": "",
+            "enumeration": ("[H]*", "C*"),
+            "format_string": "s",
+            "description": "Tail group:",
+            "help_text": (
+                "The SMILES of the group at the end of the chain, with '*' for "
+                "the atom bonded to the last repeat unit."
+            ),
+        },
+        "fragments": {
+            "default": "keep all",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": (
+                "keep all",
+                "remove salts",
+                "keep the largest organic fragment",
+            ),
+            "format_string": "s",
+            "description": "Fragments:",
+            "help_text": (
+                "Which of the dot-separated fragments of a SMILES to keep: all of "
+                "them, all but the salts and solvents listed, or only the largest "
+                "organic fragment."
+            ),
+        },
+        "salts": {
+            "default": default_salts,
+            "kind": "string",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": "s",
+            "description": "Salts:",
+            "help_text": (
+                "The SMILES of the salts and solvents to remove, separated by spaces."
+            ),
+        },
+        "geometry": {
+            "default": "3D",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("3D", "2D", "none", "deferred"),
+            "format_string": "s",
+            "description": "Coordinates:",
+            "help_text": (
+                "The coordinates to create: a 3-D structure; the 2-D coordinates "
+                "of a depiction, which is much faster; or none, leaving all the "
+                "atoms at the origin, which is fastest. Without 3-D coordinates "
+                "only the molecular graph is meaningful, which is enough for "
+                "steps that type or optimize the structure. Deferred structures "
+                "also have no coordinates, but keep how to embed them, so a later "
+                "step can embed those that are still needed. Names and "
+                "structures from PubChem are always 3-D."
+            ),
+        },
+        "embedding quality": {
+            "default": "standard",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("fast", "standard", "thorough"),
+            "format_string": "s",
+            "description": "Embedding quality:",
+            "help_text": (
+                "How carefully RDKit embeds the structures in 3-D: 'fast' uses "
+                "distance geometry alone, 'standard' ETKDG, and 'thorough' embeds "
+                "several conformers with ETKDG, optimizes them with a force field, "
+                "and keeps the lowest in energy."
+            ),
+        },
+        "maximum iterations": {
+            "default": "default",
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": ("default",),
+            "format_string": "d",
+            "description": "Maximum iterations:",
+            "help_text": "The maximum number of iterations for embedding with RDKit.",
+        },
+        "force field cleanup": {
+            "default": "default",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("default", "yes", "no"),
+            "format_string": "s",
+            "description": "Force field cleanup:",
+            "help_text": (
+                "Whether to optimize the structures from RDKit with MMFF94, or UFF "
+                "if MMFF94 can't handle them. By default this follows the "
+                "embedding quality."
+            ),
+        },
+        "random seed": {
+            "default": "from the structure",
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": ("random", "from the structure"),
+            "format_string": "d",
+            "description": "Random seed:",
+            "help_text": (
+                "The seed for the random numbers used when embedding and placing "
+                "copies, to make the structures reproducible. 'from the structure', "
+                "the default, gives each molecule a seed from its canonical SMILES, "
+                "so it has the same coordinates however the SMILES is written and "
+                "wherever it is in a batch. 'random' gives different coordinates "
+                "each time. Open Babel can't be seeded, so the structures it "
+                "builds are not reproducible."
+            ),
+        },
+        "number of threads": {
+            "default": 1,
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": ("all",),
+            "format_string": "d",
+            "description": "Number of threads:",
+            "help_text": (
+                "The number of threads RDKit uses to embed and optimize several "
+                "conformers of a structure. In a batch each worker uses this many."
+            ),
+        },
+        "number of conformers": {
+            "default": 1,
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": "d",
+            "description": "Number of conformers:",
+            "help_text": (
+                "The number of conformers of each molecule to create with RDKit, "
+                "all embedded in one call. They are stored as configurations of "
+                "the same system, lowest in energy first if they are cleaned up "
+                "with a force field. Multi-component structures have only one."
+            ),
+        },
+        "conformer RMSD threshold": {
+            "default": 0.5,
+            "kind": "float",
+            "default_units": "",
+            "enumeration": ("none",),
+            "format_string": ".2f",
+            "description": "Prune conformers within (Å):",
+            "help_text": (
+                "Conformers whose heavy atoms are within this RMSD of a conformer "
+                "already kept, after superposing them, are dropped, so there may be "
+                "fewer conformers than requested."
+            ),
+        },
+        "reuse scaffolds": {
+            "default": "no",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("yes", "no"),
+            "format_string": "s",
+            "description": "Reuse scaffold coordinates:",
+            "help_text": (
+                "Embed the scaffold of each molecule -- its rings and the linkers "
+                "between them -- once per process, and build the molecules sharing "
+                "it by embedding only their side chains. This is faster for series "
+                "of similar molecules, such as combinatorial libraries. Molecules "
+                "that can't be built this way are embedded as usual. It is not used "
+                "for several conformers."
+            ),
+        },
+        "fragment assembly threshold": {
+            "default": "never",
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": ("never",),
+            "format_string": "d",
+            "description": "Assemble from fragments above (heavy atoms):",
+            "help_text": (
+                "Build molecules with more heavy atoms than this, such as "
+                "peptides and dendrimers, from their rigid fragments: the molecule "
+                "is cut at its rotatable bonds, each fragment is embedded on its "
+                "own and cached, and the fragments are joined at torsions clear of "
+                "each other. This is much faster than embedding the whole "
+                "molecule. Bonds in rings are never cut, so each ring system, "
+                "including the ring of a macrocycle, is embedded whole, and only "
+                "the chains attached to it are assembled. Molecules that can't be "
+                "built this way are embedded as usual. It is not used for several "
+                "conformers. 'never', the default, always embeds the whole "
+                "molecule."
+            ),
+        },
+        "validate structures": {
+            "default": "no",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("yes", "no"),
+            "format_string": "s",
+            "description": "Validate structures:",
+            "help_text": (
+                "Check the 3-D structures for bond lengths far from normal and "
+                "atoms that overlap, trying the next toolkit, or reporting a "
+                "failure, for any that are not sensible."
+            ),
+        },
+        "number of copies": {
+            "default": 1,
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": "d",
+            "description": "Number of copies:",
+            "help_text": (
+                "The number of copies of a single molecule to create in the "
+                "configuration. The molecule is embedded once and copied, with "
+                "random orientations for 3-D structures."
+            ),
+        },
+        "arrangement": {
+            "default": "cubic lattice",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("cubic lattice", "packed in a periodic cell"),
+            "format_string": "s",
+            "description": "Arrange the copies:",
+            "help_text": (
+                "How to arrange the copies: on a simple cubic lattice in a molecular "
+                "configuration, or randomly packed into a periodic, cubic cell at "
+                "the given density. The molecules in a multi-component SMILES are "
+                "packed separately, giving a mixture."
+            ),
+        },
+        "mixture composition": {
+            "default": "equal",
+            "kind": "string",
+            "default_units": "",
+            "enumeration": ("equal",),
+            "format_string": "s",
+            "description": "Mixture composition:",
+            "help_text": (
+                "The relative numbers of the molecules in a multi-component SMILES "
+                "packed into a cell, in the order they are written, e.g. '3 1' for "
+                "three of the first molecule for each of the second. Each is "
+                "multiplied by the number of copies. 'equal' packs the same number "
+                "of each. Mixtures of charged or open-shell molecules must be equal."
+            ),
+        },
+        "density": {
+            "default": 0.5,
+            "kind": "float",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": ".3f",
+            "description": "Density (g/mL):",
+            "help_text": (
+                "The density of the packed cell. Packing rigid molecules at random "
+                "jams at about two thirds of the density of a liquid, so compress "
+                "the cell afterwards to reach it."
+            ),
+        },
+        "minimum distance": {
+            "default": 1.5,
+            "kind": "float",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": ".2f",
+            "description": "Minimum distance (Å):",
+            "help_text": "The minimum distance between atoms of different molecules.",
+        },
+        "output": {
+            "default": "full",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("full", "summary", "quiet"),
+            "format_string": "s",
+            "description": "Output:",
+            "help_text": (
+                "How much to print: everything, including a few lines for each "
+                "structure; only a summary, which is a single line for one "
+                "structure; or nothing but any failures. Use 'summary' or 'quiet' "
+                "in loops and for large batches."
+            ),
+        },
+        "smiles file": {
+            "default": "",
+            "kind": "string",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": "s",
+            "description": "Input file:",
+            "help_text": (
+                "A file with one structure per line, optionally followed by an "
+                "identifier, to create a batch of structures. If given, it is "
+                "used rather than the input string."
+            ),
+        },
+        "number of workers": {
+            "default": "all",
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": ("all",),
+            "format_string": "d",
+            "description": "Number of workers:",
+            "help_text": (
+                "The number of processes used to create a batch of structures."
+            ),
+        },
+        "tasks per worker": {
+            "default": 100,
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": ("unlimited",),
+            "format_string": "d",
+            "description": "Tasks per worker:",
+            "help_text": (
+                "The number of chunks of structures each worker creates before it "
+                "is replaced by a fresh process, to limit the growth of memory. The "
+                "workers are kept and reused by later batches and steps."
+            ),
+        },
+        "worker transport": {
+            "default": "shared memory",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("shared memory", "pickle"),
+            "format_string": "s",
+            "description": "Return structures via:",
+            "help_text": (
+                "How the workers return the atoms, bonds and coordinates: in blocks "
+                "of shared memory that are read without copying, or pickled."
+            ),
+        },
+        "structures per transaction": {
+            "default": 100,
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": "d",
+            "description": "Structures per transaction:",
+            "help_text": (
+                "The number of structures in a batch that are written to the "
+                "database in each transaction."
+            ),
+        },
+        "maximum heavy atoms": {
+            "default": "no limit",
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": ("no limit",),
+            "format_string": "d",
+            "description": "Maximum heavy atoms:",
+            "help_text": (
+                "Drop structures in a batch with more heavy atoms than this, "
+                "before they are embedded."
+            ),
+        },
+        "maximum molecular weight": {
+            "default": "no limit",
+            "kind": "float",
+            "default_units": "",
+            "enumeration": ("no limit",),
+            "format_string": ".1f",
+            "description": "Maximum molecular weight (g/mol):",
+            "help_text": (
+                "Drop structures in a batch with a larger molecular weight than "
+                "this, before they are embedded."
+            ),
+        },
+        "maximum rotatable bonds": {
+            "default": "no limit",
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": ("no limit",),
+            "format_string": "d",
+            "description": "Maximum rotatable bonds:",
+            "help_text": (
+                "Drop structures in a batch with more rotatable bonds than this, "
+                "before they are embedded."
+            ),
+        },
+        "maximum ring size": {
+            "default": "no limit",
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": ("no limit",),
+            "format_string": "d",
+            "description": "Maximum ring size:",
+            "help_text": (
+                "Drop structures in a batch with a ring larger than this, before "
+                "they are embedded."
+            ),
+        },
+        "excluded SMARTS": {
+            "default": "",
+            "kind": "string",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": "s",
+            "description": "Excluded SMARTS:",
+            "help_text": (
+                "SMARTS patterns, separated by spaces. Structures in a batch that "
+                "match any of them are dropped before they are embedded."
+            ),
+        },
+        "batch output": {
+            "default": "database",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": (
+                "database",
+                "columnar store",
+                "database and columnar store",
+            ),
+            "format_string": "s",
+            "description": "Write the structures to:",
+            "help_text": (
+                "Where to write the structures from a batch: the system database, "
+                "a compact columnar store of memory-mapped NumPy files, or both."
+            ),
+        },
+        "columnar store": {
+            "default": "structures",
+            "kind": "string",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": "s",
+            "description": "Columnar store:",
+            "help_text": (
+                "The directory for the columnar store, relative to the directory "
+                "of the step."
+            ),
+        },
+        "structure files": {
+            "default": "none",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("none", "SDF", "XYZ"),
+            "format_string": "s",
+            "description": "Structure files:",
+            "help_text": (
+                "Also write the structures from a batch to sharded SDF or XYZ "
+                "files, with a manifest of the contents of each shard."
+            ),
+        },
+        "structure files directory": {
+            "default": "shards",
+            "kind": "string",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": "s",
+            "description": "Directory for the files:",
+            "help_text": (
+                "The directory for the shards and manifest, relative to the "
+                "directory of the step."
+            ),
+        },
+        "number of shards": {
+            "default": 4,
+            "kind": "integer",
+            "default_units": "",
+            "enumeration": tuple(),
+            "format_string": "d",
+            "description": "Number of shards:",
+            "help_text": (
+                "The number of files to spread the structures over, each written "
+                "by its own thread."
+            ),
+        },
+        "shard by": {
+            "default": "round robin",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("round robin", "hash"),
+            "format_string": "s",
+            "description": "Assign structures to shards by:",
+            "help_text": (
+                "How to assign the structures to shards: in turn, or by a hash of "
+                "the identifier, which puts a structure in the same shard in every "
+                "run."
+            ),
+        },
+        "compression": {
+            "default": "gzip",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("none", "gzip", "zstd"),
+            "format_string": "s",
+            "description": "Compression:",
+            "help_text": (
+                "How to compress the shards. zstd needs the 'zstandard' package."
+            ),
+        },
+        "results table": {
+            "default": "none",
+            "kind": "enum",
+            "default_units": "",
+            "enumeration": ("none", "Parquet", "Arrow"),
+            "format_string": "s",
+            "description": "Results table:",
+            "help_text": (
+                "Write a table of the results of a batch, with the identifiers, "
+                "formula and timing of each structure, as a Parquet or Arrow file. "
+                "This needs the 'pyarrow' package."
+            ),
+        },
     }
 
     def __init__(self, defaults={}, data=None):
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+
+"""Pack molecules into a periodic cell at a given density.
+
+The molecules are inserted one at a time, at random positions and orientations,
+rejecting any that come too close to the atoms already in the cell. The atoms
+are kept in a cell list, a spatial hash of the cell into boxes at least as large
+as the minimum distance, so checking a molecule only looks at the atoms in the
+neighboring boxes, and the cost of each insertion does not grow with the number
+of molecules.
+"""
+
+import itertools
+import logging
+
+import numpy as np
+from rdkit import Chem
+
+from from_smiles_step.copies import random_rotations
+from from_smiles_step.record import StructureRecord
+
+logger = logging.getLogger(__name__)
+
+# Avogadro's number times 1 Å^3 in mL, to convert g/mol / (g/mL) to Å^3
+_avogadro = 0.6022140857
+
+# The number of atoms to try placing at once
+block_atoms = 256
+
+# The offsets to a box and its 26 neighbors
+_neighbors = np.array(list(itertools.product((-1, 0, 1), repeat=3)), dtype=np.int64)
+
+
+class CellList(object):
+    """A spatial hash of the atoms in a periodic, cubic cell.
+
+    Parameters
+    ----------
+    length : float
+        The length of the edges of the cell, in Å.
+    cutoff : float
+        The minimum distance between atoms, in Å.
+    capacity : int = 8
+        The initial number of atoms each box can hold, which grows as needed.
+    """
+
+    def __init__(self, length, cutoff, capacity=8):
+        self.length = length
+        self.cutoff = cutoff
+        self.n = max(int(length // cutoff), 1)
+        self.size = length / self.n
+        self.counts = np.zeros(self.n**3, dtype=np.int64)
+        self.positions = np.zeros((self.n**3, capacity, 3))
+
+    def boxes(self, xyz):
+        """The index of the box holding each of the positions.
+
+        Parameters
+        ----------
+        xyz : numpy.ndarray
+            The n x 3 array of positions.
+
+        Returns
+        -------
+        numpy.ndarray
+            The indices of the boxes.
+        """
+        ijk = np.floor(xyz / self.size).astype(np.int64) % self.n
+        return (ijk[:, 0] * self.n + ijk[:, 1]) * self.n + ijk[:, 2]
+
+    def overlaps(self, xyz):
+        """Which of several trial positions of a molecule are too close to atoms.
+
+        Parameters
+        ----------
+        xyz : numpy.ndarray
+            The t x n x 3 array of the positions of the n atoms in t trials.
+
+        Returns
+        -------
+        numpy.ndarray
+            Whether each trial overlaps the atoms in the cell.
+        """
+        n = self.n
+        n_trials = xyz.shape[0]
+        xyz = xyz.reshape(-1, 3)
+        ijk = np.floor(xyz / self.size).astype(np.int64)
+        neighbors = (ijk[:, np.newaxis, :] + _neighbors) % n
+        boxes = (neighbors[..., 0] * n + neighbors[..., 1]) * n + neighbors[..., 2]
+        counts = self.counts[boxes]
+        capacity = counts.max()
+        if capacity == 0:
+            return np.zeros(n_trials, dtype=bool)
+        positions = self.positions[boxes, :capacity]
+        occupied = np.arange(capacity) < counts[..., np.newaxis]
+        delta = positions - xyz[:, np.newaxis, np.newaxis, :]
+        delta -= self.length * np.round(delta / self.length)
+        r2 = np.einsum("abcx,abcx->abc", delta, delta)
+        close = (occupied & (r2 < self.cutoff**2)).reshape(n_trials, -1)
+        return close.any(axis=1)
+
+    def add(self, xyz):
+        """Add atoms to the cell.
+
+        Parameters
+        ----------
+        xyz : numpy.ndarray
+            The n x 3 array of positions.
+        """
+        boxes = self.boxes(xyz)
+        # The slot of each atom in its box, after any atoms already there
+        order = np.argsort(boxes, kind="stable")
+        sorted_boxes = boxes[order]
+        first = np.searchsorted(sorted_boxes, sorted_boxes, side="left")
+        slots = np.empty_like(boxes)
+        slots[order] = np.arange(len(boxes)) - first
+        slots += self.counts[boxes]
+
+        capacity = self.positions.shape[1]
+        needed = slots.max() + 1 if len(slots) > 0 else 0
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            grown = np.zeros((self.positions.shape[0], capacity, 3))
+            grown[:, : self.positions.shape[1]] = self.positions
+            self.positions = grown
+        self.positions[boxes, slots] = xyz
+        self.counts += np.bincount(boxes, minlength=len(self.counts))
+
+
+def components(record):
+    """The atoms in each of the molecules in a structure.
+
+    Parameters
+    ----------
+    record : StructureRecord
+        The structure.
+
+    Returns
+    -------
+    [numpy.ndarray]
+        The indices of the atoms in each molecule.
+    """
+    parent = list(range(record.n_atoms))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j, _ in record.bonds.tolist():
+        parent[root(i)] = root(j)
+    roots = np.array([root(i) for i in range(record.n_atoms)])
+    return [np.flatnonzero(roots == r) for r in dict.fromkeys(roots.tolist())]
+
+
+def mutual_clashes(trials, length, cutoff):
+    """Which pairs of trial positions of molecules clash with each other.
+
+    Parameters
+    ----------
+    trials : numpy.ndarray
+        The t x n x 3 array of the positions of the n atoms in t trials.
+    length : float
+        The length of the edges of the periodic cell, in Å.
+    cutoff : float
+        The minimum distance between atoms, in Å.
+
+    Returns
+    -------
+    numpy.ndarray
+        The t x t array of whether each pair of trials clash. The diagonal is
+        False.
+    """
+    n_trials, n_atoms, _ = trials.shape
+    xyz = trials.reshape(-1, 3)
+    delta = xyz[:, np.newaxis, :] - xyz[np.newaxis, :, :]
+    delta -= length * np.round(delta / length)
+    close = np.einsum("abx,abx->ab", delta, delta) < cutoff**2
+    clashes = close.reshape(n_trials, n_atoms, n_trials, n_atoms).any(axis=(1, 3))
+    np.fill_diagonal(clashes, False)
+    return clashes
+
+
+def pack(record, n_copies, density, min_distance=1.5, seed=None, max_attempts=10000):
+    """Pack copies of the molecules in a structure into a periodic, cubic cell.
+
+    Each molecule in the structure is packed separately, so a multi-component
+    structure gives a mixture with n_copies of each of its molecules, or the
+    number given for each. Since the
+    molecules are rigid, random insertion jams at roughly two thirds of the
+    density of a typical liquid, so the cell is usually compressed afterwards,
+    e.g. by molecular dynamics.
+
+    Parameters
+    ----------
+    record : StructureRecord
+        The structure to pack.
+    n_copies : int or [int]
+        The number of copies of each molecule, or for a mixture of another
+        composition, the number of copies of each molecule in the order of
+        their atoms in the structure.
+    density : float
+        The density of the packed cell, in g/mL.
+    min_distance : float = 1.5
+        The minimum distance between atoms in different molecules, in Å.
+    seed : int = None
+        The random seed for the positions and orientations, or None for a random
+        one.
+    max_attempts : int = 10000
+        The number of times to try to insert each molecule before giving up.
+
+    Returns
+    -------
+    StructureRecord
+        The record of the packed, periodic structure.
+    """
+    molecules = components(record)
+    if isinstance(n_copies, (int, np.integer)):
+        counts = [int(n_copies)] * len(molecules)
+    else:
+        counts = [int(n) for n in n_copies]
+        if len(counts) != len(molecules):
+            raise ValueError(
+                f"There are {len(counts)} numbers of copies for the "
+                f"{len(molecules)} molecules in the structure."
+            )
+        # Only the total charge and spin are known, not those of each molecule.
+        if len(set(counts)) > 1 and (
+            record.charge != 0 or record.spin_multiplicity != 1
+        ):
+            raise ValueError(
+                "Charged or open-shell mixtures can only have the same number of "
+                "copies of each molecule."
+            )
+
+    table = Chem.GetPeriodicTable()
+    masses = np.array([table.GetAtomicWeight(int(z)) for z in record.atno])
+    mass = sum(n * masses[atoms].sum() for n, atoms in zip(counts, molecules))
+    length = (mass / (density * _avogadro)) ** (1 / 3)
+
+    rng = np.random.default_rng(seed)
+    cells = CellList(length, min_distance)
+
+    # The random orientations and positions, drawn in large blocks
+    poses = {"rotations": np.empty((0, 3, 3)), "shifts": np.empty((0, 3))}
+
+    def draw(n):
+        if len(poses["shifts"]) < n:
+            poses["rotations"] = random_rotations(4096, rng)
+            poses["shifts"] = rng.random((4096, 3)) * length
+        rotations = poses["rotations"][:n]
+        shifts = poses["shifts"][:n]
+        poses["rotations"] = poses["rotations"][n:]
+        poses["shifts"] = poses["shifts"][n:]
+        return rotations, shifts
+
+    # Insert the largest molecules first, while there is the most room. Blocks
+    # of trial positions are tested at once, against the atoms in the cell and
+    # then against each other, keeping each trial that clashes with neither the
+    # cell nor the trials already kept.
+    order = sorted(range(len(molecules)), key=lambda k: -len(molecules[k]))
+    placed = [None] * len(molecules)
+    for k in order:
+        atoms = molecules[k]
+        n_copies = counts[k]
+        xyz = record.coordinates[atoms]
+        xyz = xyz - xyz.mean(axis=0)
+        block = min(max(block_atoms // len(atoms), 1), 64)
+        result = np.empty((n_copies, len(atoms), 3))
+        n_placed = 0
+        n_failed = 0
+        while n_placed < n_copies:
+            rotations, shifts = draw(block)
+            trials = np.einsum("tij,aj->tai", rotations, xyz)
+            trials += shifts[:, np.newaxis, :]
+            free = np.flatnonzero(~cells.overlaps(trials))
+            if len(free) > 1:
+                clashes = mutual_clashes(trials[free], length, min_distance)
+                kept = []
+                for i in range(len(free)):
+                    if not clashes[i, kept].any():
+                        kept.append(i)
+                free = free[kept]
+            free = free[: n_copies - n_placed]
+
+            if len(free) == 0:
+                n_failed += block
+                if n_failed >= max_attempts:
+                    raise RuntimeError(
+                        f"Could not pack {n_copies} copies at a density of "
+                        f"{density} g/mL after {max_attempts} attempts for one "
+                        "molecule. Try a lower density or minimum distance."
+                    )
+                continue
+            n_failed = 0
+            cells.add(trials[free].reshape(-1, 3))
+            result[n_placed : n_placed + len(free)] = trials[free]
+            n_placed += len(free)
+        placed[k] = result
+
+    # Order the atoms by molecule type, then copy
+    atno = []
+    formal_charges = []
+    coordinates = []
+    bonds = []
+    n = 0
+    for atoms, result, n_copies in zip(molecules, placed, counts):
+        index = np.full(record.n_atoms, -1, dtype=np.int64)
+        index[atoms] = np.arange(len(atoms))
+        mine = record.bonds[np.isin(record.bonds[:, 0], atoms)].copy()
+        mine[:, :2] = index[mine[:, :2]]
+        offsets = np.repeat(n + np.arange(n_copies) * len(atoms), len(mine))
+        tiled = np.tile(mine, (n_copies, 1))
+        tiled[:, :2] += offsets[:, np.newaxis]
+        atno.append(np.tile(record.atno[atoms], n_copies))
+        if record.formal_charges is not None:
+            formal_charges.append(np.tile(record.formal_charges[atoms], n_copies))
+        coordinates.append(result.reshape(-1, 3))
+        bonds.append(tiled)
+        n += n_copies * len(atoms)
+
+    result = StructureRecord(
+        record.text,
+        atno=np.concatenate(atno),
+        coordinates=np.concatenate(coordinates),
+        bonds=np.concatenate(bonds).astype(np.int32),
+        charge=counts[0] * record.charge,
+        formal_charges=(
+            np.concatenate(formal_charges)
+            if record.formal_charges is not None
+            else None
+        ),
+        spin_multiplicity=counts[0] * (record.spin_multiplicity - 1) + 1,
+        notation=record.notation,
+        flavor=record.flavor,
+        cell=np.array([length, length, length]),
+    )
+    result.seed = seed
+    return result
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+
+"""Build polymers and oligomers from the SMILES of a repeat unit.
+
+Embedding the whole of a long chain with distance geometry is slow, scaling
+worse than the square of its length, and often fails beyond a few hundred atoms.
+Instead a short oligomer, with the end groups and three repeat units, is embedded,
+and the chain is built by repeating the middle unit. The transformation from one
+unit to the next is taken from the local frames of the atoms joining them, so
+that the bonds between the units are as in the oligomer, and applying it again
+and again gives a helix, at a cost linear in the length of the chain.
+
+The repeat unit is a SMILES with two attachment points, written as '*', the
+first joining the previous unit and the second the next, e.g. '*CC(*)c1ccccc1'
+for polystyrene. The end groups each have one attachment point, e.g. '[H]*'.
+"""
+
+import logging
+
+import numpy as np
+from rdkit import Chem
+
+logger = logging.getLogger(__name__)
+
+# The number of times to embed the oligomer, looking for a chain without atoms
+# too close together
+attempts = 10
+
+# The atom properties holding the part of the chain each atom came from, its index
+# in that part, and which end of a piece of the chain an attachment point is at.
+_part_property = "polymer part"
+_index_property = "polymer index"
+_end_property = "polymer end"
+
+
+def parse(text, n_points):
+    """A repeat unit or end group from its SMILES.
+
+    Parameters
+    ----------
+    text : str
+        The SMILES, with the attachment points written as '*'.
+    n_points : int
+        The number of attachment points required: 2 for a repeat unit, 1 for an
+        end group.
+
+    Returns
+    -------
+    rdkit.Chem.Mol, [int]
+        The molecule, without hydrogens other than any written as atoms, and the
+        attachment points in the order of the SMILES.
+    """
+    # Keep any hydrogens written as atoms, e.g. '[H]*'
+    parameters = Chem.SmilesParserParams()
+    parameters.removeHs = False
+    mol = Chem.MolFromSmiles(text, parameters)
+    if mol is None:
+        raise ValueError(f"SMILES '{text}' is not valid.")
+    points = [a.GetIdx() for a in mol.GetAtoms() if a.GetAtomicNum() == 0]
+    if len(points) != n_points:
+        raise ValueError(
+            f"SMILES '{text}' has {len(points)} attachment points ('*'), not "
+            f"{n_points}."
+        )
+    for i in points:
+        if mol.GetAtomWithIdx(i).GetDegree() != 1:
+            raise ValueError(
+                f"The attachment points in '{text}' must each be bonded to one atom."
+            )
+    return mol, points
+
+
+def attached(mol, point):
+    """The atom bonded to an attachment point.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The repeat unit or end group.
+    point : int
+        The attachment point.
+
+    Returns
+    -------
+    int
+        The index of the atom.
+    """
+    return mol.GetAtomWithIdx(point).GetNeighbors()[0].GetIdx()
+
+
+def piece(mol, part, before=None, after=None):
+    """A part of a chain, labeled so that it can be joined to others.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The repeat unit or end group.
+    part : int
+        The number of the part in the chain.
+    before : int = None
+        The attachment point to the previous part, if any.
+    after : int = None
+        The attachment point to the next part, if any.
+
+    Returns
+    -------
+    rdkit.Chem.Mol
+        The labeled copy of the molecule.
+    """
+    result = Chem.RWMol(mol)
+    for atom in result.GetAtoms():
+        atom.SetIntProp(_part_property, part)
+        atom.SetIntProp(_index_property, atom.GetIdx())
+    if before is not None:
+        result.GetAtomWithIdx(before).SetIntProp(_end_property, 0)
+    if after is not None:
+        result.GetAtomWithIdx(after).SetIntProp(_end_property, 1)
+    return result.GetMol()
+
+
+def join(first, second, n_parts):
+    """Join two pieces of a chain, the second after the first.
+
+    Joining only two pieces at a time keeps molzip linear in their size.
+
+    Parameters
+    ----------
+    first : rdkit.Chem.Mol
+        The first piece, from piece() or join().
+    second : rdkit.Chem.Mol
+        The second piece.
+    n_parts : int
+        The number of parts in the first piece, by which those of the second are
+        renumbered.
+
+    Returns
+    -------
+    rdkit.Chem.Mol
+        The joined piece.
+    """
+    rw = Chem.RWMol(first)
+    for atom in rw.GetAtoms():
+        if atom.HasProp(_end_property) and atom.GetIntProp(_end_property) == 1:
+            atom.SetAtomMapNum(1)
+    other = Chem.RWMol(second)
+    for atom in other.GetAtoms():
+        atom.SetIntProp(_part_property, atom.GetIntProp(_part_property) + n_parts)
+        if atom.HasProp(_end_property) and atom.GetIntProp(_end_property) == 0:
+            atom.SetAtomMapNum(1)
+    rw.InsertMol(other)
+    return Chem.molzip(rw.GetMol())
+
+
+def chain(unit, points, n, head, tail):
+    """The molecule of a chain of repeat units with end groups.
+
+    The chain is built from blocks of units, each twice the size of the last, so
+    the time is linear in its length.
+
+    Parameters
+    ----------
+    unit : rdkit.Chem.Mol
+        The repeat unit, from parse(), with or without hydrogens.
+    points : [int]
+        The attachment points of the unit, to the previous and next units.
+    n : int
+        The number of repeat units.
+    head : (rdkit.Chem.Mol, [int])
+        The end group before the first unit, and its attachment point.
+    tail : (rdkit.Chem.Mol, [int])
+        The end group after the last unit, and its attachment point.
+
+    Returns
+    -------
+    rdkit.Chem.Mol, numpy.ndarray
+        The chain, with hydrogens if the parts have them, and for each atom the
+        part it came from, 0 for the head group, 1 to n for the units, and n + 1
+        for the tail group, and its index in that part.
+    """
+    if n < 1:
+        raise ValueError("A chain needs at least one repeat unit.")
+    result = piece(head[0], 0, after=head[1][0])
+    n_parts = 1
+    block = piece(unit, 0, *points)
+    size = 1
+    remaining = n
+    while remaining > 0:
+        if remaining & 1:
+            result = join(result, block, n_parts)
+            n_parts += size
+        remaining >>= 1
+        if remaining > 0:
+            block = join(block, block, size)
+            size *= 2
+    result = join(result, piece(tail[0], 0, before=tail[1][0]), n_parts)
+
+    # Atoms that were stereocenters in a unit may not be at the ends of the chain
+    Chem.AssignStereochemistry(result, cleanIt=True, force=True)
+    origin = np.array(
+        [
+            (atom.GetIntProp(_part_property), atom.GetIntProp(_index_property))
+            for atom in result.GetAtoms()
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return result, origin
+
+
+def graph(text, degree=10, head="[H]*", tail="[H]*"):
+    """The molecular graph of a chain, without hydrogens.
+
+    RDKit is slow removing the hydrogens of long chains, so this is much quicker
+    for the identifiers of a chain than the embedded one, with hydrogens.
+
+    Parameters
+    ----------
+    text : str
+        The SMILES of the repeat unit.
+    degree : int = 10
+        The number of repeat units.
+    head : str = "[H]*"
+        The SMILES of the end group before the first unit.
+    tail : str = "[H]*"
+        The SMILES of the end group after the last unit.
+
+    Returns
+    -------
+    rdkit.Chem.Mol
+        The chain.
+    """
+    unit, points = parse(text, 2)
+    return chain(unit, points, degree, parse(head, 1), parse(tail, 1))[0]
+
+
+def frame(xyz):
+    """The origin and axes of the local frame of three points.
+
+    Parameters
+    ----------
+    xyz : numpy.ndarray
+        The 3 x 3 coordinates of the origin, a point along the first axis, and a
+        point in the plane of the first two axes.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The origin, and the 3 x 3 axes as rows.
+    """
+    origin = xyz[0]
+    e1 = xyz[1] - origin
+    e1 /= np.linalg.norm(e1)
+    e2 = xyz[2] - origin
+    e2 -= (e2 @ e1) * e1
+    norm = np.linalg.norm(e2)
+    if norm < 1e-6:
+        raise ValueError("The atoms joining the repeat units are collinear.")
+    e2 /= norm
+    return origin, np.array([e1, e2, np.cross(e1, e2)])
+
+
+def transform(source, target):
+    """The rigid transformation taking one local frame onto another.
+
+    Parameters
+    ----------
+    source : numpy.ndarray
+        The 3 x 3 coordinates defining the first frame, as for frame().
+    target : numpy.ndarray
+        The 3 x 3 coordinates defining the second frame.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The 3 x 3 rotation and the translation, applied as x @ rotation + shift.
+    """
+    a, axes_a = frame(source)
+    b, axes_b = frame(target)
+    rotation = axes_a.T @ axes_b
+    return rotation, b - a @ rotation
+
+
+def neighbor(mol, i, exclude):
+    """The first atom bonded to an atom, other than the attachment points.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The repeat unit or end group.
+    i : int
+        The atom.
+    exclude : [int]
+        The attachment points.
+
+    Returns
+    -------
+    int
+        The index of the neighbor.
+    """
+    others = sorted(
+        a.GetIdx()
+        for a in mol.GetAtomWithIdx(i).GetNeighbors()
+        if a.GetIdx() not in exclude
+    )
+    if len(others) == 0:
+        raise ValueError(
+            "The atoms joining the repeat units need another neighbor in the unit."
+        )
+    return others[0]
+
+
+def assemble(unit, points, head, tail, oligomer, oligomer_origin, origin):
+    """The coordinates of a chain from those of an embedded oligomer.
+
+    Parameters
+    ----------
+    unit : rdkit.Chem.Mol
+        The repeat unit, from parse(), with hydrogens.
+    points : [int]
+        The attachment points of the unit, to the previous and next units.
+    head : (rdkit.Chem.Mol, [int])
+        The end group before the first unit, and its attachment point.
+    tail : (rdkit.Chem.Mol, [int])
+        The end group after the last unit, and its attachment point.
+    oligomer : rdkit.Chem.Mol
+        The chain of three repeat units with the end groups, from chain(), with a
+        conformer.
+    oligomer_origin : numpy.ndarray
+        The part and index of each atom in the oligomer, from chain().
+    origin : numpy.ndarray
+        The part and index of each atom in the chain, from chain().
+
+    Returns
+    -------
+    numpy.ndarray
+        The n x 3 coordinates of the atoms of the chain.
+    """
+    xyz = oligomer.GetConformer().GetPositions()
+    where = {(p, i): k for k, (p, i) in enumerate(oligomer_origin.tolist())}
+
+    def positions(*atoms):
+        return xyz[[where[atom] for atom in atoms]]
+
+    a = attached(unit, points[0])
+    b = attached(unit, points[1])
+    x = neighbor(unit, a, points)
+    y = neighbor(unit, b, points)
+    h = attached(head[0], head[1][0])
+    t = attached(tail[0], tail[1][0])
+    n = int(origin[:, 0].max()) - 1
+
+    # The chain starts with the middle unit, U2. The transformation from each
+    # unit to the next takes the frame of the first atom of U2, with the last
+    # atom of U1, to that of U3, so the bonds between units are as in the
+    # oligomer.
+    n_unit = unit.GetNumAtoms()
+    atoms = [i for i in range(n_unit) if i not in points]
+    middle = np.zeros((n_unit, 3))
+    middle[atoms] = positions(*[(2, i) for i in atoms])
+    first = positions((2, a), (1, b), (2, x))
+    rotation, shift = transform(first, positions((3, a), (2, b), (3, x)))
+
+    # The cumulative transformations of the units, applied all at once
+    rotations = np.empty((n, 3, 3))
+    shifts = np.empty((n, 3))
+    rotations[0] = np.identity(3)
+    shifts[0] = 0.0
+    for k in range(1, n):
+        rotations[k] = rotations[k - 1] @ rotation
+        shifts[k] = shifts[k - 1] @ rotation + shift
+    units = np.einsum("ax,kxy->kay", middle, rotations) + shifts[:, np.newaxis, :]
+
+    # The head group is bonded to the first unit as the end of U1 is to U2, and
+    # the tail group to the last as the start of U3 is to U2.
+    n_head = head[0].GetNumAtoms()
+    head_rotation, head_shift = transform(positions((1, a), (0, h), (1, x)), first)
+    head_xyz = (
+        positions(*[(0, i) for i in range(n_head) if i not in head[1]]) @ head_rotation
+        + head_shift
+    )
+    n_tail = tail[0].GetNumAtoms()
+    last = positions((2, b), (3, a), (2, y)) @ rotations[-1] + shifts[-1]
+    tail_rotation, tail_shift = transform(positions((3, b), (4, t), (3, y)), last)
+    tail_xyz = (
+        positions(*[(4, i) for i in range(n_tail) if i not in tail[1]]) @ tail_rotation
+        + tail_shift
+    )
+
+    # Gather the atoms of the chain from the parts, padding the end groups so
+    # that they are indexed as in their molecules.
+    padded = np.zeros((n + 2, max(n_unit, n_head, n_tail), 3))
+    padded[0, [i for i in range(n_head) if i not in head[1]]] = head_xyz
+    padded[1 : n + 1, :n_unit] = units
+    padded[n + 1, [i for i in range(n_tail) if i not in tail[1]]] = tail_xyz
+    return padded[origin[:, 0], origin[:, 1]]
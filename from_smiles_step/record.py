@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""A compact record of a structure between the stages of a batch.
+
+A batch may hold tens of thousands of structures between the workers and the
+writers, which is far too many for configurations or toolkit molecules. A
+StructureRecord holds just the arrays of atomic numbers, coordinates and bonds,
+with a few strings and numbers, and is only turned into a configuration when it
+is written to the database.
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class StructureRecord(object):
+    """A structure created from a line notation, or the failure to create it.
+
+    Parameters
+    ----------
+    text : str
+        The line notation, after removing any unwanted fragments.
+    atno : numpy.ndarray = None
+        The atomic numbers, as uint8.
+    coordinates : numpy.ndarray = None
+        The n x 3 array of coordinates, in Å.
+    bonds : numpy.ndarray = None
+        The m x 3 array of the two atom indices and the bond order, as int32.
+    charge : int = 0
+        The net charge.
+    formal_charges : numpy.ndarray = None
+        The formal charge of each atom, as int8, or None if all are neutral.
+    spin_multiplicity : int = 1
+        The spin multiplicity.
+    notation : str = None
+        The line notation actually used, e.g. "SMILES".
+    flavor : str = None
+        The toolkit that created the structure.
+    error : str = None
+        Why the structure could not be created, if it could not.
+    filtered : str = None
+        Why the structure was rejected by the filters, if it was.
+    cell : numpy.ndarray = None
+        The lengths of the edges of a periodic, orthorhombic cell, in Å, or None
+        for a molecule.
+    conformers : numpy.ndarray = None
+        The k x n x 3 array of the coordinates of several conformers, the first
+        of which are the coordinates, or None if there is only one.
+    """
+
+    __slots__ = (
+        "text",
+        "input",
+        "identifier",
+        "atno",
+        "coordinates",
+        "bonds",
+        "charge",
+        "formal_charges",
+        "spin_multiplicity",
+        "notation",
+        "flavor",
+        "canonical_smiles",
+        "inchi",
+        "inchikey",
+        "formula",
+        "seed",
+        "time",
+        "error",
+        "filtered",
+        "cell",
+        "conformers",
+    )
+
+    def __init__(
+        self,
+        text,
+        atno=None,
+        coordinates=None,
+        bonds=None,
+        charge=0,
+        formal_charges=None,
+        spin_multiplicity=1,
+        notation=None,
+        flavor=None,
+        error=None,
+        filtered=None,
+        cell=None,
+        conformers=None,
+    ):
+        self.text = text
+        self.input = None
+        self.identifier = None
+        self.atno = atno
+        self.coordinates = coordinates
+        self.bonds = bonds
+        self.charge = charge
+        self.formal_charges = formal_charges
+        self.spin_multiplicity = spin_multiplicity
+        self.notation = notation
+        self.flavor = flavor
+        self.canonical_smiles = None
+        self.inchi = None
+        self.inchikey = None
+        self.formula = None
+        self.seed = None
+        self.time = None
+        self.error = error
+        self.filtered = filtered
+        self.cell = cell
+        self.conformers = conformers
+
+    def __repr__(self):
+        if self.failed:
+            return f"StructureRecord({self.text!r}, error={self.error!r})"
+        if self.filtered is not None:
+            return f"StructureRecord({self.text!r}, filtered={self.filtered!r})"
+        return f"StructureRecord({self.text!r}, n_atoms={self.n_atoms})"
+
+    @property
+    def failed(self):
+        """Whether the structure could not be created."""
+        return self.error is not None
+
+    @property
+    def created(self):
+        """Whether there is a structure, i.e. it neither failed nor was filtered."""
+        return self.error is None and self.filtered is None
+
+    @property
+    def identifiers(self):
+        """The canonical SMILES, InChI and InChIKey that are known."""
+        result = {}
+        for key, value in (
+            ("canonical SMILES", self.canonical_smiles),
+            ("InChI", self.inchi),
+            ("InChIKey", self.inchikey),
+        ):
+            if value is not None:
+                result[key] = value
+        return result
+
+    @property
+    def n_atoms(self):
+        """The number of atoms, or None if there is no structure."""
+        return None if self.atno is None else len(self.atno)
+
+    @property
+    def n_conformers(self):
+        """The number of conformers, or None if there is no structure."""
+        if self.atno is None:
+            return None
+        return 1 if self.conformers is None else len(self.conformers)
+
+    @property
+    def n_bonds(self):
+        """The number of bonds, or None if there is no structure."""
+        return None if self.bonds is None else len(self.bonds)
+
+    @classmethod
+    def from_configuration(cls, configuration, text=None):
+        """The record of the structure in a configuration.
+
+        Parameters
+        ----------
+        configuration : molsystem._Configuration
+            The configuration holding the structure.
+        text : str = None
+            The line notation the structure was created from.
+
+        Returns
+        -------
+        StructureRecord
+        """
+        atoms = configuration.atoms
+        index = {atom_id: i for i, atom_id in enumerate(atoms.ids)}
+        bonds = configuration.bonds.get_as_dict()
+        formal_charges = None
+        if "formal_charge" in atoms:
+            formal_charges = np.array(
+                atoms.get_column_data("formal_charge"), dtype=np.int8
+            )
+            if not formal_charges.any():
+                formal_charges = None
+        return cls(
+            text,
+            atno=np.array(atoms.atomic_numbers, dtype=np.uint8),
+            coordinates=np.array(
+                atoms.get_coordinates(fractionals=False), dtype=np.float64
+            ).reshape(-1, 3),
+            bonds=np.array(
+                [
+                    (index[i], index[j], order)
+                    for i, j, order in zip(bonds["i"], bonds["j"], bonds["bondorder"])
+                ],
+                dtype=np.int32,
+            ).reshape(-1, 3),
+            charge=configuration.charge,
+            formal_charges=formal_charges,
+            spin_multiplicity=configuration.spin_multiplicity,
+        )
+
+    def to_configuration(self, configuration):
+        """Put the structure into a configuration, replacing its contents.
+
+        Parameters
+        ----------
+        configuration : molsystem._Configuration
+            The configuration to hold the structure.
+        """
+        if not self.created:
+            raise RuntimeError(f"The structure for '{self.text}' was not created.")
+
+        configuration.clear()
+        if self.cell is None:
+            configuration.periodicity = 0
+        else:
+            configuration.periodicity = 3
+            configuration.coordinate_system = "Cartesian"
+            configuration.cell.parameters = [*self.cell.tolist(), 90.0, 90.0, 90.0]
+        xyz = self.coordinates
+        columns = {}
+        if self.formal_charges is not None:
+            if "formal_charge" not in configuration.atoms:
+                configuration.atoms.add_attribute(
+                    "formal_charge", coltype="int", default=0
+                )
+            columns["formal_charge"] = self.formal_charges.tolist()
+        ids = configuration.atoms.append(
+            x=xyz[:, 0].tolist(),
+            y=xyz[:, 1].tolist(),
+            z=xyz[:, 2].tolist(),
+            atno=self.atno.tolist(),
+            **columns,
+        )
+        bonds = self.bonds
+        if len(bonds) > 0:
+            configuration.bonds.append(
+                i=[ids[i] for i in bonds[:, 0]],
+                j=[ids[j] for j in bonds[:, 1]],
+                bondorder=bonds[:, 2].tolist(),
+            )
+        configuration.charge = self.charge
+        configuration.spin_multiplicity = self.spin_multiplicity
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+"""A table of the results of a batch, as Apache Parquet or Arrow.
+
+There is one row for each line notation in the batch, as given, including those
+that could not be converted or that were filtered out, with the identifiers
+computed by the workers and the time each structure took. When the structures
+are written to the database, the rows follow any fallbacks there. The rows are
+collected into record batches and written as each fills, so that large batches
+need not be held in memory.
+
+pyarrow is optional, and only needed if a table is requested. It is installed
+with the 'results-table' extra.
+"""
+
+import logging
+from pathlib import Path
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+# The extensions for the formats
+extensions = {"Parquet": ".parquet", "Arrow": ".arrow"}
+
+# The columns and their types, as the names of pyarrow types
+columns = {
+    "id": "string",
+    "input": "string",
+    "notation": "string",
+    "backend": "string",
+    "canonical_smiles": "string",
+    "inchikey": "string",
+    "n_atoms": "int32",
+    "n_conformers": "int32",
+    "formula": "string",
+    "time": "float64",
+    "error": "string",
+    "filtered": "string",
+}
+
+
+def schema():
+    """The schema of the table."""
+    return pyarrow.schema(
+        [(name, getattr(pyarrow, kind)()) for name, kind in columns.items()]
+    )
+
+
+class ResultsTable(object):
+    """Write the results of a batch to a Parquet or Arrow file.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The file to write, without its extension.
+    file_format : str = "Parquet"
+        The format, "Parquet" or "Arrow", which is the Arrow IPC file format.
+    batch_size : int = 10000
+        The number of rows in each record batch.
+    """
+
+    def __init__(self, path, file_format="Parquet", batch_size=10000):
+        if pyarrow is None:
+            raise RuntimeError(
+                "Writing the results table needs the 'pyarrow' package, which is "
+                "not installed."
+            )
+        if file_format not in extensions:
+            raise ValueError(f"Format '{file_format}' is not supported.")
+
+        self.path = Path(path).with_suffix(extensions[file_format])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = max(batch_size, 1)
+        self.n_rows = 0
+
+        self._schema = schema()
+        if file_format == "Parquet":
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+        else:
+            self._writer = pyarrow.ipc.new_file(str(self.path), self._schema)
+        self._columns = {name: [] for name in columns}
+
+    def add(self, record):
+        """Add the row for a structure from the engine.
+
+        Parameters
+        ----------
+        record : StructureRecord
+            The structure, with its identifier in the batch, which may be a
+            failure.
+        """
+        row = self._columns
+        row["id"].append(record.identifier)
+        row["input"].append(record.text if record.input is None else record.input)
+        row["notation"].append(record.notation)
+        row["backend"].append(record.flavor)
+        row["canonical_smiles"].append(record.canonical_smiles)
+        row["inchikey"].append(record.inchikey)
+        row["n_atoms"].append(record.n_atoms)
+        row["n_conformers"].append(record.n_conformers)
+        row["formula"].append(record.formula)
+        row["time"].append(record.time)
+        row["error"].append(record.error)
+        row["filtered"].append(record.filtered)
+
+        if len(row["id"]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the pending rows as a record batch."""
+        if len(self._columns["id"]) == 0:
+            return
+        batch = pyarrow.RecordBatch.from_pydict(self._columns, schema=self._schema)
+        self._writer.write_batch(batch)
+        self.n_rows += batch.num_rows
+        self._columns = {name: [] for name in columns}
+
+    def close(self):
+        """Write any pending rows and finish the file."""
+        self.flush()
+        self._writer.close()
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+"""Build molecules from the coordinates of their scaffold.
+
+In a combinatorial library most molecules share one of a few scaffolds -- the
+ring systems and the linkers between them -- and differ only in their side
+chains, which are acyclic. Embedding the whole of each molecule repeats the
+expensive part, the scaffold, every time. Instead the scaffold is embedded once,
+and each molecule is built from its coordinates by embedding only small
+fragments, each holding a side chain and the atoms it is attached to, and
+superposing them onto the scaffold.
+"""
+
+import logging
+
+import numpy as np
+from rdkit import Chem
+
+logger = logging.getLogger(__name__)
+
+# Side chains closer to other atoms than this fraction of the sum of their van der
+# Waals radii are embedded again, up to the given number of times.
+contact_fraction = 0.7
+attempts = 5
+
+_table = Chem.GetPeriodicTable()
+_vdw = np.array([_table.GetRvdw(z) for z in range(119)])
+
+
+def scaffold(mol):
+    """The Murcko scaffold of a molecule, or None if it has no rings.
+
+    The scaffold is the ring systems, the linkers between them, and any atoms
+    double bonded to those. Each side chain is replaced by a hydrogen, rather
+    than being removed, so that the stereochemistry of the atoms it was attached
+    to is kept.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with or without hydrogens.
+
+    Returns
+    -------
+    rdkit.Chem.Mol or None
+        The scaffold, without hydrogens.
+    """
+    heavy = Chem.RemoveHs(mol)
+    ring_info = heavy.GetRingInfo()
+    if ring_info.NumRings() == 0:
+        return None
+
+    # Strip the chains back to the rings, then add the double bonded atoms
+    framework = set(range(heavy.GetNumAtoms()))
+    ends = [
+        a.GetIdx()
+        for a in heavy.GetAtoms()
+        if a.GetDegree() <= 1 and not ring_info.NumAtomRings(a.GetIdx())
+    ]
+    while len(ends) > 0:
+        i = ends.pop()
+        framework.discard(i)
+        for atom in heavy.GetAtomWithIdx(i).GetNeighbors():
+            j = atom.GetIdx()
+            if j in framework and not ring_info.NumAtomRings(j):
+                if sum(1 for a in atom.GetNeighbors() if a.GetIdx() in framework) <= 1:
+                    ends.append(j)
+    keep = set(framework)
+    for bond in heavy.GetBonds():
+        i, j = bond.GetBeginAtomIdx(), bond.GetEndAtomIdx()
+        if bond.GetBondType() == Chem.BondType.DOUBLE:
+            if i in framework and heavy.GetAtomWithIdx(j).GetDegree() == 1:
+                keep.add(j)
+            elif j in framework and heavy.GetAtomWithIdx(i).GetDegree() == 1:
+                keep.add(i)
+
+    rw = Chem.RWMol(heavy)
+    core = frozenset(keep)
+    for bond in heavy.GetBonds():
+        i, j = bond.GetBeginAtomIdx(), bond.GetEndAtomIdx()
+        if (i in core) == (j in core):
+            continue
+        outside = rw.GetAtomWithIdx(j if i in core else i)
+        outside.SetAtomicNum(1)
+        outside.SetFormalCharge(0)
+        outside.SetIsotope(0)
+        outside.SetIsAromatic(False)
+        outside.SetNoImplicit(True)
+        outside.SetNumExplicitHs(0)
+        outside.SetChiralTag(Chem.ChiralType.CHI_UNSPECIFIED)
+        rw.GetBondBetweenAtoms(i, j).SetBondType(Chem.BondType.SINGLE)
+        keep.add(outside.GetIdx())
+    for i in sorted(set(range(rw.GetNumAtoms())) - keep, reverse=True):
+        rw.RemoveAtom(i)
+    result = rw.GetMol()
+    Chem.SanitizeMol(result)
+    result = Chem.RemoveHs(result)
+    Chem.AssignStereochemistry(result, cleanIt=True, force=True)
+    return result
+
+
+def superpose(mobile, target):
+    """The proper rotation and translation best superposing points on others.
+
+    Parameters
+    ----------
+    mobile : numpy.ndarray
+        The n x 3 points to move.
+    target : numpy.ndarray
+        The n x 3 points to superpose them on.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The 3 x 3 rotation and the translation, applied as x @ rotation + shift.
+    """
+    a = mobile.mean(axis=0)
+    b = target.mean(axis=0)
+    u, _, vt = np.linalg.svd((mobile - a).T @ (target - b))
+    if np.linalg.det(u @ vt) < 0:
+        u[:, 2] = -u[:, 2]
+    rotation = u @ vt
+    return rotation, b - a @ rotation
+
+
+def fragment(kekulized, keep, anchors):
+    """A molecule holding some of the atoms of another, capped with hydrogens.
+
+    Parameters
+    ----------
+    kekulized : rdkit.Chem.Mol
+        The whole molecule, with hydrogens, kekulized without aromatic flags so
+        that parts of rings can be cut out.
+    keep : set(int)
+        The atoms to keep.
+    anchors : [int]
+        The atoms that lose bonds and are capped with hydrogens. Their
+        stereochemistry is not kept, and they are labeled with different
+        isotopes so that the stereochemistry of the atoms bonded to them is.
+
+    Returns
+    -------
+    rdkit.Chem.Mol, dict(int, int)
+        The fragment, with hydrogens, and the index in it of each atom kept.
+    """
+    rw = Chem.RWMol(kekulized)
+    for label, i in enumerate(anchors, start=1):
+        atom = rw.GetAtomWithIdx(i)
+        atom.SetIsotope(label)
+        atom.SetChiralTag(Chem.ChiralType.CHI_UNSPECIFIED)
+        atom.SetNoImplicit(False)
+        atom.SetNumExplicitHs(0)
+        for bond in atom.GetBonds():
+            bond.SetStereo(Chem.BondStereo.STEREONONE)
+    # Removing atoms keeps the order of the others, and of the bonds of any
+    # atom that keeps all its neighbors, so its stereochemistry is unchanged.
+    for i in sorted(set(range(rw.GetNumAtoms())) - keep, reverse=True):
+        rw.RemoveAtom(i)
+    result = rw.GetMol()
+    Chem.SanitizeMol(result)
+    Chem.AssignStereochemistry(result, cleanIt=True, force=True)
+    return Chem.AddHs(result), {old: new for new, old in enumerate(sorted(keep))}
+
+
+def build(mol, template, embed):
+    """Coordinates for a molecule from the embedded structure of its scaffold.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, with hydrogens.
+    template : rdkit.Chem.Mol
+        The scaffold of the molecule, with hydrogens and 3-D coordinates.
+    embed : callable
+        A function embedding a small molecule with hydrogens in place, given it
+        and the number of the attempt, which should give a different structure.
+
+    Returns
+    -------
+    numpy.ndarray or None
+        The n x 3 coordinates, or None if the molecule can't be built this way.
+    """
+    query = Chem.RemoveHs(template)
+    match = mol.GetSubstructMatch(query, useChirality=True)
+    if len(match) == 0:
+        return None
+    core = set(match)
+    template_xyz = template.GetConformer().GetPositions()
+
+    # The heavy atoms of the scaffold, and the hydrogens of any atoms without
+    # side chains, are where they are in the template. AddHs puts the
+    # hydrogens after the heavy atoms, so those are numbered as in the query.
+    xyz = np.full((mol.GetNumAtoms(), 3), np.nan)
+    xyz[list(match)] = template_xyz[: len(match)]
+    attachments = []
+    for t, i in enumerate(match):
+        outside = [
+            a for a in mol.GetAtomWithIdx(i).GetNeighbors() if a.GetIdx() not in core
+        ]
+        if any(a.GetAtomicNum() > 1 for a in outside):
+            attachments.append(i)
+            continue
+        hydrogens = [
+            a.GetIdx()
+            for a in template.GetAtomWithIdx(t).GetNeighbors()
+            if a.GetAtomicNum() == 1
+        ]
+        if len(hydrogens) != len(outside):
+            return None
+        xyz[[a.GetIdx() for a in outside]] = template_xyz[hydrogens]
+
+    # Each side chain, with its attachment point, the neighbors of that in the
+    # scaffold to superpose it, and their hydrogens, is embedded on its own.
+    atno = np.array([a.GetAtomicNum() for a in mol.GetAtoms()])
+    kekulized = Chem.RWMol(mol)
+    Chem.Kekulize(kekulized, clearAromaticFlags=True)
+    for i in attachments:
+        anchors = [a.GetIdx() for a in mol.GetAtomWithIdx(i).GetNeighbors()]
+        shell = [j for j in anchors if j in core]
+        if len(shell) < 2:
+            return None
+        side = set()
+        stack = [j for j in anchors if j not in core]
+        while len(stack) > 0:
+            j = stack.pop()
+            if j in side:
+                continue
+            side.add(j)
+            stack.extend(
+                a.GetIdx()
+                for a in mol.GetAtomWithIdx(j).GetNeighbors()
+                if a.GetIdx() not in core
+            )
+        piece, index = fragment(kekulized, side | {i, *shell}, shell)
+        points = [i, *shell]
+        moved = sorted(side)
+        # Check the side chain against the atoms already placed, other than its
+        # attachment point and the atoms bonded to that.
+        placed = np.flatnonzero(~np.isnan(xyz[:, 0]))
+        placed = placed[~np.isin(placed, points)]
+        limits = contact_fraction * (
+            _vdw[atno[moved]][:, np.newaxis] + _vdw[atno[placed]][np.newaxis, :]
+        )
+        best = None
+        for attempt in range(attempts):
+            embed(piece, attempt)
+            piece_xyz = piece.GetConformer().GetPositions()
+            rotation, shift = superpose(
+                piece_xyz[[index[j] for j in points]], xyz[points]
+            )
+            trial = piece_xyz[[index[j] for j in moved]] @ rotation + shift
+            distances = np.linalg.norm(
+                trial[:, np.newaxis, :] - xyz[placed][np.newaxis, :, :], axis=2
+            )
+            room = (distances / limits).min() if distances.size > 0 else np.inf
+            if best is None or room > best[0]:
+                best = (room, trial)
+            if room >= 1:
+                break
+        xyz[moved] = best[1]
+
+    if np.isnan(xyz).any():
+        return None
+    return xyz
+
+
+def same_stereo(mol, built):
+    """Whether a built structure has the stereochemistry specified for a molecule.
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+        The molecule, as created from its line notation.
+    built : rdkit.Chem.Mol
+        The same molecule, with 3-D coordinates.
+
+    Returns
+    -------
+    bool
+    """
+    check = Chem.Mol(built)
+    Chem.AssignStereochemistryFrom3D(check)
+    # Only what was specified counts
+    for atom, other in zip(mol.GetAtoms(), check.GetAtoms()):
+        if atom.GetChiralTag() == Chem.ChiralType.CHI_UNSPECIFIED:
+            other.SetChiralTag(Chem.ChiralType.CHI_UNSPECIFIED)
+    for bond, other in zip(mol.GetBonds(), check.GetBonds()):
+        if bond.GetStereo() == Chem.BondStereo.STEREONONE:
+            other.SetStereo(Chem.BondStereo.STEREONONE)
+    return Chem.MolToSmiles(check) == Chem.MolToSmiles(mol)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""Cost-aware scheduling of batches of structures.
+
+The time to embed a molecule grows steeply with the number of heavy atoms and
+with the number of rings and stereocenters. If a few large molecules are left
+to the end of a batch most of the workers sit idle waiting for them, so the
+structures are handed out largest first, in small chunks while they are
+expensive and in larger chunks once they are cheap.
+"""
+
+import re
+
+# The tokens in a SMILES string that matter for the cost: bracket atoms, the
+# atoms of the organic subset, ring closures and double bond stereochemistry.
+_smiles_tokens = re.compile(
+    r"(\[[^\]]*\])|(Br|Cl|[BCNOPSFI]|[bcnops])|(%\d\d|\d)|([/\\])"
+)
+# The formula layer of an InChI, e.g. C2H6O in InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3
+_formula_tokens = re.compile(r"([A-Z][a-z]?)(\d*)")
+# Bracket atoms that are hydrogens, e.g. [H], [2H] or [H+], but not [Hg]
+_bracket_hydrogen = re.compile(r"\[\d*H[^a-z]")
+
+# Assumed number of heavy atoms for strings whose size can't be seen, such as
+# InChIKeys and chemical names.
+default_heavy_atoms = 25
+
+
+def smiles_counts(text):
+    """Count the heavy atoms, rings and stereocenters in a SMILES string.
+
+    This only tokenizes the string, without building a molecule, so it is cheap
+    enough to run over very large batches.
+
+    Parameters
+    ----------
+    text : str
+        The SMILES string.
+
+    Returns
+    -------
+    (int, int, int)
+        The number of heavy atoms, ring closures and stereocenters.
+    """
+    n_heavy = 0
+    n_ring_bonds = 0
+    n_stereo = 0
+    n_slashes = 0
+    for bracket, atom, ring, slash in _smiles_tokens.findall(text):
+        if bracket != "":
+            # Skip explicit hydrogens such as [H] or [2H]
+            if _bracket_hydrogen.match(bracket) is None:
+                n_heavy += 1
+            if "@" in bracket:
+                n_stereo += 1
+        elif atom != "":
+            n_heavy += 1
+        elif ring != "":
+            n_ring_bonds += 1
+        elif slash != "":
+            n_slashes += 1
+    return n_heavy, n_ring_bonds // 2, n_stereo + n_slashes // 2
+
+
+def estimate_cost(text, notation="SMILES"):
+    """Estimate the relative cost of creating a structure.
+
+    Parameters
+    ----------
+    text : str
+        The line notation for the structure.
+    notation : str = "SMILES"
+        The notation of the string. InChIs are sized from their formula layer;
+        anything other than SMILES or InChI, e.g. a name, is given a typical cost.
+
+    Returns
+    -------
+    float
+        The estimated cost, in arbitrary units.
+    """
+    n_rings = 0
+    n_stereo = 0
+    if text.startswith("InChI="):
+        n_heavy = 0
+        layers = text.split("/")
+        if len(layers) > 1:
+            for element, count in _formula_tokens.findall(layers[1]):
+                if element != "H":
+                    n_heavy += int(count) if count != "" else 1
+    elif notation in ("SMILES", "SMILES or name", "perceive"):
+        n_heavy, n_rings, n_stereo = smiles_counts(text)
+    else:
+        n_heavy = default_heavy_atoms
+
+    n_heavy = max(n_heavy, 1)
+    return n_heavy**2 * (1.0 + 0.5 * n_rings) * (1.0 + 0.25 * n_stereo)
+
+
+def schedule(costs, n_workers, max_chunk=64):
+    """Split a batch into chunks, most expensive first.
+
+    The chunks are formed by guided self-scheduling on the estimated costs: each
+    chunk takes about 1/(2 * n_workers) of the cost remaining. The first chunks
+    therefore hold a single large molecule each, and the chunks grow as the
+    molecules get cheaper, cutting the overhead of dispatching many small
+    molecules while keeping the end of the batch finely divided.
+
+    Parameters
+    ----------
+    costs : [float]
+        The estimated cost of each structure.
+    n_workers : int
+        The number of workers that will process the chunks.
+    max_chunk : int = 64
+        The maximum number of structures in a chunk.
+
+    Returns
+    -------
+    [[int]]
+        The indices of the structures in each chunk, in the order to dispatch them.
+    """
+    n_workers = max(n_workers, 1)
+    order = sorted(range(len(costs)), key=lambda i: costs[i], reverse=True)
+
+    remaining = sum(costs)
+    target = remaining / (2 * n_workers)
+    chunks = []
+    chunk = []
+    chunk_cost = 0.0
+    for i in order:
+        chunk.append(i)
+        chunk_cost += costs[i]
+        if chunk_cost >= target or len(chunk) >= max_chunk:
+            chunks.append(chunk)
+            remaining -= chunk_cost
+            target = remaining / (2 * n_workers)
+            chunk = []
+            chunk_cost = 0.0
+    if len(chunk) > 0:
+        chunks.append(chunk)
+    return chunks
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+
+"""Write the structures from a batch to sharded SDF or XYZ files.
+
+A single large file written from one thread is a bottleneck at the end of a big
+batch. The structures are instead spread over a number of shards, each written
+and optionally compressed by its own thread as the structures arrive, with a
+manifest listing the contents of each shard so that the shards can be read in
+parallel.
+"""
+
+import gzip
+import json
+import logging
+from pathlib import Path
+import queue
+import threading
+import zlib
+
+from molsystem.elements import atno_to_symbol
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# The extensions for the formats and compressions
+extensions = {"SDF": ".sdf", "XYZ": ".xyz"}
+compressions = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+# Bond orders in SDF files, where aromatic bonds are 4
+sdf_bond_orders = {1: 1, 2: 2, 3: 3, 5: 4}
+sdf_atom_tail = " 0" + 11 * "  0"
+# The most atoms on one 'M  CHG' line
+sdf_charges_per_line = 8
+
+
+def frames(record):
+    """The coordinates of each conformer of a structure from the engine.
+
+    Parameters
+    ----------
+    record : StructureRecord
+        The structure.
+
+    Returns
+    -------
+    [numpy.ndarray]
+        The n x 3 coordinates of each conformer.
+    """
+    if record.conformers is None:
+        return [record.coordinates]
+    return list(record.conformers)
+
+
+def sdf_text(record):
+    """An SDF (V2000) record for a structure from the engine.
+
+    Several conformers are written as consecutive records with the same name. The
+    formal charges of the atoms are given in 'M  CHG' lines.
+
+    Parameters
+    ----------
+    record : StructureRecord
+        The structure, with its identifier in the batch.
+
+    Returns
+    -------
+    str
+        The records, each ending with '$$$$'.
+    """
+    atno = record.atno.tolist()
+    bonds = record.bonds.tolist()
+    charged = []
+    if record.formal_charges is not None:
+        charged = [
+            (i + 1, q) for i, q in enumerate(record.formal_charges.tolist()) if q != 0
+        ]
+
+    lines = []
+    for xyz in frames(record):
+        lines.extend(
+            [
+                record.identifier,
+                "  SEAMM             3D",
+                "",
+                f"{len(atno):3d}{len(bonds):3d}  0  0  0  0  0  0  0  0999 V2000",
+            ]
+        )
+        for n, (x, y, z) in zip(atno, xyz.tolist()):
+            symbol = atno_to_symbol[n]
+            lines.append(f"{x:10.4f}{y:10.4f}{z:10.4f} {symbol:<3}" + sdf_atom_tail)
+        for i, j, order in bonds:
+            lines.append(f"{i + 1:3d}{j + 1:3d}{sdf_bond_orders[order]:3d}  0")
+        for start in range(0, len(charged), sdf_charges_per_line):
+            part = charged[start : start + sdf_charges_per_line]
+            lines.append(
+                f"M  CHG{len(part):3d}" + "".join(f" {i:3d} {q:3d}" for i, q in part)
+            )
+        lines.append("M  END")
+        lines.extend(
+            [
+                "> <input>",
+                record.text,
+                "",
+                "> <charge>",
+                str(record.charge),
+                "",
+                "> <spin multiplicity>",
+                str(record.spin_multiplicity),
+                "",
+                "$$$$",
+            ]
+        )
+    lines.append("")
+    return "\n".join(lines)
+
+
+def xyz_text(record):
+    """An XYZ record for a structure from the engine.
+
+    Several conformers are written as consecutive frames.
+
+    Parameters
+    ----------
+    record : StructureRecord
+        The structure, with its identifier in the batch.
+
+    Returns
+    -------
+    str
+        The record.
+    """
+    atno = record.atno.tolist()
+
+    lines = []
+    for xyz in frames(record):
+        lines.extend([str(len(atno)), f"{record.identifier} {record.text}"])
+        for n, (x, y, z) in zip(atno, xyz.tolist()):
+            lines.append(f"{atno_to_symbol[n]:<2} {x:12.6f} {y:12.6f} {z:12.6f}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+formatters = {"SDF": sdf_text, "XYZ": xyz_text}
+
+
+def _open(path, compression):
+    """Open a shard for writing text, compressing it if requested."""
+    if compression == "none":
+        return open(path, "w")
+    if compression == "gzip":
+        return gzip.open(path, "wt", compresslevel=6)
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError(
+                "zstd compression needs the 'zstandard' package, which is not "
+                "installed."
+            )
+        return zstandard.open(path, "wt")
+    raise ValueError(f"Compression '{compression}' is not supported.")
+
+
+class _Shard(object):
+    """One shard, written by its own thread from a queue of structures."""
+
+    def __init__(self, path, file_format, compression, max_pending):
+        self.path = Path(path)
+        self.identifiers = []
+        self.error = None
+
+        self._format = formatters[file_format]
+        self._fd = _open(self.path, compression)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(
+            target=self._run, name=f"shard {self.path.name}", daemon=True
+        )
+        self._thread.start()
+
+    def add(self, record):
+        self.identifiers.append(record.identifier)
+        self._queue.put(record)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                if self.error is None:
+                    try:
+                        self._fd.write(self._format(record))
+                    except Exception as e:
+                        logger.error(f"Error writing {self.path}: {e}")
+                        self.error = e
+        finally:
+            self._fd.close()
+
+
+class ShardedWriter(object):
+    """Write structures from the engine to sharded SDF or XYZ files.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The directory for the shards and manifest, which is created if needed.
+    file_format : str = "SDF"
+        The format of the shards, "SDF" or "XYZ".
+    n_shards : int = 4
+        The number of shards, each written by its own thread.
+    compression : str = "none"
+        How to compress the shards: "none", "gzip" or "zstd".
+    shard_by : str = "round robin"
+        How to assign structures to shards: "round robin" or "hash", which puts a
+        structure in the same shard in every run, based on its identifier.
+    max_pending : int = 256
+        The number of structures waiting for each shard before adding more
+        blocks.
+    """
+
+    def __init__(
+        self,
+        path,
+        file_format="SDF",
+        n_shards=4,
+        compression="none",
+        shard_by="round robin",
+        max_pending=256,
+    ):
+        if file_format not in formatters:
+            raise ValueError(f"Format '{file_format}' is not supported.")
+        if shard_by not in ("round robin", "hash"):
+            raise ValueError(f"Cannot shard by '{shard_by}'.")
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.file_format = file_format
+        self.compression = compression
+        self.shard_by = shard_by
+        self.n_written = 0
+
+        n_shards = max(n_shards, 1)
+        suffix = extensions[file_format] + compressions[compression]
+        width = len(str(n_shards - 1))
+        self._shards = []
+        try:
+            for shard in range(n_shards):
+                self._shards.append(
+                    _Shard(
+                        self.path / f"shard_{shard:0{width}d}{suffix}",
+                        file_format,
+                        compression,
+                        max_pending,
+                    )
+                )
+        except Exception:
+            self.close()
+            raise
+
+    def add(self, record):
+        """Add a structure from the engine, ignoring failures and filtered ones.
+
+        Parameters
+        ----------
+        record : StructureRecord
+            The structure, with its identifier in the batch.
+        """
+        if not record.created:
+            return
+        if self.shard_by == "hash":
+            shard = zlib.crc32(record.identifier.encode()) % len(self._shards)
+        else:
+            shard = self.n_written % len(self._shards)
+        self._shards[shard].add(record)
+        self.n_written += 1
+
+    def close(self):
+        """Finish writing the shards and write the manifest."""
+        for shard in self._shards:
+            shard.close()
+
+        manifest = {
+            "format": self.file_format,
+            "compression": self.compression,
+            "shard by": self.shard_by,
+            "n_structures": self.n_written,
+            "shards": [
+                {
+                    "file": shard.path.name,
+                    "n_structures": len(shard.identifiers),
+                    "identifiers": shard.identifiers,
+                }
+                for shard in self._shards
+            ],
+        }
+        with open(self.path / "manifest.json", "w") as fd:
+            json.dump(manifest, fd, indent=4)
+
+        errors = [shard for shard in self._shards if shard.error is not None]
+        if len(errors) > 0:
+            raise RuntimeError(
+                f"Error writing the shard {errors[0].path}: {errors[0].error}"
+            )
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""An aggregated summary of a batch, in place of the output for each structure.
+
+Formatting and printing several lines for every structure is a measurable part
+of the time for a large batch, and produces very large output. The summary
+instead counts the structures by notation and toolkit as they arrive, and is
+printed once at the end.
+"""
+
+from collections import Counter
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BatchSummary(object):
+    """Collect the counts and timings for a batch of structures."""
+
+    def __init__(self):
+        self.n_structures = 0
+        self.n_failed = 0
+        self.n_filtered = 0
+        self.counts = Counter()
+        self.times = Counter()
+
+    def add(self, record):
+        """Count a structure from the engine.
+
+        Parameters
+        ----------
+        record : StructureRecord
+            The structure, which may be a failure or filtered.
+        """
+        self.n_structures += 1
+        if record.failed:
+            self.n_failed += 1
+            key = ("failed", "")
+        elif record.filtered is not None:
+            self.n_filtered += 1
+            key = ("filtered", "")
+        else:
+            key = (record.notation, record.flavor)
+        self.counts[key] += 1
+        if record.time is not None:
+            self.times[key] += record.time
+
+    def close(self):
+        """Nothing to finish; the summary is kept until reported."""
+        pass
+
+    def report(self, t, indent=""):
+        """The text of the summary.
+
+        Parameters
+        ----------
+        t : float
+            The elapsed time for the batch, in seconds.
+        indent : str = ""
+            The indentation for each line.
+
+        Returns
+        -------
+        str
+            The summary, formatted as a small table.
+        """
+        rate = self.n_structures / t if t > 0 else 0.0
+        lines = [
+            f"Converted {self.n_structures} line notations at {rate:.1f} per second.",
+            f"{self.n_failed} failed and {self.n_filtered} were filtered out.",
+            "",
+            f"{'Notation':<16} {'Toolkit':<10} {'Count':>10} {'Worker time (s)':>16}",
+            f"{16 * '-'} {10 * '-'} {10 * '-'} {16 * '-'}",
+        ]
+        for (notation, flavor), count in self.counts.most_common():
+            time = self.times[(notation, flavor)]
+            lines.append(f"{notation:<16} {flavor:<10} {count:>10d} {time:>16.2f}")
+        return "\n".join(indent + line if line != "" else "" for line in lines)
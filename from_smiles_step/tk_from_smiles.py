@@ -33,23 +33,132 @@ class TkFromSMILES(seamm.TkNode):
         """Create a dialog for editing the SMILES string"""
         frame = super().create_dialog("Edit SMILES Step")
 
-        # Create the widgets and grid them in
+        # Create the widgets
         P = self.node.parameters
         for key in P:
             self[key] = P[key].widget(frame)
 
-        widgets = []
-        row = 0
-        for item in (
+        # and lay them out again when a choice changes which options apply
+        for key in (
+            "action",
             "notation",
             "smiles string",
-            "smiles flavor",
-            "structure handling",
-            "system name",
-            "configuration name",
+            "fragments",
+            "geometry",
+            "number of conformers",
+            "number of copies",
+            "arrangement",
+            "smiles file",
+            "batch output",
+            "structure files",
         ):
+            self[key].combobox.bind("<<ComboboxSelected>>", self.reset_dialog)
+            self[key].combobox.bind("<Return>", self.reset_dialog)
+            self[key].combobox.bind("<FocusOut>", self.reset_dialog)
+
+        self.reset_dialog()
+
+    def reset_dialog(self, widget=None):
+        """Lay out the widgets for the options that apply to the current choices."""
+        frame = self["frame"]
+        for slave in frame.grid_slaves():
+            slave.grid_forget()
+
+        action = self["action"].get()
+        notation = self["notation"].get()
+        geometry = self["geometry"].get()
+        n_copies = self["number of copies"].get()
+        # A variable may hold a list of structures, so may be a batch.
+        smiles = self["smiles string"].get()
+        batch = self["smiles file"].get() != "" or smiles[:1] in ("$", "=")
+        output = self["batch output"].get()
+
+        items = ["action"]
+        if action == "embed deferred structures":
+            items.extend(self.embedding_items())
+            items.extend(self.worker_items())
+            items.append("output")
+        else:
+            items.extend(("notation", "smiles string"))
+            if notation in ("perceive", "SMILES"):
+                items.extend(("smiles flavor", "fragments"))
+                if self["fragments"].get() == "remove salts":
+                    items.append("salts")
+            elif notation == "repeat unit":
+                items.extend(("degree of polymerization", "head group", "tail group"))
+            items.append("geometry")
+            if geometry == "3D":
+                items.extend(self.embedding_items())
+            if geometry in ("3D", "deferred") or (not batch and n_copies != "1"):
+                items.append("random seed")
+            if not batch:
+                items.append("number of copies")
+                if n_copies != "1":
+                    items.append("arrangement")
+                    if self["arrangement"].get() == "packed in a periodic cell":
+                        items.extend(
+                            ("mixture composition", "density", "minimum distance")
+                        )
+            items.extend(("output", "smiles file"))
+            if batch:
+                items.extend(self.worker_items())
+                items.extend(
+                    (
+                        "maximum heavy atoms",
+                        "maximum molecular weight",
+                        "maximum rotatable bonds",
+                        "maximum ring size",
+                        "excluded SMARTS",
+                        "batch output",
+                    )
+                )
+                if output != "database":
+                    items.append("columnar store")
+                items.append("structure files")
+                if self["structure files"].get() != "none":
+                    items.extend(
+                        (
+                            "structure files directory",
+                            "number of shards",
+                            "shard by",
+                            "compression",
+                        )
+                    )
+                items.append("results table")
+            if not batch or output != "columnar store":
+                items.append("structure handling")
+                if batch:
+                    items.append("subsequent structure handling")
+                items.extend(("system name", "configuration name"))
+
+        widgets = []
+        for row, item in enumerate(items):
             self[item].grid(row=row, column=0, columnspan=2, sticky=tk.EW)
             widgets.append(self[item])
-            row += 1
 
         sw.align_labels(widgets)
+
+    def embedding_items(self):
+        """The options for embedding structures in 3-D."""
+        items = [
+            "embedding quality",
+            "maximum iterations",
+            "force field cleanup",
+            "number of threads",
+            "number of conformers",
+        ]
+        if self["number of conformers"].get() != "1":
+            items.append("conformer RMSD threshold")
+        items.extend(
+            ("reuse scaffolds", "fragment assembly threshold", "validate structures")
+        )
+        return items
+
+    def worker_items(self):
+        """The options for the workers and database transactions of a batch."""
+        return [
+            "number of workers",
+            "tasks per worker",
+            "worker transport",
+            "structures per transaction",
+        ]
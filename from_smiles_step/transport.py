@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+"""Return structures from the workers through shared memory.
+
+Pickling the atoms, bonds and coordinates in a worker and unpickling them in the
+step's process copies every array twice. Instead, a worker packs all the
+structures from a chunk into one block of shared memory and returns only a small
+descriptor, and the step's process maps the block and reads the arrays as NumPy
+views, without copying them.
+
+The parent names the blocks and tracks them from the moment the descriptor
+arrives, rather than the workers, so that any block not yet mapped when a batch
+is stopped early, or the pool is terminated, is still removed.
+"""
+
+import itertools
+import logging
+from multiprocessing import resource_tracker, shared_memory
+import os
+import weakref
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# The number of blocks named in this process
+_counter = itertools.count()
+
+
+def block_name():
+    """A new name for a block of shared memory, unique to this process."""
+    return f"fss_{os.getpid()}_{next(_counter)}"
+
+
+def _tracker_name(name):
+    """The name of a block as the resource tracker knows it."""
+    return "/" + name
+
+
+def track(name):
+    """Have this process's resource tracker remove a block if it is left behind.
+
+    Parameters
+    ----------
+    name : str
+        The name of the block.
+    """
+    if os.name == "posix":
+        resource_tracker.register(_tracker_name(name), "shared_memory")
+
+
+def release(name):
+    """Remove a block that was never mapped, if it exists.
+
+    Parameters
+    ----------
+    name : str
+        The name of the block.
+    """
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def _layout(n_atoms, n_bonds, n_conformer_atoms):
+    """The offsets of the arrays in a block, and its size in bytes."""
+    coordinates = 8 * ((n_atoms + 7) // 8)
+    bonds = coordinates + 8 * 3 * n_atoms
+    conformers = bonds + 8 * ((4 * 3 * n_bonds + 7) // 8)
+    size = conformers + 8 * 3 * n_conformer_atoms
+    return coordinates, bonds, conformers, max(size, 1)
+
+
+def pack(results, name=None):
+    """Put the arrays from a chunk of structures into a new block of shared memory.
+
+    The block is not tracked in this process, which is expected to be a worker,
+    but by the process it is returned to, which removes it.
+
+    Parameters
+    ----------
+    results : [(int, StructureRecord)]
+        The index and record for each structure, as from the engine. The arrays
+        are removed from the records.
+    name : str = None
+        The name for the block, from block_name(), or None for a random one.
+
+    Returns
+    -------
+    dict(str, any), [(int, StructureRecord)], [(int, ...) or None]
+        The descriptor of the block, the results, and the first atom, number of
+        atoms, first bond, number of bonds, first conformer atom and number of
+        conformers of each record in the block, or None for failures and
+        filtered structures.
+    """
+    n_atoms = 0
+    n_bonds = 0
+    n_conformer_atoms = 0
+    for _, record in results:
+        if record.created:
+            n_atoms += record.n_atoms
+            n_bonds += record.n_bonds
+            if record.conformers is not None:
+                n_conformer_atoms += record.conformers.shape[0] * record.n_atoms
+    coordinates_offset, bonds_offset, conformers_offset, size = _layout(
+        n_atoms, n_bonds, n_conformer_atoms
+    )
+
+    block = shared_memory.SharedMemory(name=name, create=True, size=size)
+    if os.name == "posix":
+        resource_tracker.unregister(_tracker_name(block.name), "shared_memory")
+    atno = np.ndarray((n_atoms,), dtype=np.uint8, buffer=block.buf)
+    coordinates = np.ndarray(
+        (n_atoms, 3), dtype=np.float64, buffer=block.buf, offset=coordinates_offset
+    )
+    bonds = np.ndarray(
+        (n_bonds, 3), dtype=np.int32, buffer=block.buf, offset=bonds_offset
+    )
+    conformers = np.ndarray(
+        (n_conformer_atoms, 3),
+        dtype=np.float64,
+        buffer=block.buf,
+        offset=conformers_offset,
+    )
+
+    extents = []
+    atom = 0
+    bond = 0
+    conformer_atom = 0
+    for _, record in results:
+        if not record.created:
+            extents.append(None)
+            continue
+        n = record.n_atoms
+        m = record.n_bonds
+        atno[atom : atom + n] = record.atno
+        coordinates[atom : atom + n] = record.coordinates
+        if m > 0:
+            bonds[bond : bond + m] = record.bonds
+        k = 0
+        if record.conformers is not None:
+            k = len(record.conformers)
+            stack = record.conformers.reshape(-1, 3)
+            conformers[conformer_atom : conformer_atom + k * n] = stack
+        extents.append((atom, n, bond, m, conformer_atom, k))
+        conformer_atom += k * n
+        record.atno = record.coordinates = record.bonds = record.conformers = None
+        atom += n
+        bond += m
+
+    del atno, coordinates, bonds, conformers
+    block.close()
+
+    descriptor = {
+        "name": block.name,
+        "n_atoms": n_atoms,
+        "n_bonds": n_bonds,
+        "n_conformer_atoms": n_conformer_atoms,
+    }
+    return descriptor, results, extents
+
+
+class Arena(object):
+    """A block of shared memory from a worker, mapped in this process.
+
+    All the arrays handed out are views of one base array over the block, and the
+    block is closed when that base array, and so the last view, is deleted.
+    """
+
+    def __init__(self, descriptor):
+        block = shared_memory.SharedMemory(name=descriptor["name"])
+        # Once mapped here the block no longer needs its name.
+        block.unlink()
+
+        n_atoms = descriptor["n_atoms"]
+        n_bonds = descriptor["n_bonds"]
+        n_conformer_atoms = descriptor["n_conformer_atoms"]
+        coordinates_offset, bonds_offset, conformers_offset, size = _layout(
+            n_atoms, n_bonds, n_conformer_atoms
+        )
+        base = np.ndarray((size,), dtype=np.uint8, buffer=block.buf)
+        weakref.finalize(base, block.close)
+
+        self._atno = base[:n_atoms]
+        self._coordinates = (
+            base[coordinates_offset:bonds_offset].view(np.float64).reshape(-1, 3)
+        )
+        self._bonds = (
+            base[bonds_offset : bonds_offset + 12 * n_bonds]
+            .view(np.int32)
+            .reshape(-1, 3)
+        )
+        self._conformers = (
+            base[conformers_offset : conformers_offset + 24 * n_conformer_atoms]
+            .view(np.float64)
+            .reshape(-1, 3)
+        )
+
+    def attach(self, record, extent, copy=False):
+        """Give a record views of its arrays in the block, or copies of them.
+
+        Parameters
+        ----------
+        record : StructureRecord
+            The record, as returned by pack().
+        extent : (int, int, int, int, int, int)
+            The first atom, number of atoms, first bond, number of bonds, first
+            conformer atom and number of conformers of the record in the block,
+            with no conformers if there is only one.
+        copy : bool = False
+            Whether to copy the arrays, so that the record does not keep the block
+            open.
+        """
+        atom, n, bond, m, conformer_atom, k = extent
+        record.atno = self._atno[atom : atom + n]
+        record.coordinates = self._coordinates[atom : atom + n]
+        record.bonds = self._bonds[bond : bond + m]
+        if k > 0:
+            record.conformers = self._conformers[
+                conformer_atom : conformer_atom + k * n
+            ].reshape(k, n, 3)
+        if copy:
+            record.atno = record.atno.copy()
+            record.coordinates = record.coordinates.copy()
+            record.bonds = record.bonds.copy()
+            if k > 0:
+                record.conformers = record.conformers.copy()
+
+    def close(self):
+        """Drop this reference to the block, which is closed after its last view."""
+        self._atno = self._coordinates = self._bonds = self._conformers = None
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""Check embedded structures for absurd bond lengths and overlapping atoms.
+
+Embedding occasionally produces structures with atoms on top of each other or
+bonds far from their usual lengths, which otherwise are only found when a later
+step, such as molecular dynamics, fails. The checks are vectorized, and the
+contacts are found with a spatial hash, so they are fast for large molecules.
+"""
+
+import itertools
+import logging
+
+import numpy as np
+from rdkit import Chem
+
+logger = logging.getLogger(__name__)
+
+# The allowed deviation of bond lengths from the sum of covalent radii
+bond_tolerance = 0.3
+
+# Atoms more than two bonds apart must be further apart than this fraction of
+# the sum of their van der Waals radii.
+contact_fraction = 0.5
+
+# The offsets to a box and its 26 neighbors
+_neighbors = np.array(list(itertools.product((-1, 0, 1), repeat=3)), dtype=np.int64)
+
+# The covalent and van der Waals radii by atomic number, in Å
+_table = Chem.GetPeriodicTable()
+_covalent = np.array([_table.GetRcovalent(z) for z in range(119)])
+_vdw = np.array([_table.GetRvdw(z) for z in range(119)])
+
+
+def close_pairs(xyz, cutoff):
+    """The pairs of atoms closer than a cutoff, using a spatial hash.
+
+    Parameters
+    ----------
+    xyz : numpy.ndarray
+        The n x 3 array of coordinates.
+    cutoff : float
+        The distance, in Å.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The indices i < j of the atoms in each pair.
+    """
+    n = len(xyz)
+    if n < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Boxes at least as large as the cutoff, padded so that the neighbors of
+    # the boxes at the edges don't wrap around.
+    ijk = np.floor(xyz / cutoff).astype(np.int64)
+    ijk -= ijk.min(axis=0) - 1
+    dims = ijk.max(axis=0) + 2
+    keys = (ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    pairs_i = []
+    pairs_j = []
+    for di, dj, dk in _neighbors:
+        neighbor = keys + (di * dims[1] + dj) * dims[2] + dk
+        start = np.searchsorted(sorted_keys, neighbor, side="left")
+        counts = np.searchsorted(sorted_keys, neighbor, side="right") - start
+        total = counts.sum()
+        if total == 0:
+            continue
+        i = np.repeat(np.arange(n), counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.arange(total) - first + np.repeat(start, counts)]
+        keep = i < j
+        pairs_i.append(i[keep])
+        pairs_j.append(j[keep])
+    i = np.concatenate(pairs_i)
+    j = np.concatenate(pairs_j)
+    delta = xyz[i] - xyz[j]
+    close = np.einsum("ax,ax->a", delta, delta) < cutoff**2
+    return i[close], j[close]
+
+
+def check(record, xyz=None):
+    """Why the structure in a record is not sensible, or None if it is.
+
+    Parameters
+    ----------
+    record : StructureRecord
+        The structure, with 3-D coordinates.
+    xyz : numpy.ndarray = None
+        The n x 3 coordinates to check, e.g. of another conformer, defaulting to
+        those in the record.
+
+    Returns
+    -------
+    str or None
+        The problem, or None if the structure is fine.
+    """
+    atno = record.atno.astype(np.int64)
+    if xyz is None:
+        xyz = record.coordinates
+    bonds = record.bonds[:, :2].astype(np.int64)
+
+    if len(bonds) > 0:
+        lengths = np.linalg.norm(xyz[bonds[:, 0]] - xyz[bonds[:, 1]], axis=1)
+        expected = _covalent[atno[bonds[:, 0]]] + _covalent[atno[bonds[:, 1]]]
+        bad = np.abs(lengths - expected) > bond_tolerance * expected
+        if bad.any():
+            k = int(np.argmax(bad))
+            i, j = bonds[k]
+            return (
+                f"The bond between atoms {i + 1} and {j + 1} is {lengths[k]:.2f} Å "
+                f"long, rather than about {expected[k]:.2f} Å."
+            )
+
+    cutoff = contact_fraction * 2 * _vdw[atno].max()
+    i, j = close_pairs(xyz, cutoff)
+    if len(i) == 0:
+        return None
+
+    # Ignore atoms that are bonded, or bonded to the same atom
+    n = len(atno)
+    neighbors = [[] for _ in range(n)]
+    for a, b in bonds.tolist():
+        neighbors[a].append(b)
+        neighbors[b].append(a)
+    near = set()
+    for a, b in bonds.tolist():
+        near.add(min(a, b) * n + max(a, b))
+    for partners in neighbors:
+        for a, b in itertools.combinations(partners, 2):
+            near.add(min(a, b) * n + max(a, b))
+    remote = ~np.isin(i * n + j, np.fromiter(near, dtype=np.int64, count=len(near)))
+    i = i[remote]
+    j = j[remote]
+
+    distances = np.linalg.norm(xyz[i] - xyz[j], axis=1)
+    limits = contact_fraction * (_vdw[atno[i]] + _vdw[atno[j]])
+    bad = distances < limits
+    if bad.any():
+        k = int(np.argmax(bad))
+        return f"Atoms {i[k] + 1} and {j[k] + 1} are only {distances[k]:.2f} Å apart."
+    return None
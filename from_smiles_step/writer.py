@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+"""Write batches of structures to the SEAMM system database.
+
+The writer is the only code that touches the database during a batch. It runs
+in the step's process, which owns the connection -- the database is often in
+memory, and SQLite connections cannot be shared with other processes or threads
+-- and consumes the finished structures from the engine's queue, while the
+workers go on creating more.
+
+molsystem commits after almost every operation, so writing the systems,
+configurations, atoms and bonds of many small molecules one at a time is
+dominated by the commits. The writer collects the structures as they arrive and
+writes them in transactions of a tunable size.
+"""
+
+from contextlib import contextmanager
+import logging
+
+import molsystem
+import seamm_util.printing as printing
+
+from from_smiles_step import engine
+from from_smiles_step.record import StructureRecord
+
+logger = logging.getLogger(__name__)
+printer = printing.getPrinter("from_smiles")
+
+
+@contextmanager
+def transaction(db):
+    """Write to the database in one transaction.
+
+    With a connection that can defer commits, molsystem's own commits are
+    suppressed and there is one commit at the end, or if anything goes wrong a
+    rollback, so that no partial transaction is written. If the flowchart is
+    already deferring commits for the whole step, that is left to it.
+
+    Parameters
+    ----------
+    db : sqlite3.Connection
+        The connection to the database.
+    """
+    own_transaction = getattr(db, "deferring", True) is False
+    if own_transaction:
+        db.deferring = True
+    try:
+        yield
+    except BaseException:
+        if own_transaction:
+            db.deferring = False
+            db.rollback()
+        raise
+    if own_transaction:
+        db.deferring = False
+        db.commit()
+
+
+class StructureWriter(object):
+    """Write structures from the engine to the system database in transactions.
+
+    Parameters
+    ----------
+    node : from_smiles_step.FromSMILES
+        The step, which provides the structure handling and the fallbacks for
+        structures the workers could not create.
+    P : dict(str, any)
+        The current values of the parameters.
+    flush_size : int = 100
+        The number of structures written in each transaction.
+    verbose : bool = True
+        Whether to print a line for each structure.
+    reports : [object] = None
+        Writers, such as the summary and table of results, given each structure
+        once it has been written, with the outcome of any fallback.
+    """
+
+    def __init__(self, node, P, flush_size=100, verbose=True, reports=None):
+        self.node = node
+        self.P = P
+        self.flush_size = max(flush_size, 1)
+        self.verbose = verbose
+        self.reports = [] if reports is None else reports
+        self.system_db = node.get_variable("_system_db")
+
+        self.n_created = 0
+        self.n_discarded = 0
+        self.n_filtered = 0
+        self.failed = []
+
+        self._first = True
+        self._pending = []
+        self._scratch = None
+
+    def add(self, record):
+        """Add a structure, writing the pending structures if there are enough.
+
+        Parameters
+        ----------
+        record : StructureRecord
+            The structure, with its identifier in the batch, which may be a
+            failure.
+        """
+        self._pending.append(record)
+        if len(self._pending) >= self.flush_size:
+            self.flush()
+
+    def close(self):
+        """Write any pending structures."""
+        self.flush()
+
+    def flush(self):
+        """Write the pending structures in one transaction."""
+        if len(self._pending) == 0:
+            return
+
+        try:
+            with transaction(self.system_db.db):
+                written = [self._write(record) for record in self._pending]
+        finally:
+            self._pending = []
+        for record in written:
+            for report in self.reports:
+                report.add(record)
+
+    def _write(self, record):
+        """Write one structure to the database.
+
+        Parameters
+        ----------
+        record : StructureRecord
+            The structure from the engine.
+
+        Returns
+        -------
+        StructureRecord
+            The record of what was written, which for a failure the fallbacks
+            recovered is the structure they created.
+        """
+        P = self.P
+        node = self.node
+        identifier = record.identifier
+
+        if record.filtered is not None:
+            self.n_filtered += 1
+            return record
+
+        if self._first:
+            handling = P["structure handling"]
+        else:
+            handling = P["subsequent structure handling"]
+        if handling == "Discard the structure":
+            self._first = False
+            self.n_discarded += 1
+            return record
+
+        # Only create the system and configuration once there is a structure, so
+        # that nothing is left behind if the fallbacks fail too.
+        if record.failed:
+            try:
+                record, known = self.fallback(record)
+            except Exception as e:
+                self.failed.append((identifier, record.text, str(e)))
+                return record
+            recipe = False
+        else:
+            known = record.identifiers
+            recipe = P["geometry"] == "deferred"
+
+        system, configuration = node.get_system_configuration(
+            P, same_as=None, first=self._first
+        )
+        record.to_configuration(configuration)
+        if recipe:
+            node.store_recipe(configuration, record)
+        notation = record.notation
+        flavor = record.flavor
+
+        node.set_names(
+            system, configuration, P, first=self._first, known=known, id=identifier
+        )
+        n_conformers = 1 + len(node.add_conformers(configuration, record))
+        self._first = False
+        self.n_created += 1
+
+        if not self.verbose:
+            return record
+        if notation == "SMILES":
+            how = f"SMILES using {flavor}"
+        else:
+            how = notation
+        conformers = f", {n_conformers} conformers" if n_conformers > 1 else ""
+        printer.important(
+            f"    {identifier}: {configuration.n_atoms} atoms from the {how}, "
+            f"named '{system.name}' / '{configuration.name}'{conformers}"
+        )
+        return record
+
+    def fallback(self, record):
+        """Create a structure the workers could not, with the full fallbacks.
+
+        The structure is created in a scratch database, and only copied to the
+        system database once it exists.
+
+        Parameters
+        ----------
+        record : StructureRecord
+            The failure from the engine.
+
+        Returns
+        -------
+        StructureRecord, dict(str, str) or None
+            The structure, with the identifiers and timing of the original, and
+            the identifiers known from the notation, if any.
+        """
+        P = self.P
+        text = record.text
+        notation = P["notation"]
+        if notation == "perceive":
+            notation = engine.perceive_notation(text)
+        # Polymers can only be built by the engine, so there is no fallback.
+        if notation == "repeat unit":
+            raise RuntimeError(record.error)
+
+        if self._scratch is None:
+            self._scratch = molsystem.SystemDB(filename=":memory:")
+        system = self._scratch.create_system()
+        try:
+            configuration = system.create_configuration()
+            notation, flavor = self.node.create_structure(
+                configuration, text, notation, P["smiles flavor"]
+            )
+            self.node.check_configuration(configuration, P)
+            result = StructureRecord.from_configuration(configuration, text)
+            try:
+                engine.identify(configuration.to_RDKMol(), result)
+            except Exception as e:
+                logger.debug(f"No identifiers for '{text}': {e}")
+        finally:
+            self._scratch.delete_system(system)
+
+        result.input = record.input
+        result.identifier = record.identifier
+        result.time = record.time
+        result.notation = notation
+        result.flavor = flavor
+        known = {notation: text} if notation in ("InChI", "InChIKey") else None
+        return result, known
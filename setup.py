@@ -54,6 +54,11 @@ setup(
     # deployment
     install_requires=requirements,
 
+    # Optional packages for some of the outputs of batches
+    extras_require={
+        'results-table': ['pyarrow'],
+    },
+
     test_suite='tests',
     # tests_require=test_requirements,
 
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Fixtures for the tests of the `from_smiles_step` package."""
+
+import molsystem
+import pytest
+import seamm
+
+import from_smiles_step
+
+
+@pytest.fixture
+def node(tmp_path):
+    """A From SMILES step in a flowchart, with an empty system database."""
+    db = molsystem.SystemDB(filename=":memory:")
+    variables = seamm.Variables()
+    seamm.flowchart_variables = seamm.variables.flowchart_variables = variables
+    variables.set_variable("_system_db", db)
+
+    flowchart = seamm.Flowchart()
+    flowchart.root_directory = str(tmp_path)
+    step = from_smiles_step.FromSMILES(flowchart=flowchart)
+    step._id = ("1",)
+    yield step
+    db.close()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for writing and reading the columnar store."""
+
+import numpy as np
+import pytest
+
+from from_smiles_step import engine
+from from_smiles_step.columnar import ColumnarStore, ColumnarWriter
+from from_smiles_step.record import StructureRecord
+
+
+def test_round_trip(tmp_path):
+    """The structures read back as written, skipping failures."""
+    texts = ["CCO", "[Na+].[Cl-]", "c1ccccc1O", "O"]
+    records = []
+    writer = ColumnarWriter(tmp_path / "store")
+    for i, text in enumerate(texts):
+        record = engine.convert(text)
+        record.identifier = f"mol{i}"
+        records.append(record)
+        writer.add(record)
+        if i == 1:
+            failed = StructureRecord("not a molecule")
+            failed.error = "It failed."
+            failed.identifier = "failed"
+            writer.add(failed)
+    assert writer.n_molecules == len(texts)
+    writer.close()
+
+    store = ColumnarStore(tmp_path / "store")
+    assert len(store) == len(texts)
+    assert store.identifiers == [f"mol{i}" for i in range(len(texts))]
+    for k, record in enumerate(records):
+        atno, xyz, bonds = store[k]
+        np.testing.assert_array_equal(atno, record.atno)
+        np.testing.assert_allclose(xyz, record.coordinates, atol=1.0e-5)
+        np.testing.assert_array_equal(bonds, record.bonds)
+
+    atno, xyz, bonds = store[-1]
+    assert list(atno) == [8, 1, 1]
+    with pytest.raises(IndexError):
+        store[len(texts)]
+
+
+def test_empty(tmp_path):
+    """A store with nothing in it can be read."""
+    ColumnarWriter(tmp_path / "store").close()
+    store = ColumnarStore(tmp_path / "store")
+    assert len(store) == 0
+    assert store.identifiers == []
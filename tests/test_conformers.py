@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for comparing and pruning conformers."""
+
+import numpy as np
+from rdkit import Chem
+from rdkit.Chem import rdDistGeom, rdMolAlign
+
+from from_smiles_step import conformers
+
+
+def rotation(angle):
+    """A rotation about the z axis."""
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+
+
+def test_rmsd_of_moved_copies():
+    """Rotated and translated copies are the same, but not mirror images."""
+    rng = np.random.default_rng(1)
+    reference = rng.normal(size=(10, 3))
+    moved = np.array(
+        [
+            reference,
+            reference @ rotation(0.7).T + [1.0, -2.0, 3.0],
+            reference * [1.0, 1.0, -1.0],
+        ]
+    )
+    result = conformers.rmsd(reference, moved)
+    np.testing.assert_allclose(result[:2], 0.0, atol=1.0e-6)
+    assert result[2] > 0.1
+
+
+def test_rmsd_like_rdkit():
+    """The RMSDs are those from RDKit's alignment."""
+    mol = Chem.AddHs(Chem.MolFromSmiles("CCCCCCO"))
+    ids = list(rdDistGeom.EmbedMultipleConfs(mol, numConfs=4, randomSeed=7))
+    xyz = np.array([mol.GetConformer(i).GetPositions() for i in ids])
+    atom_map = [(i, i) for i in range(mol.GetNumAtoms())]
+    expected = [
+        rdMolAlign.AlignMol(mol, mol, prbCid=i, refCid=ids[0], atomMap=atom_map)
+        for i in ids
+    ]
+    np.testing.assert_allclose(conformers.rmsd(xyz[0], xyz), expected, atol=1.0e-6)
+
+
+def test_prune():
+    """Conformers like one kept earlier are dropped, keeping the order."""
+    rng = np.random.default_rng(2)
+    a = rng.normal(size=(6, 3))
+    b = rng.normal(size=(6, 3))
+    xyz = np.array([a, b, a @ rotation(1.0).T, b + 0.01, a * [1.0, 1.0, -1.0]])
+    assert conformers.prune(xyz, 0.1) == [0, 1, 4]
+    assert conformers.prune(xyz, 0.0) == [0, 1, 2, 3, 4]
+
+
+def test_prune_atoms():
+    """Only the given atoms are compared."""
+    rng = np.random.default_rng(3)
+    a = rng.normal(size=(6, 3))
+    other = a.copy()
+    other[5] += 5.0
+    xyz = np.array([a, other])
+    assert conformers.prune(xyz, 0.1) == [0, 1]
+    assert conformers.prune(xyz, 0.1, atoms=[0, 1, 2, 3, 4]) == [0]
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for making several copies of a structure."""
+
+import numpy as np
+
+from from_smiles_step import copies, engine, validate
+
+
+def test_rotations():
+    """The rotations are proper and orthonormal."""
+    rotations = copies.random_rotations(50, np.random.default_rng(3))
+    identity = np.broadcast_to(np.eye(3), (50, 3, 3))
+    np.testing.assert_allclose(
+        np.einsum("kij,kjl->kil", rotations, rotations.transpose(0, 2, 1)),
+        identity,
+        atol=1.0e-12,
+    )
+    np.testing.assert_allclose(np.linalg.det(rotations), 1.0)
+
+
+def test_lattice():
+    """The lattice points are distinct and spaced as requested."""
+    points = copies.lattice(10, 2.5)
+    assert points.shape == (10, 3)
+    distances = np.linalg.norm(points[:, np.newaxis] - points[np.newaxis], axis=2)
+    assert distances[np.triu_indices(10, k=1)].min() == 2.5
+
+
+def test_replicate():
+    """The copies have the atoms and bonds of the original, and do not overlap."""
+    record = engine.convert("CC(=O)O")
+    result = copies.replicate(record, 8, seed=5)
+    assert result.n_atoms == 8 * record.n_atoms
+    assert result.n_bonds == 8 * record.n_bonds
+    np.testing.assert_array_equal(
+        result.atno[record.n_atoms : 2 * record.n_atoms], record.atno
+    )
+    assert result.bonds[:, :2].max() == result.n_atoms - 1
+    assert result.charge == 0
+    assert result.spin_multiplicity == 1
+    assert validate.check(result) is None
+
+    # Each copy is the same shape as the original
+    distances = np.linalg.norm(record.coordinates - record.coordinates[0], axis=1)
+    for k in range(8):
+        xyz = result.coordinates[k * record.n_atoms : (k + 1) * record.n_atoms]
+        np.testing.assert_allclose(np.linalg.norm(xyz - xyz[0], axis=1), distances)
+
+
+def test_seeded():
+    """The same seed gives the same copies."""
+    record = engine.convert("CCO")
+    first = copies.replicate(record, 5, seed=11)
+    second = copies.replicate(record, 5, seed=11)
+    np.testing.assert_array_equal(first.coordinates, second.coordinates)
+
+
+def test_charge_and_spin():
+    """The charge and unpaired electrons add up."""
+    record = engine.convert("[CH3]")
+    result = copies.replicate(record, 3, rotate=False)
+    assert result.spin_multiplicity == 4
+    record = engine.convert("[NH4+]")
+    assert copies.replicate(record, 3).charge == 3
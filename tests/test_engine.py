@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for creating structures with the engine."""
+
+import numpy as np
+import pytest
+from rdkit import Chem
+
+from from_smiles_step import engine, scaffolds, validate
+
+
+def distances(record):
+    """The sorted interatomic distances, which don't depend on the atom order."""
+    xyz = record.coordinates
+    return np.sort(np.linalg.norm(xyz[:, np.newaxis] - xyz[np.newaxis], axis=2).ravel())
+
+
+def test_convert():
+    """A simple molecule is created with its identifiers."""
+    record = engine.convert("CCO", identifiers=True)
+    assert record.created
+    assert record.n_atoms == 9
+    assert record.n_bonds == 8
+    assert record.formula == "C2H6O"
+    assert record.inchikey == "LFQSCWFLJHTTHZ-UHFFFAOYSA-N"
+    assert validate.check(record) is None
+
+
+def test_failure():
+    """Strings that can't be converted raise an error."""
+    with pytest.raises(Exception):
+        engine.convert("C1CC", notation="SMILES")
+
+
+def test_seed_from_the_structure():
+    """By default the same molecule always has the same coordinates."""
+    first = engine.convert("OCC(N)c1ccccc1")
+    second = engine.convert("OCC(N)c1ccccc1")
+    np.testing.assert_array_equal(first.coordinates, second.coordinates)
+
+    # however it is written
+    other = engine.convert("c1ccc(cc1)C(N)CO")
+    np.testing.assert_allclose(distances(other), distances(first), atol=1.0e-6)
+
+
+def test_given_seed():
+    """A given seed is reproducible, and other seeds give other structures."""
+    first = engine.convert("CCCCCCO", seed=42)
+    second = engine.convert("CCCCCCO", seed=42)
+    np.testing.assert_array_equal(first.coordinates, second.coordinates)
+    third = engine.convert("CCCCCCO", seed=43)
+    assert not np.allclose(distances(first), distances(third), atol=1.0e-3)
+
+
+@pytest.mark.parametrize("via", ["pickle", "shared memory"])
+def test_run(via):
+    """A batch in parallel returns every structure once."""
+    texts = ["C" * n + "O" for n in range(1, 40)] + ["C1CC"]
+    results = dict(engine.run(texts, n_workers=2, via=via))
+    assert sorted(results) == list(range(len(texts)))
+    assert results[len(texts) - 1].failed
+    for index, text in enumerate(texts[:-1]):
+        assert results[index].created
+        assert results[index].n_atoms == 3 * len(text)
+
+
+def test_run_ordered(monkeypatch):
+    """An ordered batch is in the order of the input, holding few back."""
+    monkeypatch.setattr(engine, "reorder_window", 4)
+    texts = ["C" * (n % 17 + 1) + "O" for n in range(200)]
+    results = engine.run(
+        texts, {"geometry": "none"}, n_workers=3, via="shared memory", ordered=True
+    )
+    for k, (index, record) in enumerate(results):
+        assert index == k
+        assert record.n_atoms == 3 * len(texts[k])
+
+
+def test_pool_is_kept():
+    """The pool of workers is reused, and replaced if the workers change."""
+    pool = engine.get_pool(2)
+    assert engine.get_pool(2) is pool
+    other = engine.get_pool(2, tasks_per_worker=5)
+    assert other is not pool
+    assert engine.get_pool(2, tasks_per_worker=5) is other
+    engine.shutdown_pool()
+    assert engine._pool is None
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "N[C@@H]1CCCC[C@H]1O",
+        "N[C@H]1CCCC[C@H]1O",
+        "C[C@H](N)c1ccc(cc1)C[C@@H](C)O",
+        "C/C=C/c1ccccc1",
+        "C/C=C\\c1ccccc1",
+    ],
+)
+def test_scaffold_keeps_stereo(text):
+    """Structures built on a cached scaffold keep their stereochemistry."""
+    settings = engine.embedding_settings(scaffolds=True)
+    mol = Chem.AddHs(Chem.MolFromSmiles(text))
+    assert engine.embed_from_scaffold(mol, "from the structure", settings)
+    assert validate.check(engine.from_rdkit(mol, text)) is None
+    assert scaffolds.same_stereo(Chem.AddHs(Chem.MolFromSmiles(text)), mol)
+
+
+def test_scaffold():
+    """The scaffold keeps the rings and linkers, and None without rings."""
+    mol = Chem.MolFromSmiles("CCc1ccc(cc1)C(=O)c1ccccn1")
+    assert Chem.MolToSmiles(scaffolds.scaffold(mol)) == "O=C(c1ccccc1)c1ccccn1"
+    assert scaffolds.scaffold(Chem.MolFromSmiles("CCCO")) is None
+
+
+@pytest.mark.parametrize(
+    "unit, polymer, formula",
+    [
+        ("*CC*", {"degree": 10}, "C20H42"),
+        ("*CC*", {"degree": 1}, "C2H6"),
+        ("*CC(c1ccccc1)*", {"degree": 5, "head": "C*"}, "C41H44"),
+        ("*OCC*", {"degree": 50, "head": "C*", "tail": "O*"}, "C101H204O51"),
+    ],
+)
+def test_polymer(unit, polymer, formula):
+    """Chains have the formula of their units and end groups, and are sensible."""
+    record = engine.convert(
+        unit, notation="repeat unit", identifiers=True, polymer=polymer
+    )
+    assert record.formula == formula
+    assert validate.check(record) is None
+
+
+def test_polymer_without_coordinates():
+    """Long chains can be built without coordinates."""
+    mol = engine.build_polymer("*CC*", degree=5000, geometry="none")
+    assert mol.GetNumAtoms() == 6 * 5000 + 2
+
+
+def test_assembly_of_a_large_peptide():
+    """A large peptide is assembled from its fragments."""
+    text = "N" + "C(C)C(=O)N" * 40 + "CC(=O)O"
+    settings = engine.embedding_settings(assembly_atoms=10)
+    mol = Chem.AddHs(Chem.MolFromSmiles(text))
+    assert engine.embed_from_fragments(mol, "from the structure", settings)
+
+    record = engine.convert(text, embedding=settings)
+    assert record.n_atoms == mol.GetNumAtoms()
+    assert validate.check(record) is None
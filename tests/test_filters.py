@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for filtering the structures in a batch before embedding."""
+
+import pytest
+
+from from_smiles_step import filters
+
+
+def test_no_criteria():
+    """Without criteria nothing is rejected."""
+    texts = ["CCO", "c1ccccc1"]
+    assert filters.screen(texts, ["SMILES"] * 2, {}) == [None, None]
+
+
+def test_limits():
+    """Structures over a limit are rejected, with the reason."""
+    texts = ["CCO", "CCCCCCCCCCCC", "C1CCCCCCCCCCC1"]
+    reasons = filters.screen(texts, ["SMILES"] * 3, {"heavy atoms": 10})
+    assert reasons[0] is None
+    assert reasons[1] == "Heavy atoms = 12, over the limit of 10."
+    assert reasons[2] == "Heavy atoms = 12, over the limit of 10."
+
+    reasons = filters.screen(texts, ["SMILES"] * 3, {"ring size": 8})
+    assert reasons[:2] == [None, None]
+    assert reasons[2] == "Ring size = 12, over the limit of 8."
+
+    reasons = filters.screen(texts, ["SMILES"] * 3, {"rotatable bonds": 5})
+    assert reasons[0] is None
+    assert reasons[1].startswith("Rotatable bonds = 9,")
+
+    reasons = filters.screen(texts, ["SMILES"] * 3, {"molecular weight": 100.0})
+    assert reasons[0] is None
+    assert reasons[1].startswith("Molecular weight = 170.")
+
+
+def test_smarts():
+    """Structures with an excluded substructure are rejected."""
+    texts = ["CCO", "CC(=O)O", "c1ccccc1"]
+    criteria = {"SMARTS": ["C(=O)[OH]", "c"]}
+    reasons = filters.screen(texts, ["SMILES"] * 3, criteria)
+    assert reasons[0] is None
+    assert reasons[1] == "It matches the excluded SMARTS 'C(=O)[OH]'."
+    assert reasons[2] == "It matches the excluded SMARTS 'c'."
+
+
+def test_other_notations():
+    """InChI is screened, and structures that can't be parsed are not rejected."""
+    texts = ["InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3", "ethanol", "C(C"]
+    notations = ["InChI", "name", "SMILES"]
+    reasons = filters.screen(texts, notations, {"heavy atoms": 2})
+    assert reasons == ["Heavy atoms = 3, over the limit of 2.", None, None]
+
+
+def test_bad_smarts():
+    """Invalid SMARTS are an error."""
+    with pytest.raises(ValueError):
+        filters.compile_smarts(["C(("])
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for removing salts and other fragments from SMILES."""
+
+import pytest
+
+from from_smiles_step import fragments
+
+
+def test_keep_all():
+    """By default nothing is removed."""
+    assert fragments.strip("CCN.Cl") == "CCN.Cl"
+
+
+def test_remove_salts():
+    """Counterions and solvents are removed, leaving the other fragments."""
+    assert fragments.strip("CCN.Cl", "remove salts") == "CCN"
+    assert fragments.strip("CCCCC(=O)[O-].[Na+].O", "remove salts") == "CCCCC(=O)[O-]"
+    assert fragments.strip("c1ccccc1.CCCC.[Cl-]", "remove salts") == "c1ccccc1.CCCC"
+
+
+def test_given_salts():
+    """Only the salts given are removed."""
+    assert fragments.strip("CCN.Cl.[Na+]", "remove salts", ["[Na+]"]) == "CCN.Cl"
+
+
+def test_all_salts_kept():
+    """A structure that is all salts is left alone."""
+    assert fragments.strip("[Na+].[Cl-]", "remove salts") == "[Na+].[Cl-]"
+
+
+def test_largest_organic_fragment():
+    """The largest organic fragment is kept, even if an inorganic one is larger."""
+    largest = "keep the largest organic fragment"
+    assert fragments.strip("CCO.CCCCO", largest) == "CCCCO"
+    assert fragments.strip("C.[O-]S(=O)(=O)[O-]", largest) == "C"
+
+
+def test_unchanged():
+    """Single fragments and strings that are not SMILES are returned as is."""
+    assert fragments.strip("OCC", "remove salts") == "OCC"
+    assert fragments.strip("sodium chloride", "remove salts") == "sodium chloride"
+    assert fragments.strip("this.is not.SMILES", "remove salts") == "this.is not.SMILES"
+
+
+def test_bad_option():
+    """Unknown options are an error."""
+    with pytest.raises(ValueError):
+        fragments.strip("CCN.Cl", "keep some")
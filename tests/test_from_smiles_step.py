@@ -3,8 +3,10 @@
 
 """Tests for `from_smiles_step` package."""
 
+import numpy as np
 import pytest
 import from_smiles_step  # noqa: F401
+from from_smiles_step.from_smiles import recipe_property
 
 
 @pytest.fixture
@@ -21,3 +23,105 @@ def test_content(response):
     """Sample pytest test function with the pytest fixture as an argument."""
     # from bs4 import BeautifulSoup
     # assert 'GitHub' in BeautifulSoup(response.content).title.string
+
+
+def test_single_structure(node):
+    """The step creates one structure from a SMILES string."""
+    node.parameters["smiles string"].value = "CCO"
+    node.run()
+
+    db = node.get_variable("_system_db")
+    assert db.n_systems == 1
+    configuration = db.system.configuration
+    assert configuration.n_atoms == 9
+    assert configuration.bonds.n_bonds == 8
+
+
+def test_batch(node, tmp_path):
+    """A batch in parallel is written to the database in the order of the input."""
+    texts = ["CCO", "c1ccccc1", "CC(=O)O", "C" * 20, "N", "OCCO"]
+    path = tmp_path / "batch.smi"
+    path.write_text("".join(f"{text} mol{i}\n" for i, text in enumerate(texts)))
+    node.parameters["smiles file"].value = str(path)
+    node.parameters["number of workers"].value = 2
+    node.parameters["subsequent structure handling"].value = (
+        "Create a new system and configuration"
+    )
+    node.run()
+
+    db = node.get_variable("_system_db")
+    assert db.n_systems == len(texts)
+    n_atoms = [
+        configuration.n_atoms
+        for system in db.systems
+        for configuration in system.configurations
+    ]
+    assert n_atoms == [9, 12, 8, 62, 4, 10]
+
+
+def test_set_names(node):
+    """Known identifiers name the structure, and the rest are computed."""
+    db = node.get_variable("_system_db")
+    system = db.create_system()
+    configuration = system.create_configuration()
+    configuration.from_smiles("CCO")
+    P = {
+        "structure handling": "Create a new system and configuration",
+        "system name": "use InChIKey",
+        "configuration name": "use Canonical SMILES string",
+    }
+
+    node.set_names(system, configuration, P, known={"InChIKey": "KNOWN-KEY"})
+    assert system.name == "KNOWN-KEY"
+    assert configuration.name == configuration.canonical_smiles
+
+    node.set_names(system, configuration, P, known=None)
+    assert system.name == "LFQSCWFLJHTTHZ-UHFFFAOYSA-N"
+
+
+def test_embed_deferred(node, tmp_path):
+    """Structures created with deferred coordinates are embedded later."""
+    texts = ["CCO", "c1ccccc1", "CC(=O)O"]
+    path = tmp_path / "batch.smi"
+    path.write_text("".join(f"{text}\n" for text in texts))
+    node.parameters["smiles file"].value = str(path)
+    node.parameters["geometry"].value = "deferred"
+    node.parameters["subsequent structure handling"].value = (
+        "Create a new system and configuration"
+    )
+    node.run()
+
+    db = node.get_variable("_system_db")
+    configurations = [system.configuration for system in db.systems]
+    assert len(configurations) == len(texts)
+    for configuration in configurations:
+        recipe = configuration.properties.get(recipe_property)[recipe_property]
+        assert not recipe["value"]["embedded"]
+    atnos = [configuration.atoms.atomic_numbers for configuration in configurations]
+    before = [configuration.atoms.get_coordinates() for configuration in configurations]
+
+    node.parameters["action"].value = "embed deferred structures"
+    node.run()
+
+    for configuration, atno, xyz0 in zip(configurations, atnos, before):
+        recipe = configuration.properties.get(recipe_property)[recipe_property]
+        assert recipe["value"]["embedded"]
+        assert configuration.atoms.atomic_numbers == atno
+        xyz = np.array(configuration.atoms.get_coordinates())
+        assert not np.allclose(xyz, xyz0)
+        index = {atom_id: i for i, atom_id in enumerate(configuration.atoms.ids)}
+        bonds = configuration.bonds.get_as_dict()
+        for i, j in zip(bonds["i"], bonds["j"]):
+            r = np.linalg.norm(xyz[index[i]] - xyz[index[j]])
+            assert 0.9 < r < 1.6
+
+
+def test_assembly_is_described_when_used(node):
+    """Assembling from fragments is off by default, and described when on."""
+    P = node.parameters.values_to_dict()
+    P["smiles string"] = "CCO"
+    assert P["fragment assembly threshold"] == "never"
+    assert "assembled" not in node.description_text(P)
+
+    P["fragment assembly threshold"] = 100
+    assert "assembled from separately embedded fragments" in node.description_text(P)
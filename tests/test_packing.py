@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for packing molecules into a periodic cell."""
+
+import numpy as np
+import pytest
+
+from from_smiles_step import engine, packing
+
+
+def intermolecular_distance(record):
+    """The shortest distance between atoms in different molecules in the cell."""
+    molecule = np.empty(record.n_atoms, dtype=np.int64)
+    for k, atoms in enumerate(packing.components(record)):
+        molecule[atoms] = k
+    delta = record.coordinates[:, np.newaxis] - record.coordinates[np.newaxis]
+    delta -= record.cell * np.round(delta / record.cell)
+    distances = np.linalg.norm(delta, axis=2)
+    return distances[molecule[:, np.newaxis] != molecule[np.newaxis]].min()
+
+
+def test_components():
+    """The molecules are found from the bonds."""
+    record = engine.convert("CCO.O")
+    atoms = packing.components(record)
+    assert [len(a) for a in atoms] == [9, 3]
+
+
+def test_pack():
+    """The molecules are packed at the density, no closer than the minimum."""
+    record = engine.convert("CCO")
+    result = packing.pack(record, 20, 0.5, min_distance=2.0, seed=7)
+    assert result.n_atoms == 20 * record.n_atoms
+    assert len(packing.components(result)) == 20
+
+    mass = 20 * 46.069
+    volume = result.cell.prod() * 1.0e-24
+    assert mass / (6.02214076e23 * volume) == pytest.approx(0.5, rel=1.0e-3)
+    assert intermolecular_distance(result) >= 2.0
+
+
+def test_seeded():
+    """The same seed gives the same cell."""
+    record = engine.convert("O")
+    first = packing.pack(record, 10, 0.5, seed=3)
+    second = packing.pack(record, 10, 0.5, seed=3)
+    np.testing.assert_array_equal(first.coordinates, second.coordinates)
+
+
+def test_mixture():
+    """Each molecule of a mixture is packed the given number of times."""
+    record = engine.convert("O.CCO")
+    result = packing.pack(record, [30, 10], 0.4, seed=1)
+    assert result.n_atoms == 30 * 3 + 10 * 9
+    atno = result.atno.tolist()
+    assert atno.count(6) == 20
+    assert atno.count(8) == 40
+    assert intermolecular_distance(result) >= 1.5
+
+
+def test_bad_mixtures():
+    """The counts must match the molecules, and charged mixtures be equal."""
+    record = engine.convert("O.CCO")
+    with pytest.raises(ValueError):
+        packing.pack(record, [3, 1, 1], 0.5)
+    record = engine.convert("[NH4+].O")
+    with pytest.raises(ValueError):
+        packing.pack(record, [1, 5], 0.5)
+    result = packing.pack(record, [2, 2], 0.5, seed=2)
+    assert result.charge == 2
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for writing the table of the results of a batch."""
+
+import pytest
+
+from from_smiles_step import engine
+from from_smiles_step.record import StructureRecord
+from from_smiles_step.results import ResultsTable
+
+ipc = pytest.importorskip("pyarrow.ipc")
+parquet = pytest.importorskip("pyarrow.parquet")
+
+
+def records():
+    """A structure, a failure and a structure that was filtered out."""
+    created = engine.convert("CCO", identifiers=True)
+    created.identifier = "ethanol"
+    created.time = 0.5
+    failed = StructureRecord("not a molecule", error="It failed.")
+    failed.identifier = "failed"
+    filtered = StructureRecord("c1ccccc1", filtered="too many rings")
+    filtered.identifier = "benzene"
+    return [created, failed, filtered]
+
+
+@pytest.mark.parametrize("file_format", ["Parquet", "Arrow"])
+def test_table(tmp_path, file_format):
+    """There is a row for every structure, in record batches."""
+    table = ResultsTable(tmp_path / "results", file_format=file_format, batch_size=2)
+    for record in records():
+        table.add(record)
+    table.close()
+    assert table.n_rows == 3
+
+    if file_format == "Parquet":
+        assert table.path.name == "results.parquet"
+        rows = parquet.read_table(table.path).to_pylist()
+    else:
+        assert table.path.name == "results.arrow"
+        with ipc.open_file(table.path) as reader:
+            assert reader.num_record_batches == 2
+            rows = reader.read_all().to_pylist()
+
+    assert [row["id"] for row in rows] == ["ethanol", "failed", "benzene"]
+    assert rows[0]["n_atoms"] == 9
+    assert rows[0]["formula"] is not None
+    assert rows[0]["inchikey"] == "LFQSCWFLJHTTHZ-UHFFFAOYSA-N"
+    assert rows[0]["time"] == 0.5
+    assert rows[1]["n_atoms"] is None
+    assert rows[1]["error"] == "It failed."
+    assert rows[2]["filtered"] == "too many rings"
+
+
+def test_bad_format(tmp_path):
+    """Unknown formats are an error."""
+    with pytest.raises(ValueError):
+        ResultsTable(tmp_path / "results", file_format="CSV")
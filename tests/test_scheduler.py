@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the scheduling of the structures in a batch."""
+
+import pytest
+
+from from_smiles_step import scheduler
+
+
+def test_counts():
+    """The heavy atoms, rings and stereocenters are counted from the SMILES."""
+    assert scheduler.smiles_counts("CCO") == (3, 0, 0)
+    assert scheduler.smiles_counts("c1ccccc1Cl") == (7, 1, 0)
+    assert scheduler.smiles_counts("C[C@H](N)C(=O)O") == (6, 0, 1)
+
+
+def test_cost_grows_with_size():
+    """Larger molecules, rings and stereocenters cost more."""
+    small = scheduler.estimate_cost("CCO")
+    assert scheduler.estimate_cost("CCCCCCCCCO") > small
+    assert scheduler.estimate_cost("C1CCCCC1") > scheduler.estimate_cost("CCCCCC")
+    assert scheduler.estimate_cost("C[C@H](N)O") > scheduler.estimate_cost("CC(N)O")
+
+
+def test_cost_of_other_notations():
+    """Notations that are not counted get the default cost."""
+    default = scheduler.estimate_cost("ethanol", "name")
+    assert default == scheduler.estimate_cost("water", "name")
+    assert default == pytest.approx(scheduler.default_heavy_atoms**2)
+
+
+@pytest.mark.parametrize("n_workers", [1, 2, 4, 8])
+def test_schedule_covers_the_batch(n_workers):
+    """Every structure is in exactly one chunk."""
+    costs = [float((7 * i) % 13 + 1) for i in range(200)]
+    chunks = scheduler.schedule(costs, n_workers, max_chunk=16)
+    indices = [i for chunk in chunks for i in chunk]
+    assert sorted(indices) == list(range(len(costs)))
+    assert all(0 < len(chunk) <= 16 for chunk in chunks)
+
+
+def test_schedule_most_expensive_first():
+    """The chunks start with the expensive structures and grow as they get cheaper."""
+    costs = [1.0] * 100 + [1000.0, 500.0]
+    chunks = scheduler.schedule(costs, 4)
+    assert chunks[0] == [100]
+    assert chunks[1] == [101]
+    assert len(chunks[-2]) <= len(chunks[2])
+    order = [costs[i] for chunk in chunks for i in chunk]
+    assert order == sorted(order, reverse=True)
+
+
+def test_schedule_empty():
+    """An empty batch has no chunks."""
+    assert scheduler.schedule([], 4) == []
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for writing structures to sharded files."""
+
+import gzip
+import json
+
+import pytest
+from rdkit import Chem
+
+from from_smiles_step import engine
+from from_smiles_step.shards import ShardedWriter, sdf_text
+
+
+@pytest.fixture(scope="module")
+def records():
+    """Records of a few small molecules, with identifiers."""
+    result = []
+    for i, text in enumerate(["C", "CC", "CCC", "CCO", "O", "N", "CO"]):
+        record = engine.convert(text)
+        record.identifier = f"mol{i}"
+        result.append(record)
+    return result
+
+
+def write(path, records, **kwargs):
+    writer = ShardedWriter(path, **kwargs)
+    for record in records:
+        writer.add(record)
+    writer.close()
+    with open(path / "manifest.json") as fd:
+        return json.load(fd)
+
+
+def test_manifest(tmp_path, records):
+    """The manifest lists every structure once, in round-robin shards."""
+    manifest = write(tmp_path, records, n_shards=3)
+    assert manifest["format"] == "SDF"
+    assert manifest["compression"] == "none"
+    assert manifest["shard by"] == "round robin"
+    assert manifest["n_structures"] == len(records)
+    assert [s["n_structures"] for s in manifest["shards"]] == [3, 2, 2]
+    assert manifest["shards"][0]["identifiers"] == ["mol0", "mol3", "mol6"]
+
+    for shard in manifest["shards"]:
+        text = (tmp_path / shard["file"]).read_text()
+        assert text.count("$$$$") == shard["n_structures"]
+        for identifier in shard["identifiers"]:
+            assert identifier in text
+
+
+def test_hash_is_stable(tmp_path, records):
+    """Sharding by hash puts each structure in the same shard every time."""
+    first = write(tmp_path / "first", records, shard_by="hash")
+    second = write(tmp_path / "second", records[::-1], shard_by="hash")
+    for a, b in zip(first["shards"], second["shards"]):
+        assert sorted(a["identifiers"]) == sorted(b["identifiers"])
+    identifiers = [i for s in first["shards"] for i in s["identifiers"]]
+    assert sorted(identifiers) == sorted(r.identifier for r in records)
+
+
+def test_gzip_xyz(tmp_path, records):
+    """Compressed XYZ shards hold every structure."""
+    manifest = write(
+        tmp_path, records, file_format="XYZ", n_shards=2, compression="gzip"
+    )
+    n_atoms = 0
+    for shard in manifest["shards"]:
+        assert shard["file"].endswith(".xyz.gz")
+        with gzip.open(tmp_path / shard["file"], "rt") as fd:
+            lines = fd.read().splitlines()
+        while len(lines) > 0:
+            n = int(lines[0])
+            n_atoms += n
+            lines = lines[n + 2 :]
+    assert n_atoms == sum(r.n_atoms for r in records)
+
+
+@pytest.mark.parametrize("flavor", ["rdkit", "openbabel"])
+def test_salt(flavor):
+    """The formal charges of the ions in a salt are written to SDF files."""
+    text = "CC(=O)[O-].[Na+]"
+    record = engine.convert(text, flavor=flavor)
+    record.identifier = "salt"
+    sdf = sdf_text(record)
+    assert "M  CHG  2" in sdf
+
+    mol = Chem.MolFromMolBlock(sdf.split("$$$$")[0])
+    assert Chem.MolToSmiles(mol) == Chem.CanonSmiles(text)
+    assert Chem.GetFormalCharge(mol) == 0
+
+
+def test_bad_format(tmp_path):
+    """Unknown formats are an error."""
+    with pytest.raises(ValueError):
+        ShardedWriter(tmp_path, file_format="PDB")
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the summary of a batch."""
+
+import molsystem
+import seamm
+
+from from_smiles_step import engine, writer
+from from_smiles_step.record import StructureRecord
+from from_smiles_step.summary import BatchSummary
+
+
+def test_counts():
+    """The structures are counted by notation and toolkit, with the failures."""
+    summary = BatchSummary()
+    for text in ["CCO", "CC", "c1ccccc1"]:
+        record = engine.convert(text)
+        record.time = 0.25
+        summary.add(record)
+    record = engine.convert("O", flavor="openbabel")
+    summary.add(record)
+    summary.add(StructureRecord("not a molecule", error="It failed."))
+    summary.add(StructureRecord("C1CC1", filtered="too many rings"))
+    summary.close()
+
+    assert summary.n_structures == 6
+    assert summary.n_failed == 1
+    assert summary.n_filtered == 1
+    assert summary.counts[("SMILES", "rdkit")] == 3
+    assert summary.counts[("SMILES", "openbabel")] == 1
+    assert summary.times[("SMILES", "rdkit")] == 0.75
+
+    text = summary.report(2.0, indent="    ")
+    lines = text.splitlines()
+    assert lines[0] == "    Converted 6 line notations at 3.0 per second."
+    assert lines[1] == "    1 failed and 1 were filtered out."
+    assert lines[5].split() == ["SMILES", "rdkit", "3", "0.75"]
+
+
+def test_pubchem_fallback(node, monkeypatch):
+    """Structures from PubChem are counted as such, not under the toolkit."""
+
+    def from_pubchem(configuration, text, namespace="name", properties=None):
+        configuration.from_smiles("CCO")
+
+    monkeypatch.setattr(
+        molsystem.pubchem.PubChemMixin, "PC_from_identifier", from_pubchem
+    )
+    P = node.parameters.current_values_to_dict(context=seamm.flowchart_variables._data)
+    P["notation"] = "name"
+    P["structure handling"] = "Create a new system and configuration"
+    record = StructureRecord("ethanol", error="It failed.")
+    record.identifier = "1"
+
+    summary = BatchSummary()
+    structures = writer.StructureWriter(node, P, verbose=False, reports=[summary])
+    structures.add(record)
+    structures.close()
+
+    assert structures.n_created == 1
+    assert summary.counts == {("name", "PUBCHEM"): 1}
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for returning structures from the workers in shared memory."""
+
+import os
+
+import numpy as np
+import pytest
+
+from from_smiles_step import engine, transport
+from from_smiles_step.record import StructureRecord
+
+
+def test_round_trip():
+    """The arrays come back the same, with failures passed through."""
+    texts = ["CCO", "c1ccccc1", "CC(=O)N"]
+    originals = [engine.convert(text, seed=1) for text in texts]
+    results = [(i, engine.convert(text, seed=1)) for i, text in enumerate(texts)]
+    failed = StructureRecord("not a molecule")
+    failed.error = "It failed."
+    results.append((3, failed))
+
+    descriptor, packed, extents = transport.pack(results)
+    assert descriptor["n_atoms"] == sum(r.n_atoms for r in originals)
+    assert extents[3] is None
+
+    arena = transport.Arena(descriptor)
+    for (index, record), extent in zip(packed, extents):
+        if extent is not None:
+            arena.attach(record, extent)
+    arena.close()
+
+    for (index, record), original in zip(packed, originals):
+        np.testing.assert_array_equal(record.atno, original.atno)
+        np.testing.assert_array_equal(record.coordinates, original.coordinates)
+        np.testing.assert_array_equal(record.bonds, original.bonds)
+    assert packed[3][1].error == "It failed."
+
+
+def test_conformers():
+    """Several conformers are returned with the rest of the structure."""
+    settings = engine.embedding_settings(n_conformers=3)
+    original = engine.convert("CCCCO", seed=1, embedding=settings)
+    record = engine.convert("CCCCO", seed=1, embedding=settings)
+    assert record.n_conformers == 3
+
+    descriptor, packed, extents = transport.pack([(0, record)])
+    arena = transport.Arena(descriptor)
+    arena.attach(packed[0][1], extents[0])
+    arena.close()
+    np.testing.assert_array_equal(packed[0][1].conformers, original.conformers)
+
+
+def leftover_blocks():
+    """The blocks of shared memory named by this process that still exist."""
+    prefix = f"fss_{os.getpid()}_"
+    return [name for name in os.listdir("/dev/shm") if name.startswith(prefix)]
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="Needs /dev/shm")
+def test_named_block():
+    """A named block is removed once it is mapped."""
+    name = transport.block_name()
+    descriptor, packed, extents = transport.pack([(0, engine.convert("CCO"))], name)
+    assert descriptor["name"] == name
+    assert leftover_blocks() == [name]
+    transport.track(name)
+    transport.Arena(descriptor).attach(packed[0][1], extents[0])
+    assert leftover_blocks() == []
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="Needs /dev/shm")
+def test_release():
+    """Blocks that are never mapped can be removed, whether or not they exist."""
+    name = transport.block_name()
+    transport.pack([(0, engine.convert("CCO"))], name)
+    transport.track(name)
+    transport.release(name)
+    transport.release(transport.block_name())
+    assert leftover_blocks() == []
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="Needs /dev/shm")
+def test_stopped_batch():
+    """Stopping a batch early leaves no blocks behind."""
+    texts = ["C" * (n % 13 + 1) + "O" for n in range(300)]
+    results = engine.run(texts, {"geometry": "none"}, n_workers=2, via="shared memory")
+    next(results)
+    results.close()
+    assert leftover_blocks() == []
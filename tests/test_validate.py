@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for checking embedded structures."""
+
+import numpy as np
+
+from from_smiles_step import engine, validate
+from from_smiles_step.packing import components
+
+
+def test_good_structure():
+    """A normal structure passes."""
+    record = engine.convert("CC(C)Cc1ccc(cc1)C(C)C(=O)O")
+    assert validate.check(record) is None
+
+
+def test_stretched_bond():
+    """A bond far from its usual length is found."""
+    record = engine.convert("CCO")
+    xyz = record.coordinates.copy()
+    i, j, _ = record.bonds[0]
+    xyz[j] = xyz[i] + 2.0 * (xyz[j] - xyz[i])
+    message = validate.check(record, xyz)
+    assert message.startswith(f"The bond between atoms {i + 1} and {j + 1} is")
+
+
+def test_overlapping_atoms():
+    """Atoms that are not bonded but on top of each other are found."""
+    record = engine.convert("C.C")
+    first, second = components(record)
+    xyz = record.coordinates.copy()
+    xyz[second] += xyz[first[0]] - xyz[second[0]] + np.array([0.3, 0.0, 0.0])
+    message = validate.check(record, xyz)
+    assert message is not None
+    assert message.startswith("Atoms ")
+    assert "are only" in message
+
+
+def test_close_pairs():
+    """The pairs found by the spatial hash agree with all pairs."""
+    rng = np.random.default_rng(1)
+    xyz = rng.random((300, 3)) * 10.0
+    i, j = validate.close_pairs(xyz, 1.2)
+    found = set(zip(i.tolist(), j.tolist()))
+
+    distances = np.linalg.norm(xyz[:, np.newaxis] - xyz[np.newaxis], axis=2)
+    a, b = np.nonzero(np.triu(distances < 1.2, k=1))
+    assert found == set(zip(a.tolist(), b.tolist()))
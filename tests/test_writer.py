@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for writing batches of structures to the system database."""
+
+import molsystem
+import pytest
+import seamm
+
+from from_smiles_step import writer
+from from_smiles_step.record import StructureRecord
+
+
+@pytest.fixture
+def db():
+    """An empty system database."""
+    db = molsystem.SystemDB(filename=":memory:")
+    yield db
+    db.close()
+
+
+def test_transaction(db):
+    """The structures written in a transaction are committed at the end."""
+    with writer.transaction(db.db):
+        db.create_system(name="ethanol").create_configuration()
+        assert db.db.deferring
+    assert not db.db.deferring
+    assert db.n_systems == 1
+
+
+def test_rollback(db):
+    """Nothing written in a transaction is kept if it fails."""
+    db.create_system(name="ethanol")
+    with pytest.raises(ValueError):
+        with writer.transaction(db.db):
+            db.create_system(name="benzene").create_configuration()
+            raise ValueError("It failed.")
+    assert not db.db.deferring
+    assert db.n_systems == 1
+    assert [system.name for system in db.systems] == ["ethanol"]
+
+
+def test_deferring(db):
+    """If the commits are already deferred, they are left to the caller."""
+    db.db.deferring = True
+    with pytest.raises(ValueError):
+        with writer.transaction(db.db):
+            db.create_system(name="benzene")
+            raise ValueError("It failed.")
+    assert db.db.deferring
+    assert db.n_systems == 1
+
+
+def test_failed_structure(node, monkeypatch):
+    """A structure that the fallbacks can't create either leaves nothing behind."""
+
+    def create_structure(configuration, text, notation, flavor):
+        raise RuntimeError("Not a molecule.")
+
+    monkeypatch.setattr(node, "create_structure", create_structure)
+    P = node.parameters.current_values_to_dict(context=seamm.flowchart_variables._data)
+    P["notation"] = "SMILES"
+    P["structure handling"] = "Create a new system and configuration"
+    record = StructureRecord("not a molecule", error="It failed.")
+    record.identifier = "1"
+
+    structures = writer.StructureWriter(node, P, verbose=False)
+    structures.add(record)
+    structures.close()
+
+    db = node.get_variable("_system_db")
+    assert db.n_systems == 0
+    assert structures.n_created == 0
+    assert structures.failed == [("1", "not a molecule", "Not a molecule.")]